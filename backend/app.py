@@ -4,6 +4,7 @@ import logging
 from routes.stock import stock_bp
 from routes.watchlist import watchlist_bp
 from routes.analysis import analysis_bp
+from routes.jobs import jobs_bp
 import os
 from dotenv import load_dotenv
 
@@ -33,6 +34,7 @@ def create_app():
     app.register_blueprint(stock_bp, url_prefix='/api/stock')
     app.register_blueprint(watchlist_bp, url_prefix='/api/watchlist')
     app.register_blueprint(analysis_bp, url_prefix='/api/analysis')
+    app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
 
     # Root endpoint
     @app.route("/", methods=["GET"])
@@ -1,7 +1,8 @@
 from flask import Blueprint, jsonify, request
 from services.stock_analyzer import StockAnalyzer
+from services.report_cache import report_cache
+from routes.stock import find_group_symbols
 import logging
-import yfinance as yf
 import traceback
 
 logger = logging.getLogger(__name__)
@@ -17,7 +18,11 @@ def analyze_stock(symbol):
     """Generate a daily analysis report for a stock"""
     try:
         logger.info(f"Generating analysis for {symbol}")
-        report = stock_analyzer.generate_daily_report(symbol)
+        # Serve the last report immediately and refresh it in the background once stale
+        report = report_cache.get(
+            ('daily_report', symbol.upper()),
+            lambda: stock_analyzer.generate_daily_report(symbol)
+        )
         return jsonify(report)
     except Exception as e:
         logger.error(f"Error analyzing stock {symbol}: {str(e)}")
@@ -38,21 +43,119 @@ def backtest_stock(symbol):
         logger.info(f"Performing backtest for {symbol} from {start_date} to {end_date}")
         
         # Get historical data
-        ticker = yf.Ticker(symbol)
-        hist = ticker.history(start=start_date, end=end_date)
+        hist = stock_analyzer.get_stock_data(symbol, start=start_date, end=end_date, copy=False)
         
-        if hist.empty:
+        if hist is None or hist.empty:
             return jsonify({"error": "No historical data available for the given period"}), 404
         
+        # Strategy spec from the remaining query parameters, e.g. ?strategy=sma_cross&fast=10&slow=30
+        spec = {
+            key: value for key, value in request.args.items()
+            if key not in ('start_date', 'end_date', 'strategy', 'cost_bps')
+        }
+        spec['type'] = request.args.get('strategy', 'sma_cross')
+        cost_bps = request.args.get('cost_bps', type=float)
+        
         # Perform backtest analysis
-        backtest_results = stock_analyzer.backtest(symbol, hist)
+        backtest_results = stock_analyzer.backtest(symbol, hist, spec, cost_bps)
         
         return jsonify(backtest_results)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error backtesting {symbol}: {str(e)}")
         logger.error(traceback.format_exc())
         return jsonify({"error": f"Failed to perform backtest: {str(e)}"}), 500
 
+@analysis_bp.route('/backtest/<symbol>/sweep', methods=['POST'])
+def sweep_backtest(symbol):
+    """Backtest a grid of strategy parameters on one download of the history"""
+    try:
+        data = request.json or {}
+        start_date = data.get('start_date')
+        end_date = data.get('end_date')
+        grid = data.get('grid', {})
+        
+        if not start_date or not end_date:
+            return jsonify({"error": "Missing start_date or end_date"}), 400
+        if not isinstance(grid, dict):
+            return jsonify({"error": "grid must be an object of parameter ranges"}), 400
+        
+        logger.info(f"Sweeping {data.get('strategy', 'sma_cross')} over {symbol} from {start_date} to {end_date}")
+        
+        hist = stock_analyzer.get_stock_data(symbol, start=start_date, end=end_date, copy=False)
+        
+        if hist is None or hist.empty:
+            return jsonify({"error": "No historical data available for the given period"}), 404
+        
+        results = stock_analyzer.backtest_sweep(
+            symbol, hist,
+            strategy=data.get('strategy', 'sma_cross'),
+            grid=grid,
+            cost_bps=data.get('cost_bps'),
+            metric=data.get('metric', 'sharpe_ratio'),
+            top=int(data.get('top', 50))
+        )
+        
+        return jsonify(results)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error sweeping backtest for {symbol}: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": f"Failed to sweep backtest: {str(e)}"}), 500
+
+@analysis_bp.route('/backtest/group/<path:group>', methods=['POST'])
+def backtest_group(group):
+    """Backtest one strategy over every stock in a watchlist group as a portfolio"""
+    try:
+        data = request.json or {}
+        start_date = data.get('start_date')
+        end_date = data.get('end_date')
+        weights = data.get('weights', 'equal')
+
+        if not start_date or not end_date:
+            return jsonify({"error": "Missing start_date or end_date"}), 400
+
+        symbols = find_group_symbols(group)
+        if symbols is None:
+            return jsonify({"error": f"Group {group} does not exist"}), 404
+
+        logger.info(f"Backtesting group {group} from {start_date} to {end_date}")
+
+        results = stock_analyzer.backtest_portfolio(
+            symbols, start_date, end_date,
+            spec=data.get('strategy'),
+            weights=weights,
+            cost_bps=data.get('cost_bps')
+        )
+        results["group"] = group
+
+        return jsonify(results)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error backtesting group {group}: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": f"Failed to backtest group: {str(e)}"}), 500
+
+@analysis_bp.route('/timeline/<symbol>', methods=['GET'])
+def get_signal_timeline(symbol):
+    """Get the report signals for every trading day in a range, with next-day outcomes"""
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        
+        logger.info(f"Building signal timeline for {symbol} from {start_date} to {end_date}")
+        
+        return jsonify(stock_analyzer.signal_timeline(symbol, start_date, end_date))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error building signal timeline for {symbol}: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": f"Failed to build signal timeline: {str(e)}"}), 500
+
 @analysis_bp.route('/indicators/<symbol>', methods=['GET'])
 def get_indicators(symbol):
     """Get technical indicators for a stock"""
@@ -67,6 +170,8 @@ def get_indicators(symbol):
         indicators = stock_analyzer.calculate_indicators(symbol, timeframe, period)
         
         return jsonify(indicators)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error calculating indicators for {symbol}: {str(e)}")
         return jsonify({"error": f"Failed to calculate indicators: {str(e)}"}), 500
@@ -96,6 +201,8 @@ def screen_stocks():
         screening_results = stock_analyzer.screen_stocks(universe, data['criteria'])
         
         return jsonify({"results": screening_results})
+    except (ValueError, KeyError) as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error in stock screening: {str(e)}")
         return jsonify({"error": f"Failed to screen stocks: {str(e)}"}), 500 
\ No newline at end of file
@@ -0,0 +1,114 @@
+from flask import Blueprint, jsonify, request
+from services.jobs import job_queue
+from services.stock_scanner import StockScanner
+from routes.analysis import stock_analyzer
+from routes.stock import find_group_symbols
+import logging
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# Create blueprint
+jobs_bp = Blueprint('jobs', __name__)
+
+def _history(context, symbol, start_date, end_date):
+    context.progress(0, 1, f"Loading {symbol}")
+    hist = stock_analyzer.get_stock_data(symbol, start=start_date, end=end_date, copy=False)
+    if hist is None or hist.empty:
+        raise ValueError("No historical data available for the given period")
+    context.progress(0.5, 1, "Running backtest")
+    return hist
+
+def run_backtest(context, symbol, start_date, end_date, strategy=None, cost_bps=None):
+    """Single-symbol backtest, same result as GET /api/analysis/backtest/<symbol>"""
+    hist = _history(context, symbol, start_date, end_date)
+    return stock_analyzer.backtest(symbol, hist, strategy, cost_bps)
+
+def run_backtest_sweep(context, symbol, start_date, end_date, strategy='sma_cross', grid=None,
+                       cost_bps=None, metric='sharpe_ratio', top=50):
+    """Parameter sweep, same result as POST /api/analysis/backtest/<symbol>/sweep"""
+    hist = _history(context, symbol, start_date, end_date)
+    return stock_analyzer.backtest_sweep(symbol, hist, strategy, grid, cost_bps, metric, int(top))
+
+def run_backtest_portfolio(context, start_date, end_date, group=None, symbols=None, strategy=None,
+                           weights='equal', cost_bps=None):
+    """Portfolio backtest over a watchlist group or an explicit list of symbols"""
+    if group is not None:
+        symbols = find_group_symbols(group)
+        if symbols is None:
+            raise ValueError(f"Group {group} does not exist")
+    context.progress(0, 1, "Loading price data")
+    results = stock_analyzer.backtest_portfolio(
+        symbols or [], start_date, end_date, strategy, weights, cost_bps,
+        progress=lambda done, total: context.progress(done, total, f"Backtested {done}/{total} symbols")
+    )
+    if group is not None:
+        results["group"] = group
+    return results
+
+def run_scan_market(context):
+    """Market scan, reporting progress per symbol"""
+    context.progress(0, 1, "Loading price data")
+    return {
+        "results": StockScanner().scan_market(
+            progress=lambda done, total: context.progress(done, total, f"Scanned {done}/{total} symbols")
+        )
+    }
+
+job_queue.register('backtest', run_backtest)
+job_queue.register('backtest_sweep', run_backtest_sweep)
+job_queue.register('backtest_portfolio', run_backtest_portfolio)
+job_queue.register('scan_market', run_scan_market)
+
+@jobs_bp.route('', methods=['POST'])
+def submit_job():
+    """Queue a background job, e.g. {"type": "backtest", "params": {...}, "priority": "high"}"""
+    try:
+        data = request.json or {}
+        if not data.get('type'):
+            return jsonify({"error": f"Missing type, one of: {', '.join(job_queue.types)}"}), 400
+
+        job = job_queue.submit(data['type'], data.get('params'), data.get('priority', 'normal'))
+        return jsonify(job), 202
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error submitting job: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": f"Failed to submit job: {str(e)}"}), 500
+
+@jobs_bp.route('', methods=['GET'])
+def list_jobs():
+    """List recent jobs, optionally filtered by ?status="""
+    try:
+        jobs = job_queue.list(request.args.get('status'), request.args.get('limit', 100, type=int))
+        return jsonify({"jobs": jobs})
+    except Exception as e:
+        logger.error(f"Error listing jobs: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status and progress of a job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    return jsonify(job)
+
+@jobs_bp.route('/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """Result of a finished job; 409 while it is still queued or running"""
+    job = job_queue.result(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    if job['status'] in ('queued', 'running'):
+        return jsonify(job), 409
+    return jsonify(job)
+
+@jobs_bp.route('/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    return jsonify(job)
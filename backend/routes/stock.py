@@ -12,11 +12,19 @@ from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from database import SessionLocal
 from models.user import User
+from services.symbol_index import search_symbols
+from services.info_cache import info_cache
+from services.quotes import quote_service, normalize_symbols
 
 logger = logging.getLogger(__name__)
 
 stock_bp = Blueprint('stock', __name__)
 
+# 批量校验单次请求的股票数量上限
+MAX_VALIDATE_SYMBOLS = 1000
+# 批量行情单次请求的股票数量上限
+MAX_QUOTE_SYMBOLS = 500
+
 # 加载本地股票数据
 def load_stock_data():
     try:
@@ -152,26 +160,8 @@ def search_stock(query):
     try:
         logger.info(f"Searching for stock: {query}")
         
-        # Use Yahoo Finance API for real-time search results
-        search_url = f"https://query2.finance.yahoo.com/v1/finance/search?q={query}"
-        
-        import requests
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        response = requests.get(search_url, headers=headers)
-        data = response.json()
-        
-        # Format results
-        results = []
-        for item in data.get('quotes', [])[:10]:
-            if item.get('quoteType') in ['EQUITY', 'ETF', 'CRYPTOCURRENCY']:
-                results.append({
-                    'symbol': item.get('symbol'),
-                    'name': item.get('longname') or item.get('shortname'),
-                    'exchange': item.get('exchange')
-                })
+        # Local index first, remote search only when nothing matches
+        results = search_symbols(query, 10)
                 
         return jsonify(results)
     except Exception as e:
@@ -184,22 +174,88 @@ def validate_stock(symbol):
     try:
         logger.info(f"Validating stock symbol: {symbol}")
         
-        ticker = yf.Ticker(symbol)
-        hist = ticker.history(period='1d')
+        result = quote_service.validate([symbol], quote_missing=True)['results'][0]
         
-        if hist.empty:
+        if not result['valid']:
             return jsonify({"valid": False, "error": "Unable to get stock data"})
             
-        info = ticker.info
         return jsonify({
             "valid": True,
-            "name": info.get('longName', '') or info.get('shortName', ''),
-            "price": hist['Close'][-1] if not hist.empty else 0
+            "name": result['name'],
+            "price": result['price']
         })
     except Exception as e:
         logger.error(f"Error validating stock: {str(e)}")
         return jsonify({"valid": False, "error": str(e)})
 
+@stock_bp.route('/validate', methods=['POST'])
+def validate_stocks():
+    """Validate a batch of stock symbols, e.g. an imported position list"""
+    try:
+        data = request.get_json(silent=True) or {}
+        symbols = normalize_symbols(data.get('symbols'))
+        
+        if not symbols:
+            return jsonify({"error": "Symbols are required"}), 400
+        if len(symbols) > MAX_VALIDATE_SYMBOLS:
+            return jsonify({"error": f"At most {MAX_VALIDATE_SYMBOLS} symbols per request"}), 400
+            
+        logger.info(f"Validating {len(symbols)} stock symbols")
+        return jsonify(quote_service.validate(symbols))
+    except Exception as e:
+        logger.error(f"Error validating stocks: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@stock_bp.route('/quotes', methods=['GET'])
+def get_quotes():
+    """Columnar quotes for a comma separated list of symbols"""
+    try:
+        symbols = normalize_symbols(request.args.get('symbols', ''))
+        
+        if not symbols:
+            return jsonify({"error": "Symbols are required"}), 400
+        if len(symbols) > MAX_QUOTE_SYMBOLS:
+            return jsonify({"error": f"At most {MAX_QUOTE_SYMBOLS} symbols per request"}), 400
+            
+        logger.info(f"Getting quotes for {len(symbols)} symbols")
+        return jsonify(quote_service.bulk_quotes(symbols))
+    except Exception as e:
+        logger.error(f"Error getting quotes: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@stock_bp.route('/quotes/group/<path:group>', methods=['GET'])
+def get_group_quotes(group):
+    """Columnar quotes for every stock in a watchlist group and its sub groups"""
+    try:
+        symbols = find_group_symbols(group)
+        if symbols is None:
+            return jsonify({"error": f"Group {group} does not exist"}), 404
+            
+        logger.info(f"Getting quotes for group: {group}")
+        result = quote_service.bulk_quotes(symbols)
+        result["group"] = group
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error getting quotes for group {group}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def find_group_symbols(group):
+    """Symbols of a nested watchlist group path and its sub groups, or None if the group does not exist"""
+    # Navigate nested group paths
+    current_group = {"subGroups": load_watchlist()}
+    for part in group.split('/'):
+        if part not in current_group.get("subGroups", {}):
+            return None
+        current_group = current_group["subGroups"][part]
+    return group_symbols(current_group)
+
+def group_symbols(group):
+    """Symbols of a watchlist group followed by those of its sub groups"""
+    symbols = list(group.get("stocks", []))
+    for sub_group in group.get("subGroups", {}).values():
+        symbols.extend(group_symbols(sub_group))
+    return symbols
+
 @stock_bp.route('/note/<symbol>', methods=['GET'])
 def get_stock_note(symbol):
     """Get the note for a specific stock"""
@@ -251,14 +307,20 @@ def update_stock_note():
         logger.error(f"Error updating note: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# Ticker.info fields returned by the info endpoint
+INFO_FIELDS = [
+    'longName', 'shortName', 'sector', 'industry', 'country', 'website',
+    'longBusinessSummary', 'logo_url', 'marketCap', 'trailingPE', 'dividendYield',
+    'currentPrice', 'regularMarketChangePercent', 'regularMarketVolume'
+]
+
 @stock_bp.route('/info/<symbol>', methods=['GET'])
 def get_stock_info(symbol):
     """Get basic information about a stock"""
     try:
         logger.info(f"Getting info for stock: {symbol}")
         
-        ticker = yf.Ticker(symbol)
-        info = ticker.info
+        info = info_cache.get(symbol, INFO_FIELDS)
         
         # Extract key information
         return jsonify({
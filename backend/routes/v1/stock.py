@@ -5,33 +5,89 @@ from datetime import datetime, timedelta
 
 from ...database import get_db
 from ...services.auth import auth_service
-from ...services.stock_analyzer import stock_analyzer_service
-from ...schemas.watchlist import StockNote
-from ...repositories.watchlist import stock_repository
+from ...services.symbol_index import search_symbols
+from ...services.quotes import quote_service, normalize_symbols
+from ...schemas.watchlist import StockNote, StockValidateBatch
+from ...repositories.watchlist import stock_repository, stock_group_repository
 
 router = APIRouter()
 
+# Upper bound on symbols per bulk quote request
+MAX_QUOTE_SYMBOLS = 500
+
 @router.get("/validate/{symbol}")
 def validate_stock(symbol: str, db: Session = Depends(get_db)) -> Any:
     """
     Validate a stock symbol
     """
     try:
-        # Use the analyzer service to get stock data
-        report = stock_analyzer_service.generate_daily_report(symbol)
+        result = quote_service.validate([symbol], quote_missing=True)["results"][0]
+        if not result["valid"]:
+            return {"valid": False, "error": "Stock not found"}
         return {
             "valid": True,
-            "name": report["name"],
-            "price": report["current_price"]
+            "name": result["name"],
+            "price": result["price"]
         }
-    except HTTPException as e:
-        if e.status_code == 404:  # Not found
-            return {"valid": False, "error": "Stock not found"}
-        else:
-            return {"valid": False, "error": str(e.detail)}
     except Exception as e:
         return {"valid": False, "error": str(e)}
 
+@router.post("/validate")
+def validate_stocks(batch: StockValidateBatch, db: Session = Depends(get_db)) -> Any:
+    """
+    Validate a batch of stock symbols, e.g. an imported position list
+    """
+    symbols = normalize_symbols(batch.symbols)
+    if not symbols:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Symbols are required"
+        )
+    return quote_service.validate(symbols)
+
+@router.get("/quotes")
+def get_quotes(
+    symbols: str = Query(..., description="Comma separated stock symbols"),
+    db: Session = Depends(get_db)
+) -> Any:
+    """
+    Columnar quotes for many symbols in one request
+    """
+    symbol_list = normalize_symbols(symbols)
+    if not symbol_list:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Symbols are required"
+        )
+    if len(symbol_list) > MAX_QUOTE_SYMBOLS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_QUOTE_SYMBOLS} symbols per request"
+        )
+    return quote_service.bulk_quotes(symbol_list)
+
+@router.get("/quotes/group/{group:path}")
+def get_group_quotes(group: str, db: Session = Depends(get_db)) -> Any:
+    """
+    Columnar quotes for every stock in a watchlist group and its sub groups
+    """
+    stock_group = stock_group_repository.get_by_path(db, group)
+    if not stock_group:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Group {group} does not exist"
+        )
+    result = quote_service.bulk_quotes(group_symbols(stock_group))
+    result["group"] = group
+    return result
+
+def group_symbols(stock_group) -> List[str]:
+    """Symbols of a watchlist group followed by those of its sub groups"""
+    symbols = [stock.symbol for stock in stock_group.stocks]
+    for subgroup in stock_group.subgroups:
+        symbols.extend(group_symbols(subgroup))
+    return symbols
+
 @router.get("/search/{query}")
 def search_stocks(
     query: str,
@@ -42,19 +98,11 @@ def search_stocks(
     Search for stock symbols
     """
     try:
-        # TODO: Implement a more robust stock search service
-        # For now, just return some sample data
         if len(query) < 1:
             return []
             
-        # Sample response for testing
-        return [
-            {"symbol": "AAPL", "name": "Apple Inc.", "exchange": "NASDAQ"},
-            {"symbol": "MSFT", "name": "Microsoft Corporation", "exchange": "NASDAQ"},
-            {"symbol": "AMZN", "name": "Amazon.com, Inc.", "exchange": "NASDAQ"},
-            {"symbol": "GOOG", "name": "Alphabet Inc.", "exchange": "NASDAQ"},
-            {"symbol": "META", "name": "Meta Platforms, Inc.", "exchange": "NASDAQ"},
-        ]
+        # Local symbol index first, remote search only as a fallback
+        return search_symbols(query, limit)
     except Exception as e:
         # Return empty list instead of throwing an error
         return []
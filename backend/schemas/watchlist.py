@@ -32,6 +32,10 @@ class StockNote(BaseModel):
     symbol: str
     note: str
 
+class StockValidateBatch(BaseModel):
+    """Schema for batch symbol validation"""
+    symbols: List[str] = Field(..., description="Stock symbols to validate", max_length=1000)
+
 class StockGroupBase(BaseModel):
     """Base Stock Group Schema"""
     name: str = Field(..., description="Group name")
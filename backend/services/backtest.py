@@ -0,0 +1,473 @@
+"""Vectorized single-symbol backtests.
+
+A strategy is described by a spec such as
+``{"type": "sma_cross", "fast": 20, "slow": 50}``. Its function turns the
+price columns into a target position for every bar (1 long, 0 flat, -1
+short), decided at that bar's close; the position is then held over the
+following bar. Everything after that - returns, transaction costs,
+equity, drawdown and the trade list - is whole-array NumPy arithmetic, so
+a 20-year daily backtest takes milliseconds.
+"""
+import logging
+import math
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from . import indicators
+
+logger = logging.getLogger(__name__)
+
+# 年化使用的交易日数
+BARS_PER_YEAR = 252
+
+
+class Strategy:
+    """A named position rule with default parameters.
+
+    ``batch_function``, registered with ``@<strategy>.batch``, takes one
+    array per parameter and returns the targets of all combinations as a
+    (combinations, time) array, sharing indicators between combinations.
+    """
+
+    def __init__(self, name: str, defaults: Dict[str, Any], columns, function: Callable[..., np.ndarray]):
+        self.name = name
+        self.defaults = defaults
+        self.columns = tuple(columns)
+        self.function = function
+        self.batch_function: Optional[Callable[..., np.ndarray]] = None
+
+    def _arrays(self, data) -> Dict[str, np.ndarray]:
+        return {column.lower(): np.asarray(data[column], dtype=np.float64) for column in self.columns}
+
+    def __call__(self, data, **params) -> np.ndarray:
+        return self.function(**self._arrays(data), **params)
+
+    def batch(self, function: Callable[..., np.ndarray]) -> Callable[..., np.ndarray]:
+        self.batch_function = function
+        return function
+
+    def targets(self, data, params: Dict[str, np.ndarray], count: int) -> np.ndarray:
+        """Targets of ``count`` parameter combinations, one row each"""
+        arrays = self._arrays(data)
+        if self.batch_function is not None:
+            targets = self.batch_function(**arrays, **params)
+            return np.broadcast_to(targets, (count, targets.shape[-1]))
+        return np.vstack([
+            self.function(**arrays, **{key: values[i].item() for key, values in params.items()})
+            for i in range(count)
+        ])
+
+
+STRATEGIES: Dict[str, Strategy] = {}
+
+
+def strategy(name: str, columns=('Close',), **defaults):
+    """Register a function of lower-cased column arrays and parameters as a strategy"""
+    def register(function):
+        STRATEGIES[name] = Strategy(name, defaults, columns, function)
+        return STRATEGIES[name]
+    return register
+
+
+def parse_spec(spec: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Validate a strategy spec and fill in default parameters.
+
+    Parameter values are coerced to the type of their default, so specs
+    built from query strings work. Raises ValueError for unknown
+    strategies or parameters.
+    """
+    spec = dict(spec or {'type': 'sma_cross'})
+    name = spec.pop('type', 'sma_cross')
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown strategy: {name}")
+
+    defaults = STRATEGIES[name].defaults
+    unknown = set(spec) - set(defaults)
+    if unknown:
+        raise ValueError(f"Unknown parameters for {name}: {', '.join(sorted(unknown))}")
+
+    params = {}
+    for key, default in defaults.items():
+        value = spec.get(key, default)
+        try:
+            params[key] = type(default)(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid value for {key}: {value}")
+    return {'type': name, **params}
+
+
+def _hold(enter: np.ndarray, exit: np.ndarray) -> np.ndarray:
+    """Long from an entry bar until the next exit bar (entries win ties), along the last axis"""
+    events = np.where(enter, 1.0, np.where(exit, 0.0, np.nan))
+    # 向前填充最近一次事件
+    positions = np.broadcast_to(np.arange(events.shape[-1]), events.shape)
+    last = np.maximum.accumulate(np.where(np.isnan(events), -1, positions), axis=-1)
+    filled = np.take_along_axis(events, np.maximum(last, 0), axis=-1)
+    return np.where(last >= 0, filled, 0.0)
+
+
+def _table(values: np.ndarray, compute: Callable[[Any], np.ndarray]):
+    """Compute once per distinct parameter value; returns (rows, position of each value's row)"""
+    unique, inverse = np.unique(values, return_inverse=True)
+    return np.vstack([compute(value.item()) for value in unique]), inverse
+
+
+@strategy('buy_hold')
+def buy_hold(close):
+    return np.ones_like(close)
+
+
+@strategy('sma_cross', fast=20, slow=50)
+def sma_cross(close, fast, slow):
+    """Long while the fast SMA is above the slow SMA"""
+    with np.errstate(invalid='ignore'):
+        return (indicators.sma(close, fast) > indicators.sma(close, slow)).astype(np.float64)
+
+
+@sma_cross.batch
+def _sma_cross_grid(close, fast, slow):
+    table, inverse = _table(np.r_[fast, slow], lambda window: indicators.sma(close, window))
+    with np.errstate(invalid='ignore'):
+        return (table[inverse[:len(fast)]] > table[inverse[len(fast):]]).astype(np.float64)
+
+
+@strategy('ema_cross', fast=12, slow=26)
+def ema_cross(close, fast, slow):
+    """Long while the fast EMA is above the slow EMA"""
+    return (indicators.ema(close, fast) > indicators.ema(close, slow)).astype(np.float64)
+
+
+@ema_cross.batch
+def _ema_cross_grid(close, fast, slow):
+    table, inverse = _table(np.r_[fast, slow], lambda span: indicators.ema(close, span))
+    return (table[inverse[:len(fast)]] > table[inverse[len(fast):]]).astype(np.float64)
+
+
+@strategy('macd', fast=12, slow=26, signal=9)
+def macd_cross(close, fast, slow, signal):
+    """Long while the MACD line is above its signal line"""
+    line, signal_line, _ = indicators.macd(close, fast, slow, signal)
+    return (line > signal_line).astype(np.float64)
+
+
+@macd_cross.batch
+def _macd_grid(close, fast, slow, signal):
+    table, inverse = _table(np.r_[fast, slow], lambda span: indicators.ema(close, span))
+    lines = table[inverse[:len(fast)]] - table[inverse[len(fast):]]
+    # 信号线对同一周期的所有组合一次递推
+    signal_lines = np.empty_like(lines)
+    for span in np.unique(signal):
+        rows = signal == span
+        signal_lines[rows] = indicators.ema(lines[rows], int(span))
+    return (lines > signal_lines).astype(np.float64)
+
+
+@strategy('rsi', period=14, lower=30.0, upper=70.0)
+def rsi_reversion(close, period, lower, upper):
+    """Buy when RSI drops below ``lower``, sell when it rises above ``upper``"""
+    rsi = indicators.rsi(close, period)
+    with np.errstate(invalid='ignore'):
+        return _hold(rsi < lower, rsi > upper)
+
+
+@rsi_reversion.batch
+def _rsi_grid(close, period, lower, upper):
+    table, inverse = _table(period, lambda value: indicators.rsi(close, value))
+    rsi = table[inverse]
+    with np.errstate(invalid='ignore'):
+        return _hold(rsi < lower[:, np.newaxis], rsi > upper[:, np.newaxis])
+
+
+@strategy('breakout', columns=('High', 'Low', 'Close'), window=20, exit=10)
+def channel_breakout(high, low, close, window, exit):
+    """Buy a close above the prior ``window``-bar high, sell one below the prior ``exit``-bar low"""
+    prior_low = np.r_[np.nan, indicators.rolling_min(low, exit)[:-1]]
+    with np.errstate(invalid='ignore'):
+        return _hold(indicators.breakout(close, high, window), close < prior_low)
+
+
+@channel_breakout.batch
+def _breakout_grid(high, low, close, window, exit):
+    breakouts, window_rows = _table(window, lambda value: indicators.breakout(close, high, value))
+    lows, exit_rows = _table(exit, lambda value: np.r_[np.nan, indicators.rolling_min(low, value)[:-1]])
+    with np.errstate(invalid='ignore'):
+        return _hold(breakouts[window_rows].astype(bool), close < lows[exit_rows])
+
+
+def _trades(targets: np.ndarray, equity: np.ndarray,
+            close: np.ndarray, timestamps: np.ndarray) -> List[Dict[str, Any]]:
+    """Runs of a constant non-zero target, entered and exited at the deciding bars' closes"""
+    changes = np.flatnonzero(np.diff(np.r_[0.0, targets]))
+    if len(changes) == 0:
+        return []
+    starts = changes
+    ends = np.r_[changes[1:], len(targets)]
+    held = targets[starts] != 0
+    starts, ends = starts[held], ends[held]
+
+    # 权益以首根K线之前的1为基准
+    base = np.r_[1.0, equity]
+    dates = timestamps.astype('datetime64[s]').astype('datetime64[D]').astype(str)
+    trades = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        closed = end < len(targets)
+        exit_index = end if closed else len(targets) - 1
+        trades.append({
+            'direction': 'long' if targets[start] > 0 else 'short',
+            'entry_date': dates[start],
+            'entry_price': float(close[start]),
+            'exit_date': dates[exit_index] if closed else None,
+            'exit_price': float(close[exit_index]),
+            'bars': exit_index - start,
+            'return': float(base[exit_index + 1] / base[start] - 1) * 100,
+            'open': not closed
+        })
+    return trades
+
+
+def _metrics(returns: np.ndarray, equity: np.ndarray, drawdown: np.ndarray,
+             positions: np.ndarray, trades: List[Dict[str, Any]]) -> Dict[str, Optional[float]]:
+    bars = len(returns)
+    total = float(equity[-1] - 1)
+    years = bars / BARS_PER_YEAR
+    std = float(returns.std(ddof=1)) if bars > 1 else 0.0
+    closed = [trade for trade in trades if not trade['open']]
+    return {
+        'total_return': total * 100,
+        'annualized_return': ((1 + total) ** (1 / years) - 1) * 100 if years > 0 and total > -1 else None,
+        'volatility': std * math.sqrt(BARS_PER_YEAR) * 100,
+        'sharpe_ratio': float(returns.mean()) / std * math.sqrt(BARS_PER_YEAR) if std > 0 else None,
+        'max_drawdown': float(drawdown.min()) * 100,
+        'exposure': float(np.mean(positions != 0)) * 100,
+        'trades': len(trades),
+        'win_rate': (
+            sum(trade['return'] > 0 for trade in closed) / len(closed) * 100 if closed else None
+        )
+    }
+
+
+def _cost(cost_bps: Optional[float]) -> float:
+    return (cost_bps if cost_bps is not None else float(os.getenv('BACKTEST_COST_BPS', '5'))) / 10000
+
+
+def _market_returns(close: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.nan_to_num(np.r_[0.0, close[1:] / close[:-1] - 1])
+
+
+def _simulate(targets: np.ndarray, market: np.ndarray, cost: float):
+    """(positions, returns, equity, drawdown) for rows of targets over the same market returns"""
+    # 收盘时决定的仓位从下一根K线开始持有
+    positions = np.zeros_like(targets)
+    positions[:, 1:] = targets[:, :-1]
+    turnover = np.abs(np.diff(targets, axis=1, prepend=0.0))
+
+    returns = positions * market - turnover * cost
+    equity = np.cumprod(1 + returns, axis=1)
+    drawdown = equity / np.maximum.accumulate(equity, axis=1) - 1
+    return positions, returns, equity, drawdown
+
+
+def run(data, timestamps, spec: Optional[Dict[str, Any]] = None,
+        cost_bps: Optional[float] = None) -> Dict[str, Any]:
+    """Backtest ``spec`` on OHLCV columns.
+
+    ``cost_bps`` is charged on every unit of position change, at the bar
+    where the trade happens (default ``BACKTEST_COST_BPS``). Returns the
+    normalized spec, per-bar arrays (``targets``, ``positions``,
+    ``returns``, ``equity``, ``drawdown``, ``benchmark``), ``metrics``,
+    ``benchmark_metrics`` and ``trades``.
+    """
+    spec = parse_spec(spec)
+    params = {key: value for key, value in spec.items() if key != 'type'}
+    cost = _cost(cost_bps)
+
+    close = np.asarray(data['Close'], dtype=np.float64)
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if len(close) < 2:
+        raise ValueError("At least two bars are needed for a backtest")
+
+    targets = np.nan_to_num(STRATEGIES[spec['type']](data, **params))
+    market = _market_returns(close)
+    positions, returns, equity, drawdown = (
+        values[0] for values in _simulate(targets[np.newaxis, :], market, cost)
+    )
+    benchmark = np.cumprod(1 + market)
+    benchmark_drawdown = benchmark / np.maximum.accumulate(benchmark) - 1
+
+    trades = _trades(targets, equity, close, timestamps)
+    return {
+        'spec': spec,
+        'cost_bps': cost * 10000,
+        'timestamps': timestamps,
+        'targets': targets,
+        'positions': positions,
+        'returns': returns,
+        'equity': equity,
+        'drawdown': drawdown,
+        'benchmark': benchmark,
+        'metrics': _metrics(returns, equity, drawdown, positions, trades),
+        'benchmark_metrics': _metrics(market, benchmark, benchmark_drawdown, np.ones_like(market), []),
+        'trades': trades
+    }
+
+
+# 参数扫描可排序的指标（均为越大越好）
+SWEEP_METRICS = ('sharpe_ratio', 'total_return', 'annualized_return', 'max_drawdown', 'win_rate')
+
+
+def _grid_metrics(targets: np.ndarray, positions: np.ndarray, returns: np.ndarray,
+                  equity: np.ndarray, drawdown: np.ndarray) -> Dict[str, np.ndarray]:
+    """The metrics of ``_metrics`` for every row at once, NaN where undefined"""
+    count, bars = targets.shape
+    total = equity[:, -1] - 1
+    years = bars / BARS_PER_YEAR
+    std = returns.std(axis=1, ddof=1) if bars > 1 else np.zeros(count)
+
+    # 交易：目标仓位变化处开始，下一次变化处结束；nonzero按行优先排列
+    rows, starts = np.nonzero(np.diff(targets, axis=1, prepend=0.0))
+    held = targets[rows, starts] != 0
+    closed = np.r_[rows[1:] == rows[:-1], False]
+    ends = np.r_[starts[1:], 0]
+    base = np.hstack([np.ones((count, 1)), equity])
+    selected = held & closed
+    trade_returns = base[rows[selected], ends[selected] + 1] / base[rows[selected], starts[selected]] - 1
+    closed_trades = np.bincount(rows[selected], minlength=count)
+    wins = np.bincount(rows[selected][trade_returns > 0], minlength=count)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'total_return': total * 100,
+            'annualized_return': np.where(total > -1, (np.maximum(1 + total, 0) ** (1 / years) - 1) * 100, np.nan),
+            'volatility': std * math.sqrt(BARS_PER_YEAR) * 100,
+            'sharpe_ratio': np.where(std > 0, returns.mean(axis=1) / std * math.sqrt(BARS_PER_YEAR), np.nan),
+            'max_drawdown': drawdown.min(axis=1) * 100,
+            'exposure': np.mean(positions != 0, axis=1) * 100,
+            'trades': np.bincount(rows[held], minlength=count).astype(np.float64),
+            'win_rate': np.where(closed_trades > 0, wins / closed_trades * 100, np.nan)
+        }
+
+
+def expand_range(values, kind: type, limit: Optional[int] = None) -> List[Any]:
+    """Parameter values from a list, a single value or ``{"start", "stop", "step"}`` (stop inclusive).
+
+    A range longer than ``limit`` values raises ValueError before anything is built.
+    """
+    if isinstance(values, dict):
+        try:
+            start, stop = kind(values['start']), kind(values['stop'])
+            step = kind(values.get('step', 1))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Invalid range: {values}")
+        if step <= 0 or not all(math.isfinite(value) for value in (start, stop, step)):
+            raise ValueError(f"Invalid range: {values}")
+        # 先算长度再生成，避免超大范围一次性分配内存
+        if kind is float:
+            length = max(math.floor((stop - start) / step + 0.5) + 1, 0)
+        else:
+            length = max((stop - start) // step + 1, 0)
+        if limit is not None and length > limit:
+            raise ValueError(f"Range {values} has {length} values, allowed at most {limit}")
+        values = (start + np.arange(length) * step).tolist()
+    elif not isinstance(values, (list, tuple)):
+        values = [values]
+    try:
+        return sorted({kind(value) for value in values})
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid parameter values: {values}")
+
+
+def sweep(data, timestamps, name: str, grid: Dict[str, Any], cost_bps: Optional[float] = None,
+          metric: str = 'sharpe_ratio', top: int = 50) -> Dict[str, Any]:
+    """Backtest every combination of the parameter ``grid`` of strategy ``name``.
+
+    All combinations share one set of market returns and, through the
+    strategy's batch function, one indicator per distinct parameter value;
+    they are simulated as a (combinations, time) array in chunks bounded by
+    ``BACKTEST_SWEEP_CELLS``. Returns the ``top`` combinations ranked by
+    ``metric`` and a heatmap of ``metric`` over the first two swept
+    parameters (best value over any others).
+    """
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown strategy: {name}")
+    if metric not in SWEEP_METRICS:
+        raise ValueError(f"Unknown metric: {metric}")
+    if top < 1:
+        raise ValueError(f"top must be at least 1, got {top}")
+    strategy_ = STRATEGIES[name]
+    unknown = set(grid) - set(strategy_.defaults)
+    if unknown:
+        raise ValueError(f"Unknown parameters for {name}: {', '.join(sorted(unknown))}")
+
+    max_count = int(os.getenv('BACKTEST_SWEEP_MAX', '10000'))
+    axes = {}
+    count = 1
+    for key, default in strategy_.defaults.items():
+        # 每个参数展开前都按剩余额度限制长度，组合数超限时立即报错
+        axes[key] = expand_range(grid.get(key, default), type(default), max_count // max(count, 1))
+        count *= len(axes[key])
+        if count == 0 or count > max_count:
+            raise ValueError(f"Grid has {count} combinations, allowed 1 to {max_count}")
+
+    close = np.asarray(data['Close'], dtype=np.float64)
+    if len(close) < 2:
+        raise ValueError("At least two bars are needed for a backtest")
+    market = _market_returns(close)
+    cost = _cost(cost_bps)
+
+    # 每个参数的取值下标，按笛卡尔积展开
+    indices = np.indices([len(values) for values in axes.values()], dtype=np.int64).reshape(len(axes), count)
+    params = {
+        key: np.asarray(values)[indices[i]]
+        for i, (key, values) in enumerate(axes.items())
+    }
+
+    chunk = max(1, int(os.getenv('BACKTEST_SWEEP_CELLS', '2000000')) // len(close))
+    results: Dict[str, List[np.ndarray]] = {}
+    for start in range(0, count, chunk):
+        part = {key: values[start:start + chunk] for key, values in params.items()}
+        size = min(chunk, count - start)
+        targets = np.nan_to_num(strategy_.targets(data, part, size))
+        for key, values in _grid_metrics(targets, *_simulate(targets, market, cost)).items():
+            results.setdefault(key, []).append(values)
+    metrics = {key: np.concatenate(values) for key, values in results.items()}
+
+    # NaN排在最后
+    ranking = np.argsort(np.where(np.isnan(metrics[metric]), np.inf, -metrics[metric]), kind='stable')
+    table = []
+    for i in ranking[:top].tolist():
+        row = {key: values[i].item() for key, values in params.items()}
+        row.update({
+            key: None if np.isnan(values[i]) else round(float(values[i]), 4)
+            for key, values in metrics.items()
+        })
+        row['trades'] = int(row['trades'])
+        table.append(row)
+
+    swept = [key for key, values in axes.items() if len(values) > 1] or list(axes)[:1]
+    x_key = swept[0] if swept else None
+    y_key = swept[1] if len(swept) > 1 else None
+    heatmap = None
+    if x_key is not None:
+        x_index = indices[list(axes).index(x_key)]
+        y_index = indices[list(axes).index(y_key)] if y_key else np.zeros(count, dtype=np.int64)
+        matrix = np.full((len(axes[y_key]) if y_key else 1, len(axes[x_key])), -np.inf)
+        values = np.where(np.isnan(metrics[metric]), -np.inf, metrics[metric])
+        np.maximum.at(matrix, (y_index, x_index), values)
+        heatmap = {
+            'x': {'param': x_key, 'values': axes[x_key]},
+            'y': {'param': y_key, 'values': axes[y_key]} if y_key else None,
+            'values': [[None if np.isinf(value) else round(value, 4) for value in row] for row in matrix.tolist()]
+        }
+
+    return {
+        'strategy': name,
+        'grid': axes,
+        'metric': metric,
+        'cost_bps': cost * 10000,
+        'combinations': count,
+        'results': table,
+        'heatmap': heatmap
+    }
@@ -0,0 +1,216 @@
+"""Content-addressed store for backtest results.
+
+A result is keyed by the SHA-256 of its request (kind, normalized strategy
+spec, parameters) together with a digest of the exact bars it was computed
+from. Re-running the same backtest on the same bars is a lookup; when any
+of those bars change (new or revised data in the range) the key changes and
+the result is recomputed. Entries never go stale, they only stop being
+reachable, so old files are pruned by count. Results are kept in memory and
+as one JSON file per key so they survive restarts.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+
+from .jobs import jsonable
+from .singleflight import single_flight
+
+logger = logging.getLogger(__name__)
+
+# 回测引擎输出变化时递增，使旧结果全部失效
+FORMAT_VERSION = 1
+
+# 参与数据摘要的列
+DIGEST_COLUMNS = ('Open', 'High', 'Low', 'Close', 'Volume')
+
+
+def data_digest(frame: pd.DataFrame) -> str:
+    """SHA-256 of a frame's timestamps and OHLCV values"""
+    digest = hashlib.sha256(np.ascontiguousarray(frame.index.asi8).tobytes())
+    for column in DIGEST_COLUMNS:
+        if column in frame:
+            digest.update(column.encode())
+            digest.update(np.ascontiguousarray(frame[column].to_numpy(dtype=np.float64)).tobytes())
+    return digest.hexdigest()
+
+
+def result_key(kind: str, params: Dict[str, Any], frames: Mapping[str, pd.DataFrame]) -> str:
+    """Content address of a backtest: request parameters plus the digest of every input frame"""
+    material = {
+        'format': FORMAT_VERSION,
+        'kind': kind,
+        'params': params,
+        'data': {symbol.upper(): data_digest(frame) for symbol, frame in frames.items()}
+    }
+    encoded = json.dumps(material, sort_keys=True, separators=(',', ':'), default=jsonable)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class _LeaderAborted(Exception):
+    """The caller computing a shared result was stopped by its own progress callback"""
+
+    def __init__(self, progress: Callable[[int, int], None], error: BaseException):
+        super().__init__(str(error))
+        self.progress = progress
+        self.error = error
+
+
+class BacktestCache:
+    """Memory plus disk cache of backtest results by content address.
+
+    At most ``BACKTEST_CACHE_SIZE`` results are held in memory and
+    ``BACKTEST_CACHE_MAX_FILES`` on disk (least recently used are removed
+    first). Concurrent requests for the same key compute it once; progress
+    of that computation is reported to every waiting caller.
+    """
+
+    def __init__(self, root: Optional[Path] = None, maxsize: Optional[int] = None,
+                 max_files: Optional[int] = None):
+        default_root = Path(__file__).parent.parent / 'data' / 'backtest_cache'
+        self.root = Path(root or os.getenv('BACKTEST_CACHE_DIR', default_root))
+        self._entries = LRUCache(maxsize=maxsize or int(os.getenv('BACKTEST_CACHE_SIZE', '256')))
+        self.max_files = max_files or int(os.getenv('BACKTEST_CACHE_MAX_FILES', '5000'))
+        self._lock = threading.Lock()
+        self._writes = 0
+        # 结果键 -> 正在等待该结果的调用方的进度回调
+        self._listeners: Dict[str, List[Callable[[int, int], None]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kind: str, params: Dict[str, Any], frames: Mapping[str, pd.DataFrame],
+            compute: Callable[[Callable[[int, int], None]], Dict[str, Any]],
+            progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """Return the stored result for this request and data, computing it on a miss.
+
+        ``params`` must fully determine the result together with the frames
+        (normalize defaults first). ``compute(progress)`` is given a callback
+        that forwards to the ``progress`` of every caller waiting for the key.
+        An exception raised by a caller's own ``progress`` (e.g. its job was
+        cancelled) stops only that caller: if it was computing the result,
+        the remaining callers compute it again. The returned dict carries
+        ``cached``.
+        """
+        key = result_key(kind, params, frames)
+        result = self._lookup(key)
+        if result is not None:
+            with self._lock:
+                self.hits += 1
+            return dict(result, cached=True)
+
+        with self._lock:
+            self.misses += 1
+        while True:
+            self._listen(key, progress)
+            try:
+                result = single_flight.do(('backtest_cache', key), self._compute, key, compute, progress)
+                return dict(result, cached=False)
+            except _LeaderAborted as e:
+                if e.progress is progress:
+                    raise e.error
+                # 负责计算的调用方被取消，由仍在等待的调用方重新计算
+                logger.info(f"Recomputing backtest {key} after the computing caller stopped")
+            finally:
+                self._unlisten(key, progress)
+
+    def _listen(self, key: str, progress: Optional[Callable[[int, int], None]]):
+        if progress is not None:
+            with self._lock:
+                self._listeners.setdefault(key, []).append(progress)
+
+    def _unlisten(self, key: str, progress: Optional[Callable[[int, int], None]]):
+        with self._lock:
+            listeners = self._listeners.get(key, [])
+            if progress in listeners:
+                listeners.remove(progress)
+            if not listeners:
+                self._listeners.pop(key, None)
+
+    def _report(self, key: str, leader: Optional[Callable[[int, int], None]], done: int, total: int):
+        with self._lock:
+            listeners = list(self._listeners.get(key, ()))
+        for listener in listeners:
+            try:
+                listener(done, total)
+            except Exception as e:
+                if listener is leader:
+                    raise _LeaderAborted(leader, e)
+                # 等待方自己被取消：不再通知它，计算照常进行
+                self._unlisten(key, listener)
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            result = self._entries.get(key)
+        if result is not None:
+            return result
+
+        path = self._path(key)
+        try:
+            result = json.loads(path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable backtest cache entry {key}: {str(e)}")
+            return None
+
+        try:
+            # 记录最近使用时间，清理时优先保留
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self._entries[key] = result
+        return result
+
+    def _compute(self, key: str, compute: Callable[[Callable[[int, int], None]], Dict[str, Any]],
+                 leader: Optional[Callable[[int, int], None]]) -> Dict[str, Any]:
+        result = compute(lambda done, total: self._report(key, leader, done, total))
+        # 序列化后再读回，内存中与磁盘上的结果完全一致
+        encoded = json.dumps(result, default=jsonable)
+        result = json.loads(encoded)
+        with self._lock:
+            self._entries[key] = result
+            self._writes += 1
+            prune = self._writes % 100 == 0
+
+        try:
+            path = self._path(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix('.tmp')
+            tmp_path.write_text(encoded, encoding='utf-8')
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Error saving backtest cache entry {key}: {str(e)}")
+        if prune:
+            self._prune()
+        return result
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f'{key}.json'
+
+    def _prune(self):
+        """Remove the least recently used files beyond ``max_files``"""
+        try:
+            files = list(self.root.glob('*/*.json'))
+            if len(files) <= self.max_files:
+                return
+            files.sort(key=lambda path: path.stat().st_mtime)
+            for path in files[:len(files) - self.max_files]:
+                path.unlink(missing_ok=True)
+        except Exception as e:
+            logger.error(f"Error pruning backtest cache: {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Create a singleton instance
+backtest_cache = BacktestCache()
@@ -0,0 +1,55 @@
+import logging
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+
+class HttpClient:
+    """Pooled keep-alive HTTP client shared by all upstream market data calls.
+
+    One ``requests.Session`` keeps TCP+TLS connections open between calls.
+    Each host gets at most ``pool_size`` connections; extra threads wait for
+    a free connection instead of opening new ones.
+    """
+
+    DEFAULT_HEADERS = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
+        "Accept": "application/json",
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive"
+    }
+
+    def __init__(self, pool_size: int = None, timeout: float = None, retries: int = None):
+        self.pool_size = pool_size or int(os.getenv('HTTP_POOL_SIZE', '10'))
+        self.timeout = timeout or float(os.getenv('HTTP_TIMEOUT', '10'))
+        retries = retries if retries is not None else int(os.getenv('HTTP_RETRIES', '2'))
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET'])
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            pool_block=True,
+            max_retries=retry
+        )
+
+        self.session = requests.Session()
+        self.session.headers.update(self.DEFAULT_HEADERS)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, url: str, params=None, timeout: float = None, **kwargs) -> requests.Response:
+        """GET through the shared session with the default timeout"""
+        return self.session.get(url, params=params, timeout=timeout or self.timeout, **kwargs)
+
+
+# Create a singleton instance
+http_client = HttpClient()
@@ -0,0 +1,108 @@
+import logging
+import os
+import threading
+from typing import Any, Callable, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+
+from . import indicators
+
+logger = logging.getLogger(__name__)
+
+# 指标名 -> (计算函数, 输入列)
+INDICATORS = {
+    'sma': (indicators.sma, ('Close',)),
+    'ema': (indicators.ema, ('Close',)),
+    'macd': (indicators.macd, ('Close',)),
+    'rsi': (indicators.rsi, ('Close',)),
+    'mfi': (indicators.mfi, ('High', 'Low', 'Close', 'Volume')),
+    'obv': (indicators.obv, ('Close', 'Volume')),
+    'atr': (indicators.atr, ('High', 'Low', 'Close')),
+    'rolling_max': (indicators.rolling_max, ('High',)),
+    'rolling_min': (indicators.rolling_min, ('Low',)),
+    'donchian': (indicators.donchian, ('High', 'Low')),
+    'breakout': (indicators.breakout, ('Close', 'High'))
+}
+
+Result = Union[np.ndarray, Tuple[np.ndarray, ...]]
+
+
+def _nbytes(value: Result) -> int:
+    if isinstance(value, tuple):
+        return sum(array.nbytes for array in value)
+    return value.nbytes
+
+
+def frame_key(frame: pd.DataFrame) -> Optional[tuple]:
+    """Identify the bars in a frame: (symbol, interval, version, first ts, last ts).
+
+    ``version`` is the price store version the frame was read from (or a
+    per-download number for intraday data), so any rewrite of the stored
+    bars, including revisions in the middle of the history, changes the
+    key. Frames without ``symbol`` and ``version`` attrs (see
+    ``StockAnalyzer.get_stock_data``) are not cached.
+    """
+    symbol = frame.attrs.get('symbol')
+    version = frame.attrs.get('version')
+    if symbol is None or version is None or frame.empty:
+        return None
+    stamps = frame.index.asi8
+    return symbol, frame.attrs.get('interval', '1d'), version, int(stamps[0]), int(stamps[-1])
+
+
+class IndicatorCache:
+    """Size-bounded memo of indicator arrays keyed by the bars they were computed from.
+
+    Everything that asks for the same indicator with the same parameters on
+    the same data gets the same read-only array back. Entries are evicted
+    least recently used once ``max_bytes`` is exceeded.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        max_bytes = max_bytes or int(float(os.getenv('INDICATOR_CACHE_MB', '64')) * 1024 * 1024)
+        self._cache = LRUCache(maxsize=max_bytes, getsizeof=_nbytes)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Optional[tuple], name: str, params: dict, compute: Callable[[], Result]) -> Result:
+        """Return the cached result for (key, name, params), computing it on a miss"""
+        if key is None:
+            return compute()
+
+        cache_key = key + (name, tuple(sorted(params.items())))
+        with self._lock:
+            if cache_key in self._cache:
+                self.hits += 1
+                return self._cache[cache_key]
+            self.misses += 1
+
+        result = compute()
+        # 缓存的数组被多处共享，设为只读
+        for array in (result if isinstance(result, tuple) else (result,)):
+            array.flags.writeable = False
+        with self._lock:
+            try:
+                self._cache[cache_key] = result
+            except ValueError:
+                # 单个结果超过缓存上限，不缓存
+                pass
+        return result
+
+    def compute(self, frame: pd.DataFrame, name: str, **params: Any) -> Result:
+        """Indicator ``name`` (a key of INDICATORS) on an OHLCV frame, memoized"""
+        function, columns = INDICATORS[name]
+        return self.get(
+            frame_key(frame), name, params,
+            lambda: function(*(frame[column].to_numpy(dtype=np.float64) for column in columns), **params)
+        )
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+# Create a singleton instance
+indicator_cache = IndicatorCache()
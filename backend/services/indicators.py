@@ -0,0 +1,312 @@
+"""Vectorized technical indicators.
+
+Every function takes arrays shaped (symbols, time) - or 1-D arrays for a
+single symbol - and computes along the last axis for all symbols at once.
+Missing bars are NaN; histories shorter than the panel are NaN-padded on
+the left, as produced by ``align_frames``. Results match the pandas
+formulas previously inlined in the analyzer, scanner and report code.
+"""
+import logging
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 面板使用的行情列
+OHLCV = ('Open', 'High', 'Low', 'Close', 'Volume')
+
+
+def _as_2d(x) -> Tuple[np.ndarray, bool]:
+    x = np.asarray(x, dtype=np.float64)
+    return (x[np.newaxis, :], True) if x.ndim == 1 else (x, False)
+
+
+def _restore(x: np.ndarray, was_1d: bool) -> np.ndarray:
+    return x[0] if was_1d else x
+
+
+def _shift(x: np.ndarray, periods: int = 1) -> np.ndarray:
+    out = np.full_like(x, np.nan)
+    out[:, periods:] = x[:, :-periods]
+    return out
+
+
+def _diff(x: np.ndarray) -> np.ndarray:
+    return x - _shift(x)
+
+
+def _rolling_sum(x: np.ndarray, window: int) -> np.ndarray:
+    """Rolling sum over ``window`` bars, NaN unless all bars in the window are present"""
+    valid = ~np.isnan(x)
+    sums = np.cumsum(np.where(valid, x, 0.0), axis=1)
+    counts = np.cumsum(valid, axis=1)
+
+    out = np.full_like(x, np.nan)
+    if window > x.shape[1]:
+        return out
+    window_sums = sums[:, window - 1:].copy()
+    window_sums[:, 1:] -= sums[:, :-window]
+    window_counts = counts[:, window - 1:].copy()
+    window_counts[:, 1:] -= counts[:, :-window]
+    out[:, window - 1:] = np.where(window_counts == window, window_sums, np.nan)
+    return out
+
+
+def rolling_sum(x, window: int) -> np.ndarray:
+    x, was_1d = _as_2d(x)
+    return _restore(_rolling_sum(x, window), was_1d)
+
+
+def sma(x, window: int) -> np.ndarray:
+    """Simple moving average, same as ``rolling(window).mean()``"""
+    x, was_1d = _as_2d(x)
+    return _restore(_rolling_sum(x, window) / window, was_1d)
+
+
+def _ema_row(values: np.ndarray, alpha: float) -> np.ndarray:
+    # 单只股票时逐个浮点数递推，比每步调用NumPy快一个数量级
+    out = []
+    state = math.nan
+    for value in values.tolist():
+        if state != state:
+            state = value
+        elif value == value:
+            state = alpha * value + (1 - alpha) * state
+        out.append(state)
+    return np.array(out, dtype=np.float64)
+
+
+def _ema(x: np.ndarray, alpha: float) -> np.ndarray:
+    if x.shape[0] == 1:
+        return _ema_row(x[0], alpha)[np.newaxis, :]
+    # 沿时间轴递推，每一步同时更新所有股票
+    out = np.empty_like(x)
+    state = np.full(x.shape[0], np.nan)
+    for t in range(x.shape[1]):
+        value = x[:, t]
+        state = np.where(
+            np.isnan(state), value,
+            np.where(np.isnan(value), state, alpha * value + (1 - alpha) * state)
+        )
+        out[:, t] = state
+    return out
+
+
+def ema(x, span: Optional[int] = None, alpha: Optional[float] = None) -> np.ndarray:
+    """Exponential moving average, same as ``ewm(span=span, adjust=False).mean()``"""
+    x, was_1d = _as_2d(x)
+    alpha = alpha if alpha is not None else 2.0 / (span + 1)
+    return _restore(_ema(x, alpha), was_1d)
+
+
+def macd(close, fast: int = 12, slow: int = 26, signal: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return (macd, signal line, histogram)"""
+    close, was_1d = _as_2d(close)
+    line = _ema(close, 2.0 / (fast + 1)) - _ema(close, 2.0 / (slow + 1))
+    signal_line = _ema(line, 2.0 / (signal + 1))
+    return tuple(_restore(x, was_1d) for x in (line, signal_line, line - signal_line))
+
+
+def rsi(close, period: int = 14, method: str = 'sma') -> np.ndarray:
+    """Relative strength index.
+
+    ``method='sma'`` averages gains and losses with a simple rolling mean,
+    as the existing reports do; ``'wilder'`` uses Wilder's smoothing.
+    """
+    close, was_1d = _as_2d(close)
+    delta = _diff(close)
+    missing = np.isnan(close)
+    # 与pandas的where一致：首个差值记为0
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+    gain[missing] = np.nan
+    loss[missing] = np.nan
+
+    if method == 'wilder':
+        avg_gain = _ema(gain, 1.0 / period)
+        avg_loss = _ema(loss, 1.0 / period)
+    else:
+        avg_gain = _rolling_sum(gain, period) / period
+        avg_loss = _rolling_sum(loss, period) / period
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = 100 - 100 / (1 + avg_gain / avg_loss)
+    return _restore(out, was_1d)
+
+
+def mfi(high, low, close, volume, period: int = 14) -> np.ndarray:
+    """Money flow index over ``period`` bars"""
+    high, was_1d = _as_2d(high)
+    low, _ = _as_2d(low)
+    close, _ = _as_2d(close)
+    volume, _ = _as_2d(volume)
+
+    typical = (high + low + close) / 3
+    raw_flow = typical * volume
+    previous = _shift(typical)
+    missing = np.isnan(raw_flow)
+    positive = np.where(typical > previous, raw_flow, 0.0)
+    negative = np.where(typical < previous, raw_flow, 0.0)
+    positive[missing] = np.nan
+    negative[missing] = np.nan
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = 100 - 100 / (1 + _rolling_sum(positive, period) / _rolling_sum(negative, period))
+    return _restore(out, was_1d)
+
+
+def obv(close, volume) -> np.ndarray:
+    """On-balance volume; a bar that does not close lower than the previous one counts as up"""
+    close, was_1d = _as_2d(close)
+    volume, _ = _as_2d(volume)
+    direction = np.where(_diff(close) <= 0, -1.0, 1.0)
+    flow = direction * volume
+    missing = np.isnan(flow)
+    out = np.cumsum(np.where(missing, 0.0, flow), axis=1)
+    out[missing] = np.nan
+    return _restore(out, was_1d)
+
+
+def true_range(high, low, close) -> np.ndarray:
+    high, was_1d = _as_2d(high)
+    low, _ = _as_2d(low)
+    close, _ = _as_2d(close)
+    previous = _shift(close)
+    # fmax忽略NaN：首根K线没有前收盘价，只用最高最低价
+    out = np.fmax(high - low, np.fmax(np.abs(high - previous), np.abs(low - previous)))
+    return _restore(out, was_1d)
+
+
+def atr(high, low, close, period: int = 14) -> np.ndarray:
+    """Average true range with Wilder's smoothing"""
+    tr, was_1d = _as_2d(true_range(high, low, close))
+    return _restore(_ema(tr, 1.0 / period), was_1d)
+
+
+def _rolling_extreme(x: np.ndarray, window: int, accumulate: np.ufunc, fill: float) -> np.ndarray:
+    # van Herk/Gil-Werman：按窗口长度分块，块内前缀与后缀极值各扫一遍，O(n)且不随窗口变长
+    rows, length = x.shape
+    out = np.full_like(x, np.nan)
+    if window > length:
+        return out
+
+    blocks = -(-length // window)
+    padded = np.full((rows, blocks * window), fill)
+    padded[:, :length] = np.where(np.isnan(x), fill, x)
+    chunks = padded.reshape(rows, blocks, window)
+    prefix = accumulate.accumulate(chunks, axis=2).reshape(rows, -1)
+    suffix = accumulate.accumulate(chunks[:, :, ::-1], axis=2)[:, :, ::-1].reshape(rows, -1)
+
+    # 窗口[i-window+1, i]跨越至多两个块
+    ends = np.arange(window - 1, length)
+    out[:, window - 1:] = accumulate(suffix[:, ends - window + 1], prefix[:, ends])
+
+    counts = _rolling_sum((~np.isnan(x)).astype(np.float64), window)
+    out[counts != window] = np.nan
+    return out
+
+
+def rolling_max(x, window: int) -> np.ndarray:
+    """Highest value of the last ``window`` bars, same as ``rolling(window).max()``"""
+    x, was_1d = _as_2d(x)
+    return _restore(_rolling_extreme(x, window, np.maximum, -np.inf), was_1d)
+
+
+def rolling_min(x, window: int) -> np.ndarray:
+    """Lowest value of the last ``window`` bars, same as ``rolling(window).min()``"""
+    x, was_1d = _as_2d(x)
+    return _restore(_rolling_extreme(x, window, np.minimum, np.inf), was_1d)
+
+
+def donchian(high, low, window: int = 20) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Donchian channel: (upper, lower, middle) over ``window`` bars"""
+    upper = rolling_max(high, window)
+    lower = rolling_min(low, window)
+    return upper, lower, (upper + lower) / 2
+
+
+def breakout(close, high, window: int = 20) -> np.ndarray:
+    """Whether each close is above the highest high of the ``window`` bars before it"""
+    close, was_1d = _as_2d(close)
+    high, _ = _as_2d(high)
+    prior_high = _shift(_rolling_extreme(high, window, np.maximum, -np.inf))
+    with np.errstate(invalid='ignore'):
+        return _restore(close > prior_high, was_1d)
+
+
+def align_frames(frames: Dict[str, pd.DataFrame],
+                 columns: Sequence[str] = OHLCV) -> Tuple[List[str], pd.DatetimeIndex, Dict[str, np.ndarray]]:
+    """Stack per-symbol OHLCV frames into (symbols, time) arrays on a shared date index.
+
+    Dates a symbol has no bar for are NaN.
+    """
+    symbols = [symbol for symbol, frame in frames.items() if frame is not None and not frame.empty]
+    if not symbols:
+        return [], pd.DatetimeIndex([]), {column: np.empty((0, 0)) for column in columns}
+
+    stamps = [frames[symbol].index.asi8 for symbol in symbols]
+    union = np.unique(np.concatenate(stamps))
+    panel = {column: np.full((len(symbols), len(union)), np.nan) for column in columns}
+    for row, (symbol, stamp) in enumerate(zip(symbols, stamps)):
+        positions = np.searchsorted(union, stamp)
+        frame = frames[symbol]
+        for column in columns:
+            if column in frame:
+                panel[column][row, positions] = frame[column].to_numpy(dtype=np.float64)
+
+    index = pd.DatetimeIndex(union, tz=frames[symbols[0]].index.tz)
+    return symbols, index, panel
+
+
+def compute_indicators(panel: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """The standard indicator set for an OHLCV panel, each shaped like the input columns"""
+    high, low, close, volume = panel['High'], panel['Low'], panel['Close'], panel['Volume']
+    macd_line, signal_line, histogram = macd(close)
+    return {
+        'sma_20': sma(close, 20),
+        'sma_50': sma(close, 50),
+        'sma_200': sma(close, 200),
+        'ema_12': ema(close, 12),
+        'ema_26': ema(close, 26),
+        'macd': macd_line,
+        'macd_signal': signal_line,
+        'macd_hist': histogram,
+        'rsi': rsi(close, 14),
+        'mfi': mfi(high, low, close, volume, 14),
+        'obv': obv(close, volume),
+        'atr': atr(high, low, close, 14),
+        'donchian_high': rolling_max(high, 20),
+        'donchian_low': rolling_min(low, 20)
+    }
+
+
+def last_valid(values: np.ndarray) -> np.ndarray:
+    """Last non-NaN value of each row, NaN for rows without any"""
+    values, was_1d = _as_2d(values)
+    if values.shape[1] == 0:
+        out = np.full(values.shape[0], np.nan)
+        return out[0] if was_1d else out
+    valid = ~np.isnan(values)
+    positions = values.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+    out = values[np.arange(values.shape[0]), positions]
+    out[~valid.any(axis=1)] = np.nan
+    return out[0] if was_1d else out
+
+
+def pct_change(x) -> np.ndarray:
+    """Percent change from the previous bar"""
+    x, was_1d = _as_2d(x)
+    previous = _shift(x)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return _restore((x / previous - 1) * 100, was_1d)
+
+
+def to_list(values, decimals: Optional[int] = None) -> List[Optional[float]]:
+    """JSON-ready list of a 1-D array with NaN as None"""
+    values = np.asarray(values, dtype=np.float64)
+    if decimals is not None:
+        values = np.round(values, decimals)
+    return [None if np.isnan(value) else value for value in values.tolist()]
@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from .market_data import market_data
+from .singleflight import single_flight
+
+logger = logging.getLogger(__name__)
+
+# 价格类字段变化很快，只能缓存很短时间
+PRICE_FIELDS = {
+    'currentPrice', 'regularMarketPrice', 'regularMarketChange',
+    'regularMarketChangePercent', 'regularMarketVolume', 'regularMarketOpen',
+    'regularMarketDayHigh', 'regularMarketDayLow', 'regularMarketPreviousClose',
+    'previousClose', 'open', 'dayHigh', 'dayLow', 'volume', 'bid', 'ask',
+    'bidSize', 'askSize', 'preMarketPrice', 'postMarketPrice'
+}
+
+
+class InfoCache:
+    """Persistent cache for yfinance ``Ticker.info`` with per-field TTLs.
+
+    Slowly changing fields (name, sector, market cap...) stay valid for
+    ``ttl`` seconds, price-like fields only for ``price_ttl`` seconds.
+    Callers name the fields they need and the entry is refreshed only when
+    one of them is older than its TTL. Entries are kept in memory and in one
+    JSON file per symbol so they survive restarts.
+    """
+
+    def __init__(self, root: Optional[Path] = None, ttl: Optional[int] = None,
+                 price_ttl: Optional[int] = None):
+        default_root = Path(__file__).parent.parent / 'data' / 'info_cache'
+        self.root = Path(root or os.getenv('INFO_CACHE_DIR', default_root))
+        self.ttl = ttl if ttl is not None else int(os.getenv('INFO_CACHE_TTL', '86400'))
+        self.price_ttl = price_ttl if price_ttl is not None else int(os.getenv('INFO_CACHE_PRICE_TTL', '60'))
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def ttl_for(self, field: str) -> int:
+        """TTL in seconds of a single info field"""
+        return self.price_ttl if field in PRICE_FIELDS else self.ttl
+
+    def get(self, symbol: str, fields: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Return Ticker.info for a symbol, refreshing it only if a requested field expired.
+
+        Without ``fields`` every field present in the cached entry is checked.
+        If the refresh fails a stale entry is returned instead.
+        """
+        symbol = symbol.upper()
+        entry = self._get_entry(symbol)
+
+        if entry is not None:
+            checked = fields if fields is not None else entry['info'].keys()
+            ttl = min((self.ttl_for(field) for field in checked), default=self.ttl)
+            if time.time() - entry['fetched_at'] < ttl:
+                return entry['info']
+
+        try:
+            return single_flight.do((symbol, 'info'), self._refresh, symbol)
+        except Exception as e:
+            if entry is None:
+                raise
+            logger.warning(f"Using stale info for {symbol}, refresh failed: {str(e)}")
+            return entry['info']
+
+    def _get_entry(self, symbol: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(symbol)
+        if entry is not None:
+            return entry
+
+        try:
+            entry = json.loads((self.root / f'{symbol}.json').read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable info cache for {symbol}: {str(e)}")
+            return None
+
+        with self._lock:
+            self._entries[symbol] = entry
+        return entry
+
+    def _refresh(self, symbol: str) -> Dict[str, Any]:
+        info = market_data.get_info(symbol)
+        entry = {'fetched_at': time.time(), 'info': info}
+
+        with self._lock:
+            self._entries[symbol] = entry
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            cache_file = self.root / f'{symbol}.json'
+            tmp_file = cache_file.with_suffix('.tmp')
+            tmp_file.write_text(json.dumps(entry, default=str), encoding='utf-8')
+            os.replace(tmp_file, cache_file)
+        except Exception as e:
+            logger.error(f"Error saving info cache for {symbol}: {str(e)}")
+        return info
+
+
+# Create a singleton instance
+info_cache = InfoCache()
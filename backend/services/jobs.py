@@ -0,0 +1,417 @@
+"""Background job queue for long-running backtests and scans.
+
+Jobs are submitted by type name with JSON parameters and run on a small
+pool of worker threads, highest priority first and in submission order
+within a priority. A job function receives a ``JobContext`` to report
+progress; cancellation is cooperative and takes effect at the next
+progress report (queued jobs are dropped immediately). Every job is saved
+as one JSON file per job, including its result, so status and results
+survive restarts.
+
+Several server processes can share one job directory. Each job runs in the
+process that accepted it, which holds an owner lock file for as long as it
+lives; other processes read the job's status and progress from disk and
+cancel it through a marker file. Unfinished jobs are marked failed only
+once their owner's lock has been released, i.e. the process has exited.
+Without ``fcntl`` (Windows) ownership cannot be checked and the server must
+run as a single process.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import numpy as np
+from cachetools import LRUCache
+
+try:
+    import fcntl
+except ImportError:  # Windows：无法判断其他进程是否存活，只支持单进程
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# 优先级名称 -> 数值，数值越小越先执行
+PRIORITIES = {'high': 0, 'normal': 5, 'low': 9}
+
+# 运行中任务的进度最多每隔这么多秒写一次磁盘，供其他进程读取
+PROGRESS_SAVE_INTERVAL = 1.0
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function when its job has been cancelled"""
+
+
+class JobContext:
+    """Handed to job functions to report progress and notice cancellation"""
+
+    def __init__(self, queue_: 'JobQueue', job: Dict[str, Any]):
+        self._queue = queue_
+        self.job = job
+        self._cancelled = threading.Event()
+        self._saved_at = 0.0
+
+    @property
+    def cancelled(self) -> bool:
+        # 其他进程通过标记文件取消
+        if not self._cancelled.is_set() and self._queue._cancel_requested(self.job['id']):
+            self._cancelled.set()
+        return self._cancelled.is_set()
+
+    def check(self):
+        """Raise JobCancelled if the job was cancelled"""
+        if self.cancelled:
+            raise JobCancelled()
+
+    def progress(self, done: float, total: float = 1, message: Optional[str] = None):
+        """Record ``done`` out of ``total``; also a cancellation point"""
+        self.check()
+        fraction = min(max(done / total, 0.0), 1.0) if total else 1.0
+        with self._queue._lock:
+            self.job['progress'] = round(fraction, 4)
+            if message is not None:
+                self.job['message'] = message
+        now = time.time()
+        if now - self._saved_at >= PROGRESS_SAVE_INTERVAL:
+            self._saved_at = now
+            self._queue._save(self.job)
+
+
+def jsonable(value):
+    """``json.dumps`` default: numpy arrays and scalars as plain values, anything else as a string"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+class JobQueue:
+    """Priority queue of background jobs with persisted status and results.
+
+    Job functions are registered by type with ``register`` and called as
+    ``func(context, **params)``; their return value must be JSON
+    serializable (numpy values are converted). Finished jobs are kept for
+    ``JOB_RETENTION_DAYS``.
+    """
+
+    def __init__(self, root: Optional[Path] = None, workers: Optional[int] = None,
+                 retention_days: Optional[float] = None, maxsize: int = 1000):
+        default_root = Path(__file__).parent.parent / 'data' / 'jobs'
+        self.root = Path(root or os.getenv('JOB_DIR', default_root))
+        self.workers = workers or int(os.getenv('JOB_WORKERS', '2'))
+        self.retention = (
+            retention_days if retention_days is not None else float(os.getenv('JOB_RETENTION_DAYS', '7'))
+        ) * 86400
+        self._types: Dict[str, Callable[..., Any]] = {}
+        # 排队和运行中的任务在_active里；已结束的只缓存最近的，其余按需从磁盘读取
+        self._active: Dict[str, JobContext] = {}
+        self._finished = LRUCache(maxsize=maxsize)
+        self._queue = queue.PriorityQueue()
+        self._sequence = 0
+        self._lock = threading.Lock()
+        # 恢复期间持有，其他调用方等待恢复完成；_reap会获取_lock，所以不能共用
+        self._recover_lock = threading.Lock()
+        self._recovered = False
+        self._threads: List[threading.Thread] = []
+        # 本进程的所有者标识及其锁文件，fork出的子进程重新申请
+        self._owner: Optional[str] = None
+        self._owner_pid: Optional[int] = None
+        self._owner_file = None
+
+    def register(self, job_type: str, func: Callable[..., Any]):
+        self._types[job_type] = func
+
+    @property
+    def types(self) -> List[str]:
+        return sorted(self._types)
+
+    def submit(self, job_type: str, params: Optional[Dict[str, Any]] = None,
+               priority: Union[int, str] = 'normal') -> Dict[str, Any]:
+        """Queue a job and return its record; raises ValueError for unknown types or priorities"""
+        if job_type not in self._types:
+            raise ValueError(f"Unknown job type: {job_type}")
+        if isinstance(priority, str):
+            if priority not in PRIORITIES:
+                raise ValueError(f"Unknown priority: {priority}")
+            priority = PRIORITIES[priority]
+        params = params or {}
+        if not isinstance(params, dict):
+            raise ValueError("params must be an object")
+
+        job = {
+            'id': uuid.uuid4().hex,
+            'type': job_type,
+            'params': params,
+            'priority': int(priority),
+            'owner': self._claim(),
+            'status': QUEUED,
+            'progress': 0.0,
+            'message': None,
+            'error': None,
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None
+        }
+        self._recover()
+        with self._lock:
+            self._active[job['id']] = JobContext(self, job)
+            self._sequence += 1
+            sequence = self._sequence
+        self._save(job)
+
+        self._start_workers()
+        self._queue.put((job['priority'], sequence, job['id']))
+        logger.info(f"Queued {job_type} job {job['id']} with priority {job['priority']}")
+        return self._public(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status record of a job without its result, or None if unknown"""
+        job = self._load(job_id)
+        return self._public(job) if job is not None else None
+
+    def result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job record including ``result`` once it has finished"""
+        job = self._load(job_id)
+        if job is None:
+            return None
+        record = self._public(job)
+        if job['status'] == SUCCEEDED:
+            record['result'] = job.get('result')
+        return record
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued or running job; finished jobs are returned unchanged.
+
+        A job owned by another process is cancelled by that process at its
+        next cancellation point, so the returned status may still be running.
+        """
+        with self._lock:
+            context = self._active.get(job_id)
+            queued = context is not None and context.job['status'] == QUEUED
+            if context is not None:
+                context._cancelled.set()
+            if queued:
+                # 排队中的任务直接取消，工作线程取到时跳过
+                self._finish_locked(context, CANCELLED)
+        if queued:
+            self._save(context.job)
+        elif context is None:
+            job = self._load(job_id)
+            if job is None:
+                return None
+            if job['status'] not in FINISHED:
+                try:
+                    self._cancel_path(job_id).touch()
+                except OSError as e:
+                    logger.error(f"Error requesting cancellation of job {job_id}: {str(e)}")
+        return self.get(job_id)
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Most recent jobs first, from memory and disk"""
+        self._recover()
+        jobs = {}
+        if self.root.exists():
+            for path in self.root.glob('*.json'):
+                job = self._read(path)
+                if job is not None:
+                    jobs[job['id']] = self._reap(job)
+        with self._lock:
+            jobs.update((job_id, context.job) for job_id, context in self._active.items())
+        selected = [job for job in jobs.values() if status is None or job['status'] == status]
+        selected.sort(key=lambda job: job['submitted_at'], reverse=True)
+        return [self._public(job) for job in selected[:limit]]
+
+    def _start_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            _, _, job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            except Exception as e:
+                logger.error(f"Job worker failed on {job_id}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id: str):
+        with self._lock:
+            context = self._active.get(job_id)
+            if context is None or context.job['status'] != QUEUED:
+                return
+            job = context.job
+            job.update(status=RUNNING, started_at=time.time())
+        self._save(job)
+        logger.info(f"Running {job['type']} job {job_id}")
+
+        try:
+            # 排队期间可能已被其他进程取消
+            context.check()
+            result = self._types[job['type']](context, **job['params'])
+            context.check()
+            # 与磁盘上的结果保持一致（numpy值转换为普通JSON值）
+            result = json.loads(json.dumps(result, default=jsonable))
+        except JobCancelled:
+            status, result, error = CANCELLED, None, None
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            logger.error(traceback.format_exc())
+            status, result, error = FAILED, None, str(e)
+        else:
+            status, error = SUCCEEDED, None
+
+        with self._lock:
+            if status == SUCCEEDED:
+                job.update(progress=1.0, result=result)
+            self._finish_locked(context, status, error)
+        self._save(job)
+        self._cancel_path(job_id).unlink(missing_ok=True)
+        logger.info(f"Job {job_id} {status} in {job['finished_at'] - job['started_at']:.1f}s")
+
+    def _finish_locked(self, context: JobContext, status: str, error: Optional[str] = None):
+        context.job.update(status=status, error=error, finished_at=time.time())
+        self._active.pop(context.job['id'], None)
+        self._finished[context.job['id']] = context.job
+
+    def _recover(self):
+        """Once per process: fail jobs whose process has exited and prune old ones.
+
+        Concurrent callers block until the first one has finished recovering.
+        """
+        if self._recovered:
+            return
+        with self._recover_lock:
+            if self._recovered:
+                return
+            if self.root.exists():
+                now = time.time()
+                for path in self.root.glob('*.json'):
+                    job = self._read(path)
+                    if job is None:
+                        continue
+                    # 本进程的任务不会被_reap标记失败
+                    job = self._reap(job)
+                    if job['status'] in FINISHED and now - job['finished_at'] > self.retention:
+                        path.unlink(missing_ok=True)
+                        self._cancel_path(job['id']).unlink(missing_ok=True)
+                # 已退出进程留下的锁文件
+                for path in (self.root / 'owners').glob('*.lock'):
+                    self._owner_alive(path.stem)
+            self._recovered = True
+
+    def _claim(self) -> str:
+        """Owner id of this process, holding its owner lock file for the life of the process"""
+        with self._lock:
+            if self._owner_pid == os.getpid():
+                return self._owner
+            self._owner = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+            self._owner_pid = os.getpid()
+            if fcntl is not None:
+                try:
+                    owners = self.root / 'owners'
+                    owners.mkdir(parents=True, exist_ok=True)
+                    self._owner_file = open(owners / f'{self._owner}.lock', 'w')
+                    fcntl.flock(self._owner_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError as e:
+                    logger.error(f"Error creating job owner lock: {str(e)}")
+            return self._owner
+
+    def _owner_alive(self, owner: Optional[str]) -> bool:
+        if owner is not None and owner == self._owner and self._owner_pid == os.getpid():
+            return True
+        if owner is None or fcntl is None or not owner.replace('-', '').isalnum():
+            return False
+        lock_path = self.root / 'owners' / f'{owner}.lock'
+        try:
+            with open(lock_path, 'a') as lock_file:
+                # 进程退出时锁自动释放；能拿到锁说明所有者已不在
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                lock_path.unlink(missing_ok=True)
+                return False
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+
+    def _reap(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Mark a job read from disk failed if it is unfinished and its process has exited"""
+        if job['status'] in FINISHED or self._owner_alive(job.get('owner')):
+            return job
+        with self._lock:
+            if job['id'] in self._active:
+                return job
+        job.update(status=FAILED, error="Interrupted by a server restart", finished_at=time.time())
+        self._save(job)
+        self._cancel_path(job['id']).unlink(missing_ok=True)
+        return job
+
+    def _cancel_path(self, job_id: str) -> Path:
+        return self.root / f'{job_id}.cancel'
+
+    def _cancel_requested(self, job_id: str) -> bool:
+        return self._cancel_path(job_id).exists()
+
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        self._recover()
+        with self._lock:
+            context = self._active.get(job_id)
+            job = context.job if context is not None else self._finished.get(job_id)
+        if job is not None:
+            return job
+        # 任务ID来自URL，只接受十六进制，避免路径穿越
+        if not job_id.isalnum():
+            return None
+        job = self._read(self.root / f'{job_id}.json')
+        if job is None:
+            return None
+        job = self._reap(job)
+        if job['status'] in FINISHED:
+            # 其他进程仍在运行的任务每次都从磁盘读取最新进度
+            with self._lock:
+                self._finished.setdefault(job_id, job)
+        return job
+
+    @staticmethod
+    def _read(path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable job file {path.name}: {str(e)}")
+            return None
+
+    def _save(self, job: Dict[str, Any]):
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            job_file = self.root / f"{job['id']}.json"
+            tmp_file = job_file.with_suffix('.tmp')
+            tmp_file.write_text(json.dumps(job, default=jsonable), encoding='utf-8')
+            os.replace(tmp_file, job_file)
+        except Exception as e:
+            logger.error(f"Error saving job {job['id']}: {str(e)}")
+
+    @staticmethod
+    def _public(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in job.items() if key != 'result'}
+
+
+# Create a singleton instance
+job_queue = JobQueue()
@@ -0,0 +1,339 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+import yfinance as yf
+
+from .http_client import http_client
+from .rate_limiter import yahoo_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# 时间段 -> 天数，用于回放时按range截取数据
+RANGE_DAYS = {
+    '1d': 1, '5d': 5, '1mo': 31, '3mo': 92, '6mo': 183,
+    '1y': 365, '2y': 730, '5y': 1826, '10y': 3652, 'ytd': 366
+}
+
+
+class MarketDataError(Exception):
+    """Raised when a provider cannot serve a market data request"""
+
+
+class MarketDataProvider(ABC):
+    """Interface every market data backend implements.
+
+    Responses use Yahoo's JSON layout so the parsing code does not depend on
+    where the data came from.
+    """
+
+    @abstractmethod
+    def get_chart(self, symbol: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the chart JSON for a symbol (``interval``, ``range`` or ``period1``/``period2``)"""
+
+    @abstractmethod
+    def search(self, query: str) -> Dict[str, Any]:
+        """Return the symbol search JSON for a query"""
+
+    @abstractmethod
+    def get_info(self, symbol: str) -> Dict[str, Any]:
+        """Return the Ticker.info dict of a symbol"""
+
+    @abstractmethod
+    def get_quotes(self, symbols: List[str]) -> Dict[str, Any]:
+        """Return the spark JSON (last few daily bars) for several symbols in one request.
+
+        Unknown symbols are simply missing from the result.
+        """
+
+    def now(self, symbol: str) -> int:
+        """Current time in epoch seconds as seen by this backend's data for ``symbol``"""
+        return int(time.time())
+
+
+class YahooProvider(MarketDataProvider):
+    """Live Yahoo Finance backend using the pooled HTTP session and shared rate limiter"""
+
+    CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
+    SEARCH_URL = "https://query2.finance.yahoo.com/v1/finance/search"
+    SPARK_URL = "https://query1.finance.yahoo.com/v7/finance/spark"
+    QUOTE_RANGE = {'range': '5d', 'interval': '1d'}
+
+    def _get_json(self, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        yahoo_rate_limiter.acquire()
+        try:
+            response = http_client.get(url, params=params)
+        except requests.RequestException as e:
+            raise MarketDataError(f"Request to {url} failed: {str(e)}")
+
+        if response.status_code != 200:
+            raise MarketDataError(f"Request to {url} failed with status {response.status_code}")
+        return response.json()
+
+    def get_chart(self, symbol, params):
+        return self._get_json(self.CHART_URL.format(symbol=symbol), params)
+
+    def search(self, query):
+        return self._get_json(self.SEARCH_URL, {'q': query})
+
+    def get_info(self, symbol):
+        yahoo_rate_limiter.acquire()
+        try:
+            return yf.Ticker(symbol, session=http_client.session).info or {}
+        except Exception as e:
+            raise MarketDataError(f"Failed to get info for {symbol}: {str(e)}")
+
+    def get_quotes(self, symbols):
+        return self._get_json(self.SPARK_URL, dict(self.QUOTE_RANGE, symbols=','.join(symbols)))
+
+
+class ReplayProvider(MarketDataProvider):
+    """Offline backend serving responses previously recorded to disk.
+
+    Layout under ``root``::
+
+        chart/<interval>/<SYMBOL>.json   full chart JSON, clipped to each request
+        search/<query>.json              search JSON
+        info/<SYMBOL>.json               Ticker.info dict
+
+    Used to benchmark and load-test the analysis, scanner and monitor paths
+    deterministically without network access. The clock (``now``) of a
+    symbol is the end of its daily recording, so period requests resolved
+    against it return the same bars whenever the replay runs.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._clock: Dict[str, int] = {}
+
+    @staticmethod
+    def _file_name(key: str) -> str:
+        return re.sub(r'[^A-Za-z0-9._^=-]', '_', key) + '.json'
+
+    def _read(self, *parts: str) -> Dict[str, Any]:
+        path = self.root.joinpath(*parts[:-1], self._file_name(parts[-1]))
+        try:
+            return json.loads(path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            raise MarketDataError(f"No recorded response at {path}")
+
+    def get_chart(self, symbol, params):
+        data = self._read('chart', params.get('interval', '1d'), symbol.upper())
+        return clip_chart(data, params)
+
+    def now(self, symbol):
+        symbol = symbol.upper()
+        if symbol not in self._clock:
+            try:
+                timestamps = self._read('chart', '1d', symbol)['chart']['result'][0].get('timestamp') or []
+            except (MarketDataError, KeyError, IndexError):
+                timestamps = []
+            # 没有日线录制时退回系统时间；有则停在最后一根K线之后
+            self._clock[symbol] = max(timestamps) + 1 if timestamps else int(time.time())
+        return self._clock[symbol]
+
+    def search(self, query):
+        return self._read('search', query.lower())
+
+    def get_info(self, symbol):
+        return self._read('info', symbol.upper())
+
+    def get_quotes(self, symbols):
+        results = []
+        for symbol in symbols:
+            try:
+                chart = self.get_chart(symbol, YahooProvider.QUOTE_RANGE)
+            except MarketDataError:
+                continue
+            results.append({'symbol': symbol.upper(), 'response': chart['chart']['result']})
+        return {'spark': {'result': results, 'error': None}}
+
+
+class RecordingProvider(YahooProvider):
+    """Live Yahoo backend that also records every response for ReplayProvider.
+
+    Chart bars are merged into one file per symbol and interval so that a
+    recording session builds up the full history the replay will serve.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+
+    def _write(self, data: Dict[str, Any], *parts: str):
+        path = self.root.joinpath(*parts[:-1], ReplayProvider._file_name(parts[-1]))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data, default=str), encoding='utf-8')
+
+    def get_chart(self, symbol, params):
+        data = super().get_chart(symbol, params)
+        self._record_chart(symbol, params.get('interval', '1d'), data)
+        return data
+
+    def _record_chart(self, symbol: str, interval: str, data: Dict[str, Any]):
+        with self._lock:
+            try:
+                recorded = ReplayProvider(self.root).get_chart(symbol, {'interval': interval})
+                merged = merge_charts(recorded, data)
+            except MarketDataError:
+                merged = data
+            self._write(merged, 'chart', interval, symbol.upper())
+
+    def search(self, query):
+        data = super().search(query)
+        self._write(data, 'search', query.lower())
+        return data
+
+    def get_info(self, symbol):
+        info = super().get_info(symbol)
+        self._write(info, 'info', symbol.upper())
+        return info
+
+    def get_quotes(self, symbols):
+        data = super().get_quotes(symbols)
+        # 按单个股票的日线图记录，回放时由get_chart重建
+        for item in (data.get('spark') or {}).get('result') or []:
+            if item.get('response'):
+                self._record_chart(item['symbol'], '1d', {'chart': {'result': item['response'], 'error': None}})
+        return data
+
+
+def _chart_rows(data: Dict[str, Any]):
+    """Split a chart JSON into (result, rows keyed by timestamp)"""
+    result = data['chart']['result'][0]
+    timestamps = result.get('timestamp', [])
+    quote = result['indicators']['quote'][0] if timestamps else {}
+    adjclose = result['indicators'].get('adjclose', [{}])[0].get('adjclose') if timestamps else None
+
+    rows = {}
+    for i, ts in enumerate(timestamps):
+        rows[ts] = {
+            field: values[i] for field, values in quote.items()
+        }
+        if adjclose is not None:
+            rows[ts]['adjclose'] = adjclose[i]
+    return result, rows
+
+
+def _build_chart(result: Dict[str, Any], rows: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+    timestamps = sorted(rows)
+    fields = ['open', 'high', 'low', 'close', 'volume']
+    quote = {field: [rows[ts].get(field) for ts in timestamps] for field in fields}
+    indicators = {'quote': [quote]}
+    if any('adjclose' in row for row in rows.values()):
+        indicators['adjclose'] = [{'adjclose': [rows[ts].get('adjclose') for ts in timestamps]}]
+
+    chart = {'meta': result.get('meta', {}), 'indicators': indicators}
+    if timestamps:
+        chart['timestamp'] = timestamps
+    return {'chart': {'result': [chart], 'error': None}}
+
+
+def clip_chart(data: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep only the bars a chart request would have returned.
+
+    ``range`` is measured back from the last recorded bar so that replays
+    are independent of the wall clock.
+    """
+    result, rows = _chart_rows(data)
+    if not rows:
+        return data
+
+    if 'period1' in params:
+        start = int(params['period1'])
+        end = int(params.get('period2', max(rows)))
+    elif params.get('range', 'max') in RANGE_DAYS:
+        end = max(rows)
+        start = end - RANGE_DAYS[params['range']] * 86400
+    else:
+        return data
+
+    return _build_chart(result, {ts: row for ts, row in rows.items() if start <= ts <= end})
+
+
+def merge_charts(recorded: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge the bars of a new chart response into a recorded one"""
+    _, old_rows = _chart_rows(recorded)
+    result, new_rows = _chart_rows(data)
+    old_rows.update(new_rows)
+    return _build_chart(result, old_rows)
+
+
+def parse_quotes(data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Turn a spark JSON into {symbol: quote} with the last price and day statistics.
+
+    Spark bars carry only closes, so volume and the day range come from the
+    chart ``meta`` (``regularMarket*``), falling back to the last bar when a
+    response does include full OHLCV (e.g. replayed charts).
+    """
+    quotes = {}
+    for item in (data.get('spark') or {}).get('result') or []:
+        response = item.get('response') or []
+        if not response or not response[0].get('timestamp'):
+            continue
+        result = response[0]
+        meta = result.get('meta', {})
+        quote = result['indicators']['quote'][0]
+
+        # 跳过停牌等导致的空K线
+        rows = [i for i, close in enumerate(quote.get('close') or []) if close is not None]
+        if not rows:
+            continue
+        last = rows[-1]
+
+        def value(field, index=last):
+            values = quote.get(field) or []
+            return values[index] if index < len(values) else None
+
+        def day_value(meta_field, field):
+            return meta[meta_field] if meta.get(meta_field) is not None else value(field)
+
+        price = meta.get('regularMarketPrice') or value('close')
+        if len(rows) > 1:
+            previous_close = value('close', rows[-2])
+        else:
+            previous_close = meta.get('chartPreviousClose') or meta.get('previousClose')
+        change = price - previous_close if price is not None and previous_close else None
+
+        quotes[item['symbol'].upper()] = {
+            'price': price,
+            'previous_close': previous_close,
+            'change': change,
+            'change_percent': change / previous_close * 100 if change is not None else None,
+            'volume': day_value('regularMarketVolume', 'volume'),
+            'day_high': day_value('regularMarketDayHigh', 'high'),
+            'day_low': day_value('regularMarketDayLow', 'low'),
+            'timestamp': result['timestamp'][last],
+            'name': meta.get('longName') or meta.get('shortName') or '',
+            'exchange': meta.get('exchangeName', ''),
+            'currency': meta.get('currency', '')
+        }
+    return quotes
+
+
+def create_provider(name: Optional[str] = None) -> MarketDataProvider:
+    """Build the provider selected by MARKET_DATA_PROVIDER (yahoo, replay or record)"""
+    name = (name or os.getenv('MARKET_DATA_PROVIDER', 'yahoo')).lower()
+    replay_dir = Path(os.getenv(
+        'MARKET_DATA_REPLAY_DIR',
+        Path(__file__).parent.parent / 'data' / 'replay'
+    ))
+
+    if name == 'replay':
+        logger.info(f"Serving market data from recordings in {replay_dir}")
+        return ReplayProvider(replay_dir)
+    if name == 'record':
+        logger.info(f"Recording market data responses to {replay_dir}")
+        return RecordingProvider(replay_dir)
+    return YahooProvider()
+
+
+# Shared provider used by every service
+market_data = create_provider()
@@ -0,0 +1,256 @@
+"""Strategy backtests across many symbols, aggregated into a portfolio.
+
+The aligned price panel is copied once into a shared-memory block that
+worker processes map without copying. Each worker backtests its share of
+the symbols with ``backtest.run`` and writes the per-bar strategy,
+position and buy-and-hold returns into a second shared block, so only the
+small per-symbol metrics travel back through pickling. The parent then
+combines the symbol sleeves into a daily-rebalanced portfolio.
+
+The worker processes are one long-lived pool shared by every run. They are
+started with ``forkserver`` (``spawn`` where that is unavailable) rather
+than forked from the multi-threaded server, so they never inherit locks
+held by other threads.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from . import backtest, indicators
+
+logger = logging.getLogger(__name__)
+
+# 共享面板中的行情列
+PANEL_COLUMNS = ('Open', 'High', 'Low', 'Close', 'Volume')
+
+# 输出块：策略收益、持仓、买入持有收益
+OUTPUTS = ('returns', 'positions', 'market')
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # 子进程与父进程共用同一个resource_tracker，重复登记无影响，由创建方unlink
+    return shared_memory.SharedMemory(name=name)
+
+
+def _backtest_rows(blocks: Tuple[str, str], shape: Tuple[int, int], timestamps: np.ndarray,
+                   rows: List[int], spec: Dict[str, Any], cost_bps: Optional[float]) -> Dict[int, Dict[str, Any]]:
+    """Backtest panel rows, writing per-bar results into the shared output block"""
+    panel_block, output_block = _attach(blocks[0]), _attach(blocks[1])
+    panel = np.ndarray((len(PANEL_COLUMNS),) + shape, dtype=np.float64, buffer=panel_block.buf)
+    output = np.ndarray((len(OUTPUTS),) + shape, dtype=np.float64, buffer=output_block.buf)
+    results = {}
+    try:
+        for row in rows:
+            # 只用该股票有K线的日期，停牌缺口前后的涨跌算在复牌当天
+            bars = np.flatnonzero(~np.isnan(panel[PANEL_COLUMNS.index('Close'), row]))
+            if len(bars) < 2:
+                results[row] = {'error': "Not enough price data"}
+                continue
+            data = {column: panel[i, row, bars] for i, column in enumerate(PANEL_COLUMNS)}
+            try:
+                result = backtest.run(data, timestamps[bars], spec, cost_bps)
+            except Exception as e:
+                results[row] = {'error': str(e)}
+                continue
+
+            output[OUTPUTS.index('returns'), row, bars] = result['returns']
+            output[OUTPUTS.index('positions'), row, bars] = result['positions']
+            output[OUTPUTS.index('market'), row, bars] = backtest._market_returns(data['Close'])
+            closed = [trade['return'] for trade in result['trades'] if not trade['open']]
+            results[row] = {
+                'metrics': result['metrics'],
+                'benchmark': result['benchmark_metrics'],
+                'closed_trades': len(closed),
+                'winning_trades': sum(value > 0 for value in closed)
+            }
+    finally:
+        # 先释放数组视图，否则close会因缓冲区仍被引用而失败
+        del panel, output
+        panel_block.close()
+        output_block.close()
+    return results
+
+
+class PortfolioBacktester:
+    """Runs one strategy over many symbols on a process pool.
+
+    ``workers`` defaults to ``PORTFOLIO_WORKERS`` or the number of CPUs;
+    with one worker, or fewer than ``min_parallel`` symbols, everything
+    runs in the calling process over the same shared blocks. The pool is
+    started on first use and shared by concurrent runs.
+    """
+
+    def __init__(self, workers: Optional[int] = None, min_parallel: int = 8):
+        self.workers = workers or int(os.getenv('PORTFOLIO_WORKERS', '0')) or os.cpu_count() or 1
+        self.min_parallel = min_parallel
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def run(self, frames: Dict[str, pd.DataFrame], spec: Optional[Dict[str, Any]] = None,
+            weights: Union[str, Dict[str, float], None] = 'equal',
+            cost_bps: Optional[float] = None,
+            progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """Backtest ``spec`` on every frame and combine the results.
+
+        ``weights`` is ``'equal'`` or a mapping of symbol to weight; on each
+        bar the weights of the symbols trading that day are renormalized to
+        sum to one (daily rebalancing). Returns the portfolio curve and
+        metrics, the equal-weight buy-and-hold benchmark and per-symbol
+        metrics. ``progress(done, total)`` is called as batches of symbols
+        finish; an exception raised from it aborts the run.
+        """
+        spec = backtest.parse_spec(spec)
+        symbols, index, panel = indicators.align_frames(frames, PANEL_COLUMNS)
+        if not symbols:
+            raise ValueError("No price data for any symbol")
+        base_weights = self._weights(symbols, weights)
+        timestamps = index.asi8 // 10**9
+        shape = (len(symbols), len(index))
+
+        panel_block = shared_memory.SharedMemory(create=True, size=8 * len(PANEL_COLUMNS) * shape[0] * shape[1])
+        output_block = shared_memory.SharedMemory(create=True, size=8 * len(OUTPUTS) * shape[0] * shape[1])
+        try:
+            shared_panel = np.ndarray((len(PANEL_COLUMNS),) + shape, dtype=np.float64, buffer=panel_block.buf)
+            for i, column in enumerate(PANEL_COLUMNS):
+                shared_panel[i] = panel[column]
+            output = np.ndarray((len(OUTPUTS),) + shape, dtype=np.float64, buffer=output_block.buf)
+            output[:] = 0.0
+            del shared_panel
+
+            try:
+                results = self._dispatch(
+                    panel_block.name, output_block.name, shape, timestamps, spec, cost_bps, progress
+                )
+                returns, positions, market = (np.array(values) for values in output)
+            finally:
+                del output
+        finally:
+            for block in (panel_block, output_block):
+                block.close()
+                block.unlink()
+
+        ok = np.array([('error' not in results[row]) for row in range(len(symbols))])
+        active = ~np.isnan(panel['Close']) & ok[:, np.newaxis]
+        weight = np.where(active, base_weights[:, np.newaxis], 0.0)
+        totals = weight.sum(axis=0)
+        weight = np.divide(weight, totals, out=np.zeros_like(weight), where=totals > 0)
+
+        portfolio = self._curve((weight * returns).sum(axis=0))
+        benchmark = self._curve((weight * market).sum(axis=0))
+        exposure = (weight * np.abs(positions)).sum(axis=0)
+        closed = sum(results[row].get('closed_trades', 0) for row in range(len(symbols)))
+        winning = sum(results[row].get('winning_trades', 0) for row in range(len(symbols)))
+
+        metrics = backtest._metrics(portfolio['returns'], portfolio['equity'], portfolio['drawdown'], exposure, [])
+        metrics.update(
+            exposure=float(exposure.mean()) * 100,
+            trades=sum(results[row].get('metrics', {}).get('trades', 0) for row in range(len(symbols))),
+            win_rate=winning / closed * 100 if closed else None
+        )
+
+        per_symbol = {}
+        for row, symbol in enumerate(symbols):
+            per_symbol[symbol] = dict(results[row], weight=float(base_weights[row]))
+            per_symbol[symbol].pop('closed_trades', None)
+            per_symbol[symbol].pop('winning_trades', None)
+
+        return {
+            'spec': spec,
+            'symbols': symbols,
+            'timestamps': timestamps,
+            'returns': portfolio['returns'],
+            'equity': portfolio['equity'],
+            'drawdown': portfolio['drawdown'],
+            'benchmark': benchmark['equity'],
+            'metrics': metrics,
+            'benchmark_metrics': backtest._metrics(
+                benchmark['returns'], benchmark['equity'], benchmark['drawdown'], np.ones(len(index)), []
+            ),
+            'per_symbol': per_symbol,
+            'missing': [symbol for symbol in frames if symbol not in per_symbol]
+        }
+
+    def _dispatch(self, panel_name, output_name, shape, timestamps, spec, cost_bps,
+                  progress=None) -> Dict[int, Dict[str, Any]]:
+        rows = list(range(shape[0]))
+        workers = min(self.workers, len(rows))
+        blocks = (panel_name, output_name)
+        results = {}
+
+        if workers <= 1 or len(rows) < self.min_parallel:
+            for start in range(0, len(rows), self.min_parallel):
+                results.update(_backtest_rows(blocks, shape, timestamps, rows[start:start + self.min_parallel],
+                                              spec, cost_bps))
+                if progress is not None:
+                    progress(len(results), len(rows))
+            return results
+
+        # 每个进程分几批，慢的股票不会拖住整个进程
+        chunks = [chunk for chunk in (rows[i::workers * 4] for i in range(workers * 4)) if chunk]
+        logger.info(f"Backtesting {len(rows)} symbols on {workers} processes")
+        executor = self._pool()
+        futures = [
+            executor.submit(_backtest_rows, blocks, shape, timestamps, chunk, spec, cost_bps) for chunk in chunks
+        ]
+        try:
+            for future in as_completed(futures):
+                results.update(future.result())
+                if progress is not None:
+                    progress(len(results), len(rows))
+        except BrokenProcessPool:
+            # 工作进程异常退出后进程池不可再用，下次运行时重建
+            with self._pool_lock:
+                if self._executor is executor:
+                    self._executor = None
+            raise
+        finally:
+            # 中止时撤下尚未开始的批次，并等待已在运行的批次写完共享内存
+            for future in futures:
+                future.cancel()
+            wait(futures)
+        return results
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._executor is None:
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context(method)
+                )
+            return self._executor
+
+    @staticmethod
+    def _weights(symbols: List[str], weights: Union[str, Dict[str, float], None]) -> np.ndarray:
+        if weights in (None, 'equal'):
+            return np.ones(len(symbols))
+        if not isinstance(weights, dict):
+            raise ValueError("weights must be 'equal' or a mapping of symbol to weight")
+        weights = {str(symbol).upper(): weight for symbol, weight in weights.items()}
+        try:
+            values = np.array([float(weights.get(symbol, 0.0)) for symbol in symbols])
+        except (TypeError, ValueError):
+            raise ValueError("Portfolio weights must be numbers")
+        if (values < 0).any() or not values.sum() > 0:
+            raise ValueError("Portfolio weights must be non-negative and not all zero")
+        return values
+
+    @staticmethod
+    def _curve(returns: np.ndarray) -> Dict[str, np.ndarray]:
+        equity = np.cumprod(1 + returns)
+        return {
+            'returns': returns,
+            'equity': equity,
+            'drawdown': equity / np.maximum.accumulate(equity) - 1
+        }
+
+
+# Create a singleton instance
+portfolio_backtester = PortfolioBacktester()
@@ -0,0 +1,462 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows：只有进程内的线程锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 时间段 -> (覆盖的日历天数, 截取的交易日数)
+PERIODS = {
+    '1d': (7, 1), '5d': (12, 5), '1mo': (31, None), '3mo': (92, None),
+    '6mo': (183, None), '1y': (365, None), '2y': (730, None),
+    '5y': (1826, None), 'max': (None, None)
+}
+
+
+class PriceSeries:
+    """Read-only view of the stored bars of one symbol.
+
+    Columns are memory-mapped NumPy arrays aligned with a sorted int64
+    timestamp index (epoch seconds). Slicing returns views rather than
+    copies, and every process reading the same symbol shares one
+    page-cached copy of the files.
+    """
+
+    __slots__ = ('symbol', 'version', 'timestamps', 'columns')
+
+    def __init__(self, symbol: str, version: int, timestamps: np.ndarray, columns: Dict[str, np.ndarray]):
+        self.symbol = symbol
+        self.version = version
+        self.timestamps = timestamps
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.columns
+
+    def locate(self, ts: int, side: str = 'left') -> int:
+        """Position of a timestamp in the index (binary search)"""
+        return int(np.searchsorted(self.timestamps, ts, side=side))
+
+    def window(self, start: Optional[int] = None, stop: Optional[int] = None) -> 'PriceSeries':
+        """Positional slice [start, stop) as a view"""
+        return PriceSeries(
+            self.symbol, self.version, self.timestamps[start:stop],
+            {column: values[start:stop] for column, values in self.columns.items()}
+        )
+
+    def slice(self, start_ts: Optional[int] = None, end_ts: Optional[int] = None) -> 'PriceSeries':
+        """Bars whose timestamp lies in [start_ts, end_ts], as a view"""
+        lo = None if start_ts is None else self.locate(start_ts, 'left')
+        hi = None if end_ts is None else self.locate(end_ts, 'right')
+        return self.window(lo, hi)
+
+    def tail(self, n: int) -> 'PriceSeries':
+        return self.window(max(len(self) - n, 0), None)
+
+    @property
+    def index(self) -> pd.DatetimeIndex:
+        return pd.to_datetime(self.timestamps, unit='s')
+
+    def to_frame(self, copy: bool = False) -> pd.DataFrame:
+        """Build a DataFrame; with ``copy=False`` the columns stay views of the files"""
+        columns = {
+            column: np.array(values) if copy else values
+            for column, values in self.columns.items()
+        }
+        return pd.DataFrame(columns, index=self.index, copy=False)
+
+    def compact(self) -> 'CompactBars':
+        """Copy the bars into the compact in-memory representation"""
+        return CompactBars.from_series(self)
+
+
+class CompactBars:
+    """Compact in-memory daily bars for holding many symbols in RAM.
+
+    Prices are float32, volume uint32 (uint64 when a value does not fit) and
+    timestamps int32 days since the Unix epoch, roughly a third of the
+    memory of a float64 DataFrame with a nanosecond index. Convert with
+    ``to_frame`` only at the API boundary.
+    """
+
+    __slots__ = ('symbol', 'version', 'days', 'columns')
+
+    PRICE_COLUMNS = ('Open', 'High', 'Low', 'Close', 'Adj Close')
+
+    def __init__(self, symbol: str, version: int, days: np.ndarray, columns: Dict[str, np.ndarray]):
+        self.symbol = symbol
+        self.version = version
+        self.days = days
+        self.columns = columns
+
+    @classmethod
+    def from_series(cls, series: PriceSeries) -> 'CompactBars':
+        days = (np.asarray(series.timestamps) // 86400).astype(np.int32)
+        columns = {}
+        for column, values in series.columns.items():
+            if column == 'Volume':
+                columns[column] = compact_volume(values)
+            else:
+                columns[column] = np.asarray(values, dtype=np.float32)
+        return cls(series.symbol, series.version, days, columns)
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.columns
+
+    @property
+    def nbytes(self) -> int:
+        return self.days.nbytes + sum(values.nbytes for values in self.columns.values())
+
+    def tail(self, n: int) -> 'CompactBars':
+        start = max(len(self) - n, 0)
+        return CompactBars(
+            self.symbol, self.version, self.days[start:],
+            {column: values[start:] for column, values in self.columns.items()}
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """Expand to a float64 DataFrame indexed by date"""
+        columns = {
+            column: values.astype(np.float64) if column in self.PRICE_COLUMNS else values
+            for column, values in self.columns.items()
+        }
+        return pd.DataFrame(columns, index=pd.to_datetime(self.days, unit='D'))
+
+
+def compact_volume(values) -> np.ndarray:
+    """Store volume as uint32, falling back to uint64 for very liquid symbols"""
+    values = np.nan_to_num(np.asarray(values, dtype=np.float64))
+    if len(values) and values.max() >= np.iinfo(np.uint32).max:
+        return values.astype(np.uint64)
+    return values.astype(np.uint32)
+
+
+class PriceStore:
+    """Persistent per-symbol OHLCV store backed by NumPy column files.
+
+    Each symbol lives in ``<root>/<interval>/<SYMBOL>/``: a ``meta.json``
+    describing the covered time window plus one directory per data version
+    holding ``timestamp.npy`` (int64 epoch seconds) and one ``.npy`` file per
+    price column. Writes go to a new version directory and then flip the
+    meta file, so readers never see columns from two different writes.
+    Writers in different processes are serialized by a lock file in the
+    symbol directory, and superseded versions are kept for
+    ``PRICE_STORE_PRUNE_GRACE`` seconds for readers in other processes.
+    """
+
+    # DataFrame列名 -> 磁盘文件名
+    COLUMNS = {
+        'Open': 'open',
+        'High': 'high',
+        'Low': 'low',
+        'Close': 'close',
+        'Volume': 'volume',
+        'Adj Close': 'adjclose'
+    }
+
+    # 相邻两根K线间隔超过该秒数视为数据缺口（长假最多休市4天）
+    GAP_SECONDS = {'1d': 6 * 86400}
+
+    def __init__(self, root: Optional[Path] = None, max_age: Optional[int] = None):
+        default_root = Path(__file__).parent.parent / 'data' / 'price_store'
+        self.root = Path(root or os.getenv('PRICE_STORE_DIR', default_root))
+        # 最新数据允许的陈旧秒数，超过后才会向上游补齐尾部
+        self.max_age = max_age if max_age is not None else int(os.getenv('PRICE_STORE_MAX_AGE', '900'))
+        # 紧凑存储：价格写成float32、成交量写成uint32/uint64
+        self.compact = os.getenv('PRICE_STORE_COMPACT', '0').lower() in ('1', 'true', 'yes')
+        # 旧版本目录被取代后至少保留的秒数，其他进程可能刚读完meta、尚未映射文件
+        self.prune_grace = int(os.getenv('PRICE_STORE_PRUNE_GRACE', '3600'))
+        self._locks: Dict[Tuple[str, str], threading.RLock] = {}
+        self._locks_guard = threading.Lock()
+
+    def lock(self, symbol: str, interval: str = '1d') -> threading.RLock:
+        """Return the lock guarding one symbol's files"""
+        key = (symbol.upper(), interval)
+        with self._locks_guard:
+            if key not in self._locks:
+                self._locks[key] = threading.RLock()
+            return self._locks[key]
+
+    @staticmethod
+    @contextmanager
+    def _file_lock(symbol_dir: Path):
+        """Exclusive lock on a symbol directory shared by every process using the store"""
+        if fcntl is None:
+            yield
+            return
+        with open(symbol_dir / '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _symbol_dir(self, symbol: str, interval: str) -> Path:
+        return self.root / interval / symbol.upper().replace(os.sep, '_')
+
+    def read_meta(self, symbol: str, interval: str = '1d') -> Dict:
+        """Read the meta file of a symbol, empty dict if nothing is stored"""
+        meta_file = self._symbol_dir(symbol, interval) / 'meta.json'
+        try:
+            return json.loads(meta_file.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable price store meta for {symbol}: {str(e)}")
+            return {}
+
+    def _write_meta(self, symbol: str, interval: str, meta: Dict):
+        meta_file = self._symbol_dir(symbol, interval) / 'meta.json'
+        tmp_file = meta_file.with_suffix('.tmp')
+        tmp_file.write_text(json.dumps(meta), encoding='utf-8')
+        os.replace(tmp_file, meta_file)
+
+    def series(self, symbol: str, interval: str = '1d',
+               start_ts: Optional[int] = None, end_ts: Optional[int] = None) -> Optional[PriceSeries]:
+        """Memory-map stored bars whose timestamp lies in [start_ts, end_ts]"""
+        with self.lock(symbol, interval):
+            meta = self.read_meta(symbol, interval)
+            if not meta.get('rows'):
+                return None
+
+            # 版本目录写入后不再修改，映射后无需持有锁
+            data_dir = self._symbol_dir(symbol, interval) / str(meta['version'])
+            timestamps = np.load(data_dir / 'timestamp.npy', mmap_mode='r')
+            columns = {}
+            for column, name in self.COLUMNS.items():
+                column_file = data_dir / f'{name}.npy'
+                if column_file.exists():
+                    columns[column] = np.load(column_file, mmap_mode='r')
+
+        return PriceSeries(symbol.upper(), meta['version'], timestamps, columns).slice(start_ts, end_ts)
+
+    def load(self, symbol: str, interval: str = '1d',
+             start_ts: Optional[int] = None, end_ts: Optional[int] = None) -> Optional[pd.DataFrame]:
+        """Load stored bars whose timestamp lies in [start_ts, end_ts] into a writable DataFrame"""
+        series = self.series(symbol, interval, start_ts, end_ts)
+        return series.to_frame(copy=True) if series is not None else None
+
+    def write(self, symbol: str, frame: pd.DataFrame, interval: str = '1d',
+              covered: Optional[Tuple[Optional[int], int]] = None, replace: bool = False):
+        """Merge freshly downloaded bars into the store.
+
+        ``covered`` is the (start, end) window the download asked for; a
+        ``None`` start means the full history was requested. The window must
+        touch the stored coverage, which is what ``missing_ranges`` returns.
+        With ``replace`` the stored bars and coverage are discarded and
+        replaced by ``frame`` (see ``adjusted_since``).
+        """
+        symbol_dir = self._symbol_dir(symbol, interval)
+        symbol_dir.mkdir(parents=True, exist_ok=True)
+        # 线程锁保护本进程，文件锁保护其他进程的并发写入（版本号递增和meta更新）
+        with self.lock(symbol, interval), self._file_lock(symbol_dir):
+            meta = self.read_meta(symbol, interval)
+
+            existing = None if replace else self.load(symbol, interval)
+            merged = frame if existing is None else pd.concat([existing, frame])
+            merged = merged.loc[~merged.index.duplicated(keep='last')].sort_index()
+            if self.compact:
+                merged = self._to_compact_dtypes(merged)
+
+            timestamps = merged.index.values.astype('datetime64[s]').astype(np.int64)
+
+            # 数据没有变化时只更新覆盖区间，不生成新版本
+            changed = existing is None or not merged.equals(existing)
+            if changed and not merged.empty:
+                version = meta.get('version', 0) + 1
+                data_dir = symbol_dir / str(version)
+                data_dir.mkdir(exist_ok=True)
+
+                np.save(data_dir / 'timestamp.npy', timestamps)
+                for column, name in self.COLUMNS.items():
+                    if column in merged:
+                        np.save(data_dir / f'{name}.npy', merged[column].to_numpy())
+
+                meta.update({
+                    'version': version,
+                    'rows': len(merged),
+                    'first_ts': int(timestamps[0]),
+                    'last_ts': int(timestamps[-1])
+                })
+
+            if replace:
+                meta.pop('covered', None)
+                meta['gaps'] = []
+            self._update_gaps(meta, timestamps, interval, covered)
+            if covered is not None:
+                meta['covered'] = self._merge_covered(meta.get('covered'), covered)
+            meta['updated_at'] = int(time.time())
+            self._write_meta(symbol, interval, meta)
+
+            if 'version' in meta:
+                self._prune(symbol_dir, meta['version'], self.prune_grace)
+
+    def adjusted_since(self, symbol: str, frame: pd.DataFrame, interval: str = '1d') -> bool:
+        """Whether freshly downloaded bars show the stored history has been adjusted since it was written.
+
+        Upstream prices are split adjusted and adjusted closes also account
+        for dividends, so a corporate action rewrites bars that are already
+        stored. That is the case when ``frame.attrs['splits']`` (split dates
+        parsed from the chart events) has a split after the last stored bar,
+        when a bar present in both differs in close (except the last stored
+        one, which may have still been forming), or when the Adj Close to
+        Close ratio differs on a bar present in both.
+        """
+        meta = self.read_meta(symbol, interval)
+        last_ts = meta.get('last_ts')
+        if last_ts is None or frame.empty:
+            return False
+        if any(split > last_ts for split in frame.attrs.get('splits', ())):
+            return True
+
+        timestamps = frame.index.values.astype('datetime64[s]').astype(np.int64)
+        stored = self.series(symbol, interval, start_ts=int(timestamps[0]), end_ts=int(timestamps[-1]))
+        if stored is None:
+            return False
+        _, fetched_idx, stored_idx = np.intersect1d(timestamps, stored.timestamps, return_indices=True)
+        if not len(stored_idx):
+            return False
+
+        # 紧凑存储为float32，比较时留出精度误差
+        def differs(fetched, kept):
+            return not np.allclose(fetched, kept, rtol=1e-5, equal_nan=True)
+
+        settled = stored.timestamps[stored_idx] < last_ts
+        fetched_close = frame['Close'].to_numpy(dtype=np.float64)[fetched_idx]
+        stored_close = np.asarray(stored['Close'], dtype=np.float64)[stored_idx]
+        if differs(fetched_close[settled], stored_close[settled]):
+            return True
+        if 'Adj Close' in frame and 'Adj Close' in stored:
+            fetched_ratio = frame['Adj Close'].to_numpy(dtype=np.float64)[fetched_idx] / fetched_close
+            stored_ratio = np.asarray(stored['Adj Close'], dtype=np.float64)[stored_idx] / stored_close
+            if differs(fetched_ratio, stored_ratio):
+                return True
+        return False
+
+    @staticmethod
+    def _to_compact_dtypes(frame: pd.DataFrame) -> pd.DataFrame:
+        columns = {}
+        for column in frame.columns:
+            if column == 'Volume' and not frame[column].isna().any():
+                columns[column] = compact_volume(frame[column].to_numpy())
+            else:
+                columns[column] = frame[column].to_numpy(dtype=np.float32)
+        return pd.DataFrame(columns, index=frame.index)
+
+    def missing_ranges(self, symbol: str, start_ts: Optional[int], end_ts: int,
+                       interval: str = '1d') -> List[Tuple[Optional[int], int]]:
+        """Return the (start, end) windows that must be downloaded to serve a request.
+
+        A ``None`` start means the full history. Returned windows always touch
+        the stored coverage so that it stays one contiguous block. The tail is
+        topped up from the last stored bar so that a bar still forming when it
+        was downloaded gets revised, and known holes inside the coverage are
+        requested on their own instead of refetching the whole range.
+        """
+        meta = self.read_meta(symbol, interval)
+        covered = meta.get('covered')
+        if not covered:
+            return [(start_ts, end_ts)]
+
+        cov_start, cov_end = covered
+        ranges = []
+        if cov_start is not None and (start_ts is None or start_ts < cov_start):
+            ranges.append((start_ts, cov_start))
+        for gap_start, gap_end in meta.get('gaps', []):
+            if (start_ts is None or gap_end >= start_ts) and gap_start <= end_ts:
+                ranges.append((gap_start, gap_end))
+        if end_ts - cov_end > self.max_age:
+            ranges.append((min(cov_end, meta.get('last_ts', cov_end)), end_ts))
+        return ranges
+
+    def _update_gaps(self, meta: Dict, timestamps: np.ndarray, interval: str,
+                     covered: Optional[Tuple[Optional[int], int]]):
+        """Record holes between stored bars so they can be repaired later.
+
+        A hole that is still there after its window was downloaded again is a
+        real market closure and is remembered as verified.
+        """
+        limit = self.GAP_SECONDS.get(interval)
+        if limit is None or len(timestamps) < 2:
+            return
+
+        verified = meta.get('verified_gaps', [])
+        refetched = []
+        if covered is not None:
+            cov_start, cov_end = covered
+            refetched = [
+                gap for gap in meta.get('gaps', [])
+                if (cov_start is None or cov_start <= gap[0]) and gap[1] <= cov_end
+            ]
+
+        gaps = []
+        for i in np.nonzero(np.diff(timestamps) > limit)[0]:
+            gap = [int(timestamps[i]), int(timestamps[i + 1])]
+            if gap in verified:
+                continue
+            if gap in refetched:
+                verified.append(gap)
+            else:
+                gaps.append(gap)
+
+        meta['gaps'] = gaps
+        meta['verified_gaps'] = verified
+
+    @staticmethod
+    def _merge_covered(covered, window):
+        if not covered:
+            return list(window)
+        cov_start, cov_end = covered
+        start, end = window
+        merged_start = None if cov_start is None or start is None else min(cov_start, start)
+        return [merged_start, max(cov_end, end)]
+
+    @staticmethod
+    def _prune(symbol_dir: Path, keep_version: int, grace: int):
+        """Remove version directories superseded more than ``grace`` seconds ago.
+
+        A version counts as superseded when the next newer version directory
+        was written, so readers that picked it from the meta file just before
+        the flip still find its files.
+        """
+        versions = sorted(
+            int(child.name) for child in symbol_dir.iterdir()
+            if child.is_dir() and child.name.isdigit() and int(child.name) <= keep_version
+        )
+        now = time.time()
+        for version, newer in zip(versions, versions[1:]):
+            try:
+                superseded_at = (symbol_dir / str(newer)).stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if now - superseded_at >= grace:
+                shutil.rmtree(symbol_dir / str(version), ignore_errors=True)
+
+
+# Create a singleton instance
+price_store = PriceStore()
@@ -0,0 +1,228 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pytz
+from cachetools import TTLCache
+
+from .market_data import market_data, parse_quotes, MarketDataError
+from .price_store import price_store
+from .report_cache import market_is_open, last_session_close
+from .symbol_index import symbol_index
+
+logger = logging.getLogger(__name__)
+
+# 列式行情响应中的字段
+QUOTE_FIELDS = ('price', 'change', 'change_percent', 'volume', 'day_high', 'day_low', 'timestamp')
+
+
+def normalize_symbols(symbols) -> List[str]:
+    """Upper-case, de-duplicated symbols in input order.
+
+    Accepts a list or a comma/whitespace separated string, as pasted from a
+    broker's position export.
+    """
+    if isinstance(symbols, str):
+        symbols = symbols.replace(',', ' ').split()
+    seen = {}
+    for symbol in symbols or []:
+        symbol = str(symbol).strip().upper()
+        if symbol:
+            seen.setdefault(symbol, None)
+    return list(seen)
+
+
+class QuoteService:
+    """Batched quotes and symbol validation.
+
+    Symbols are resolved against the local symbol universe and the price
+    store first. Only the remaining ones go upstream, in batches of
+    ``batch_size`` symbols per request. Upstream answers, including "not
+    found", are kept for ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl: Optional[int] = None, batch_size: Optional[int] = None, maxsize: int = 5000):
+        self.ttl = ttl if ttl is not None else int(os.getenv('QUOTE_CACHE_TTL', '60'))
+        self.batch_size = batch_size or int(os.getenv('QUOTE_BATCH_SIZE', '20'))
+        self._cache = TTLCache(maxsize=maxsize, ttl=self.ttl)
+        self._lock = threading.Lock()
+
+    def get_quotes(self, symbols: Iterable[str]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+        """Return (quotes, errors) for the symbols, going upstream only for uncached ones"""
+        symbols = normalize_symbols(list(symbols))
+        quotes, errors, missing = {}, {}, []
+
+        with self._lock:
+            for symbol in symbols:
+                if symbol not in self._cache:
+                    missing.append(symbol)
+                elif self._cache[symbol] is None:
+                    errors[symbol] = "Symbol not found"
+                else:
+                    quotes[symbol] = self._cache[symbol]
+
+        for i in range(0, len(missing), self.batch_size):
+            batch = missing[i:i + self.batch_size]
+            try:
+                fetched = parse_quotes(market_data.get_quotes(batch))
+            except MarketDataError as e:
+                logger.error(f"Error fetching quotes for {len(batch)} symbols: {str(e)}")
+                for symbol in batch:
+                    errors[symbol] = str(e)
+                continue
+
+            with self._lock:
+                for symbol in batch:
+                    self._cache[symbol] = fetched.get(symbol)
+            for symbol in batch:
+                if symbol in fetched:
+                    quotes[symbol] = fetched[symbol]
+                else:
+                    errors[symbol] = "Symbol not found"
+
+        return quotes, errors
+
+    def validate(self, symbols, quote_missing: bool = False) -> Dict[str, Any]:
+        """Validate many symbols at once.
+
+        Returns ``results`` in input order, each with ``valid``, ``name``,
+        ``price`` and the ``source`` that resolved it (local, store or
+        upstream), plus the list of ``invalid`` symbols. Known symbols
+        without a stored price get ``price`` None unless ``quote_missing``
+        is set, in which case they join the upstream batch.
+        """
+        symbols = normalize_symbols(symbols)
+        results: Dict[str, Dict[str, Any]] = {}
+        unknown = []
+
+        for symbol in symbols:
+            listing = symbol_index.get(symbol)
+            price = self.stored_close(symbol)
+            if price is None and (listing is None or quote_missing):
+                unknown.append(symbol)
+                continue
+            results[symbol] = {
+                'symbol': symbol,
+                'valid': True,
+                'name': listing['name'] if listing else '',
+                'exchange': listing['exchange'] if listing else '',
+                'price': price,
+                'source': 'local' if listing else 'store'
+            }
+
+        if unknown:
+            logger.info(f"Validating {len(unknown)} unknown symbols upstream")
+            quotes, errors = self.get_quotes(unknown)
+            for symbol in unknown:
+                quote = quotes.get(symbol)
+                listing = symbol_index.get(symbol)
+                if quote is None and listing is not None:
+                    results[symbol] = {
+                        'symbol': symbol, 'valid': True, 'name': listing['name'],
+                        'exchange': listing['exchange'], 'price': None, 'source': 'local'
+                    }
+                    continue
+                if quote is None:
+                    results[symbol] = {'symbol': symbol, 'valid': False, 'error': errors.get(symbol, "Symbol not found")}
+                    continue
+                results[symbol] = {
+                    'symbol': symbol,
+                    'valid': True,
+                    'name': listing['name'] if listing else quote['name'],
+                    'exchange': listing['exchange'] if listing else quote['exchange'],
+                    'price': quote['price'],
+                    'source': 'upstream'
+                }
+
+        ordered = [results[symbol] for symbol in symbols]
+        return {
+            'results': ordered,
+            'invalid': [result['symbol'] for result in ordered if not result['valid']]
+        }
+
+    def bulk_quotes(self, symbols) -> Dict[str, Any]:
+        """Columnar quotes for many symbols.
+
+        Each field in QUOTE_FIELDS maps to a list aligned with ``symbols``;
+        ``source`` tells whether a row came from the price store or the
+        upstream batch, and ``errors`` holds the symbols that resolved to
+        nothing (their rows are None).
+        """
+        symbols = normalize_symbols(symbols)
+        rows: Dict[str, Dict[str, Any]] = {}
+        stale: Dict[str, Dict[str, Any]] = {}
+
+        for symbol in symbols:
+            quote = self.stored_quote(symbol)
+            if quote is None:
+                continue
+            if self.is_fresh(quote['covered_until']):
+                rows[symbol] = dict(quote, source='store')
+            else:
+                stale[symbol] = quote
+
+        missing = [symbol for symbol in symbols if symbol not in rows]
+        errors = {}
+        if missing:
+            quotes, errors = self.get_quotes(missing)
+            for symbol in missing:
+                if symbol in quotes:
+                    rows[symbol] = dict(quotes[symbol], source='upstream')
+                elif symbol in stale:
+                    # 上游失败时退回本地的旧数据
+                    rows[symbol] = dict(stale[symbol], source='store')
+                    errors.pop(symbol, None)
+
+        columns: Dict[str, Any] = {'symbols': symbols}
+        for field in QUOTE_FIELDS + ('source',):
+            columns[field] = [rows[symbol][field] if symbol in rows else None for symbol in symbols]
+        columns['errors'] = errors
+        return columns
+
+    def is_fresh(self, covered_until: int, now: Optional[float] = None) -> bool:
+        """Whether stored bars covering up to ``covered_until`` can stand in for a live quote"""
+        now = now if now is not None else time.time()
+        if now - covered_until <= price_store.max_age:
+            return True
+        now_dt = datetime.fromtimestamp(now, tz=pytz.utc)
+        # 休市期间，收盘后同步过的数据就是最新行情
+        return not market_is_open(now_dt) and covered_until >= last_session_close(now_dt).timestamp()
+
+    @staticmethod
+    def stored_quote(symbol: str) -> Optional[Dict[str, Any]]:
+        """Quote built from the last two stored daily bars, None if the symbol was never fetched"""
+        try:
+            meta = price_store.read_meta(symbol)
+            series = price_store.series(symbol)
+        except Exception as e:
+            logger.warning(f"Error reading stored prices for {symbol}: {str(e)}")
+            return None
+        if series is None or len(series) == 0:
+            return None
+
+        bars = series.tail(2)
+        price = float(bars['Close'][-1])
+        previous_close = float(bars['Close'][0]) if len(bars) > 1 else None
+        change = price - previous_close if previous_close else None
+        return {
+            'price': price,
+            'change': change,
+            'change_percent': change / previous_close * 100 if change is not None else None,
+            'volume': int(bars['Volume'][-1]),
+            'day_high': float(bars['High'][-1]),
+            'day_low': float(bars['Low'][-1]),
+            'timestamp': int(bars.timestamps[-1]),
+            'covered_until': (meta.get('covered') or [None, 0])[1]
+        }
+
+    def stored_close(self, symbol: str) -> Optional[float]:
+        """Last close held in the local price store, None if the symbol was never fetched"""
+        quote = self.stored_quote(symbol)
+        return quote['price'] if quote is not None else None
+
+
+# Create a singleton instance
+quote_service = QuoteService()
@@ -0,0 +1,41 @@
+import os
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting how fast we hit an upstream API.
+
+    Tokens refill continuously at ``rate`` per second up to ``capacity``;
+    ``acquire`` blocks until enough tokens are available.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until ``tokens`` can be taken from the bucket"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# Shared by every Yahoo Finance request made by the backend
+yahoo_rate_limiter = TokenBucket(
+    rate=float(os.getenv('YAHOO_RATE_LIMIT', '4')),
+    capacity=float(os.getenv('YAHOO_RATE_BURST', '8'))
+)
@@ -0,0 +1,124 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import pytz
+from cachetools import LRUCache
+
+from .singleflight import single_flight
+
+logger = logging.getLogger(__name__)
+
+MARKET_TZ = pytz.timezone('America/New_York')
+MARKET_OPEN = (9, 30)
+MARKET_CLOSE = (16, 0)
+
+
+def market_is_open(now: datetime) -> bool:
+    """Whether a regular US session is running (exchange holidays are not modelled)"""
+    local = now.astimezone(MARKET_TZ)
+    if local.weekday() >= 5:
+        return False
+    return MARKET_OPEN <= (local.hour, local.minute) < MARKET_CLOSE
+
+
+def last_session_close(now: datetime) -> datetime:
+    """The most recent regular session close at or before ``now``"""
+    local = now.astimezone(MARKET_TZ)
+    day = local.date()
+    while True:
+        close = MARKET_TZ.localize(datetime(day.year, day.month, day.day, *MARKET_CLOSE))
+        if day.weekday() < 5 and close <= local:
+            return close
+        day -= timedelta(days=1)
+
+
+class ReportCache:
+    """Stale-while-revalidate cache for computed analysis reports.
+
+    The last computed report is returned immediately together with its age.
+    Once it is older than ``ttl`` a background refresh is scheduled, so the
+    number of upstream calls is bounded by the number of symbols rather than
+    by dashboard traffic. Refreshes follow market sessions: while the market
+    is closed a report computed after the last close stays fresh until the
+    next open.
+    """
+
+    def __init__(self, ttl: Optional[int] = None, maxsize: int = 1000, max_workers: int = 2):
+        self.ttl = ttl if ttl is not None else int(os.getenv('REPORT_CACHE_TTL', '300'))
+        self._entries = LRUCache(maxsize=maxsize)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='report-refresh')
+
+    def is_stale(self, computed_at: float, now: Optional[float] = None) -> bool:
+        now = now if now is not None else time.time()
+        if now - computed_at < self.ttl:
+            return False
+
+        now_dt = datetime.fromtimestamp(now, tz=pytz.utc)
+        if not market_is_open(now_dt):
+            # 休市期间，收盘后生成的报告一直有效
+            return computed_at < last_session_close(now_dt).timestamp()
+        return True
+
+    def get(self, key: Hashable, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Return the cached report for ``key``, computing it on first use.
+
+        The returned dict carries ``cache_age`` (seconds) and ``stale``.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is None:
+            report, computed_at = single_flight.do(('report', key), self._compute, key, compute)
+            return self._annotate(report, computed_at, stale=False)
+
+        report, computed_at = entry
+        stale = self.is_stale(computed_at)
+        if stale:
+            self._schedule_refresh(key, compute)
+        return self._annotate(report, computed_at, stale)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _compute(self, key: Hashable, compute: Callable[[], Dict[str, Any]]):
+        report = compute()
+        computed_at = time.time()
+        # 出错的报告不缓存，下次请求重新计算
+        if not (isinstance(report, dict) and 'error' in report):
+            with self._lock:
+                self._entries[key] = (report, computed_at)
+        return report, computed_at
+
+    def _schedule_refresh(self, key: Hashable, compute: Callable[[], Dict[str, Any]]):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        self._executor.submit(self._refresh, key, compute)
+
+    def _refresh(self, key: Hashable, compute: Callable[[], Dict[str, Any]]):
+        try:
+            self._compute(key, compute)
+        except Exception as e:
+            logger.error(f"Background refresh of report {key} failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    @staticmethod
+    def _annotate(report: Dict[str, Any], computed_at: float, stale: bool) -> Dict[str, Any]:
+        if not isinstance(report, dict):
+            return report
+        return dict(report, cache_age=round(time.time() - computed_at, 1), stale=stale)
+
+
+# Create a singleton instance
+report_cache = ReportCache()
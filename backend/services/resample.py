@@ -0,0 +1,239 @@
+"""Higher-timeframe bars built from stored base bars.
+
+Weekly, monthly and other aggregates are derived from the daily (or
+intraday) bars already in the price store, so no timeframe needs its own
+upstream download. Supported rules:
+
+* ``'15m'``, ``'1h'``, ``'4h'``, ``'1d'`` ... - fixed-width UTC buckets
+* ``'W'`` - weeks ending on Friday, labelled with the Friday
+* ``'M'``, ``'Q'``, ``'Y'`` - calendar months, quarters and years,
+  labelled with their last day
+* ``'<n>B'`` - every ``n`` base bars, counted from the first one
+
+``BarResampler`` caches the aggregates of each symbol and, when new base
+bars arrive, re-aggregates only the last (possibly still forming) bucket
+and the ones after it.
+"""
+import logging
+import os
+import re
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from cachetools import LRUCache
+
+from .price_store import PriceSeries
+
+logger = logging.getLogger(__name__)
+
+# 固定宽度周期的单位秒数
+UNIT_SECONDS = {'m': 60, 'h': 3600, 'd': 86400}
+
+# 按自然月分桶的规则 -> 每桶月数
+MONTH_RULES = {'M': 1, 'Q': 3, 'Y': 12}
+
+# 各列的聚合方式
+AGGREGATIONS = {
+    'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last',
+    'Adj Close': 'last', 'Volume': 'sum'
+}
+
+_RULE_PATTERN = re.compile(r'^(\d+)([mhdB])$')
+
+
+def parse_rule(rule: str) -> Tuple[str, int]:
+    """Split a rule into (kind, size); raises ValueError for unknown rules"""
+    if rule == 'W':
+        return 'W', 1
+    if rule in MONTH_RULES:
+        return 'M', MONTH_RULES[rule]
+    match = _RULE_PATTERN.match(rule or '')
+    if match and int(match.group(1)) > 0:
+        size, unit = int(match.group(1)), match.group(2)
+        return ('B', size) if unit == 'B' else ('fixed', size * UNIT_SECONDS[unit])
+    raise ValueError(f"Unsupported resample rule: {rule}")
+
+
+def bucket_keys(timestamps: np.ndarray, rule: str, offset: int = 0) -> np.ndarray:
+    """Bucket number of each timestamp; equal keys form one aggregated bar.
+
+    ``offset`` is the position of ``timestamps[0]`` in the base series,
+    needed by the bar-count rule.
+    """
+    kind, size = parse_rule(rule)
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if kind == 'fixed':
+        return timestamps // size
+    if kind == 'B':
+        return (np.arange(len(timestamps)) + offset) // size
+    days = timestamps // 86400
+    if kind == 'W':
+        # 1970-01-01是周四；每周从周六起到周五止，周末归入下一周
+        return (days + 5) // 7
+    months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    return months // size
+
+
+def bucket_labels(keys: np.ndarray, rule: str, first_ts: Optional[np.ndarray] = None) -> np.ndarray:
+    """Timestamp labelling each bucket: its start for fixed rules, its last day for calendar ones"""
+    kind, size = parse_rule(rule)
+    keys = np.asarray(keys, dtype=np.int64)
+    if kind == 'fixed':
+        return keys * size
+    if kind == 'B':
+        # 按根数聚合时以首根K线的时间标记
+        return np.asarray(first_ts, dtype=np.int64)
+    if kind == 'W':
+        return (keys * 7 + 1) * 86400
+    next_start = ((keys + 1) * size).astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+    return (next_start - 1) * 86400
+
+
+def label_at(timestamps: np.ndarray, position: int, rule: str) -> int:
+    """Label of the bucket that base bar ``position`` falls into"""
+    kind, size = parse_rule(rule)
+    if kind == 'B':
+        return int(timestamps[position // size * size])
+    keys = bucket_keys(timestamps[position:position + 1], rule)
+    return int(bucket_labels(keys, rule)[0])
+
+
+def aggregate(timestamps: np.ndarray, columns: Dict[str, np.ndarray], rule: str,
+              offset: int = 0) -> Tuple[np.ndarray, Dict[str, np.ndarray], np.ndarray]:
+    """Aggregate sorted base bars by ``rule``.
+
+    Returns (labels, columns, starts) where ``starts`` holds the position
+    of each bucket's first base bar. Missing values are ignored.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if len(timestamps) == 0:
+        empty = {column: np.empty(0) for column in columns if column in AGGREGATIONS}
+        return np.empty(0, dtype=np.int64), empty, np.empty(0, dtype=np.int64)
+
+    keys = bucket_keys(timestamps, rule, offset)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(timestamps)] - 1
+
+    out = {}
+    for column, values in columns.items():
+        how = AGGREGATIONS.get(column)
+        if how is None:
+            continue
+        values = np.asarray(values, dtype=np.float64)
+        if how == 'first':
+            out[column] = values[starts]
+        elif how == 'last':
+            out[column] = values[ends]
+        elif how == 'max':
+            out[column] = np.fmax.reduceat(values, starts)
+        elif how == 'min':
+            out[column] = np.fmin.reduceat(values, starts)
+        else:
+            out[column] = np.add.reduceat(np.nan_to_num(values), starts)
+
+    return bucket_labels(keys[starts], rule, timestamps[starts]), out, starts
+
+
+class _Aggregate:
+    """Cached aggregates of one base series plus what is needed to extend them"""
+
+    __slots__ = ('version', 'first_ts', 'base_rows', 'last_base_ts', 'last_start', 'series')
+
+    def __init__(self, version, first_ts, base_rows, last_base_ts, last_start, series):
+        self.version = version
+        self.first_ts = first_ts
+        self.base_rows = base_rows
+        self.last_base_ts = last_base_ts
+        # 最后一个桶的首根K线在基础序列中的位置，新数据从这里重新聚合
+        self.last_start = last_start
+        self.series = series
+
+
+class BarResampler:
+    """Resamples PriceSeries into higher timeframes, caching the results.
+
+    An aggregate is reused as long as the base series keeps its first bar
+    and still contains the last bar seen; only the last bucket and anything
+    newer is re-aggregated. Other changes (history extended backwards,
+    rewritten bars) rebuild the aggregate.
+    """
+
+    def __init__(self, maxsize: Optional[int] = None):
+        maxsize = maxsize or int(os.getenv('RESAMPLE_CACHE_SIZE', '512'))
+        self._cache = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+        self.extensions = 0
+
+    def resample(self, series: PriceSeries, rule: str, interval: str = '1d') -> PriceSeries:
+        """Aggregate ``series`` by ``rule``; the result is read-only and may be shared"""
+        parse_rule(rule)
+        key = (series.symbol, interval, rule)
+        with self._lock:
+            cached = self._cache.get(key)
+
+        if cached is not None and cached.version == series.version and cached.base_rows == len(series):
+            return cached.series
+
+        timestamps = np.asarray(series.timestamps)
+        if len(timestamps) == 0:
+            labels, columns, _ = aggregate(timestamps, series.columns, rule)
+            return PriceSeries(series.symbol, series.version, labels, columns)
+
+        if self._extends(cached, timestamps):
+            entry = self._extend(cached, series, rule)
+            self.extensions += 1
+        else:
+            entry = self._build(series, rule)
+            self.rebuilds += 1
+
+        with self._lock:
+            self._cache[key] = entry
+        return entry.series
+
+    @staticmethod
+    def _extends(cached: Optional[_Aggregate], timestamps: np.ndarray) -> bool:
+        return (
+            cached is not None
+            and int(timestamps[0]) == cached.first_ts
+            and len(timestamps) >= cached.base_rows
+            and int(timestamps[cached.base_rows - 1]) == cached.last_base_ts
+        )
+
+    def _build(self, series: PriceSeries, rule: str) -> _Aggregate:
+        labels, columns, starts = aggregate(series.timestamps, series.columns, rule)
+        return self._entry(series, labels, columns, int(starts[-1]))
+
+    def _extend(self, cached: _Aggregate, series: PriceSeries, rule: str) -> _Aggregate:
+        start = cached.last_start
+        tail = series.window(start, None)
+        labels, columns, starts = aggregate(tail.timestamps, tail.columns, rule, offset=start)
+
+        # 保留最后一个桶之前已完成的K线，替换最后一个桶及之后的部分
+        keep = len(cached.series) - 1
+        labels = np.concatenate([cached.series.timestamps[:keep], labels])
+        columns = {
+            column: np.concatenate([cached.series[column][:keep], values])
+            for column, values in columns.items()
+        }
+        return self._entry(series, labels, columns, start + int(starts[-1]))
+
+    @staticmethod
+    def _entry(series: PriceSeries, labels: np.ndarray, columns: Dict[str, np.ndarray],
+               last_start: int) -> _Aggregate:
+        # 聚合结果被多处共享，设为只读
+        for values in (labels, *columns.values()):
+            values.flags.writeable = False
+        return _Aggregate(
+            series.version, int(series.timestamps[0]), len(series), int(series.timestamps[-1]),
+            last_start, PriceSeries(series.symbol, series.version, labels, columns)
+        )
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+# Create a singleton instance
+bar_resampler = BarResampler()
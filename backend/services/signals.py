@@ -0,0 +1,223 @@
+"""Report signals evaluated on the tail of a price history.
+
+Each signal declares the columns it reads and the number of trailing bars
+(``lookback``) its result depends on. Only that tail is converted to NumPy
+arrays, so evaluating a signal costs the same for a 5-day frame as for a
+20-year one. Signals accept anything indexable by column name: a
+DataFrame, a PriceSeries, CompactBars or a dict of arrays.
+
+Signals that use indicators get them through ``indicator(name, **params)``.
+For a DataFrame carrying ``symbol`` and ``version`` attrs (see
+``StockAnalyzer.get_stock_data``) these come from ``indicator_cache``,
+computed once on the whole frame and shared with the scanner and the
+indicator endpoints; otherwise they are computed on the signal's tail.
+"""
+import logging
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .indicator_cache import INDICATORS, frame_key, indicator_cache
+
+logger = logging.getLogger(__name__)
+
+# 一年约252个交易日
+YEAR_BARS = 252
+
+# EMA预热长度：(25/27)^250 约为 4e-9，截断误差可忽略
+EMA_WARMUP = 250
+
+
+class Signal:
+    """A named signal with a declared lookback"""
+
+    def __init__(self, name: str, lookback: int, columns: Sequence[str], function: Callable[..., Any],
+                 with_indicators: bool = False):
+        self.name = name
+        self.lookback = lookback
+        self.columns = tuple(columns)
+        self.function = function
+        self.with_indicators = with_indicators
+
+    def __call__(self, data) -> Any:
+        return self.apply(data, tail(data, self.columns, self.lookback))
+
+    def apply(self, data, bars: Dict[str, np.ndarray]) -> Any:
+        """Call the function on ``bars``, tails of ``data`` at least ``lookback`` long"""
+        arrays = {column.lower(): bars[column.lower()][-self.lookback:] for column in self.columns}
+        if self.with_indicators:
+            arrays['indicator'] = _indicator_source(data, arrays, self.lookback)
+        return self.function(**arrays)
+
+
+SIGNALS: Dict[str, Signal] = {}
+
+
+def signal(name: str, lookback: int, columns: Sequence[str], with_indicators: bool = False):
+    """Register a function of lower-cased column arrays as a signal.
+
+    With ``with_indicators`` the function is also passed ``indicator``.
+    """
+    def register(function):
+        SIGNALS[name] = Signal(name, lookback, columns, function, with_indicators)
+        return SIGNALS[name]
+    return register
+
+
+def tail(data, columns: Iterable[str], lookback: int) -> Dict[str, np.ndarray]:
+    """The last ``lookback`` bars of each column as float64 arrays, keyed by lower-cased name"""
+    return {
+        column.lower(): np.asarray(np.asarray(data[column])[-lookback:], dtype=np.float64)
+        for column in columns
+    }
+
+
+def evaluate(data, names: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """Evaluate several signals, extracting the longest tail they need only once"""
+    selected = [SIGNALS[name] for name in (names or SIGNALS)]
+    columns = {column for item in selected for column in item.columns}
+    bars = tail(data, columns, max(item.lookback for item in selected))
+    return {item.name: item.apply(data, bars) for item in selected}
+
+
+def _indicator_source(data, arrays: Dict[str, np.ndarray], lookback: int) -> Callable[..., Any]:
+    """``indicator(name, **params)``: an INDICATORS entry over the last ``lookback`` bars"""
+    keyed = isinstance(data, pd.DataFrame) and frame_key(data) is not None
+
+    def indicator(name: str, **params: Any):
+        if keyed:
+            result = indicator_cache.compute(data, name, **params)
+        else:
+            function, columns = INDICATORS[name]
+            result = function(*(arrays[column.lower()] for column in columns), **params)
+        if isinstance(result, tuple):
+            return tuple(values[-lookback:] for values in result)
+        return result[-lookback:]
+
+    return indicator
+
+
+@signal('volume_alert', lookback=5, columns=('Volume',))
+def abnormal_volume(volume):
+    """成交量异动检测"""
+    avg_volume = volume.mean() if len(volume) >= 5 else np.nan
+    latest_volume = volume[-1]
+
+    if latest_volume > avg_volume * 2:
+        return "成交量突破：当前成交量是5日均值的2倍以上"
+    elif latest_volume < avg_volume * 0.5:
+        return "交易清淡：当前成交量不足5日均值一半"
+    else:
+        return "成交量处于正常波动区间"
+
+
+@signal('technical_signals', lookback=EMA_WARMUP, columns=('Close',), with_indicators=True)
+def technical_signals(close, indicator):
+    """生成技术信号"""
+    signals = []
+
+    # 计算MACD
+    macd, macd_signal, _ = indicator('macd')
+
+    if macd[-1] > macd_signal[-1] and macd[-2] <= macd_signal[-2]:
+        signals.append("MACD金叉")
+    elif macd[-1] < macd_signal[-1] and macd[-2] >= macd_signal[-2]:
+        signals.append("MACD死叉")
+
+    # 计算RSI
+    rsi = indicator('rsi', period=14)
+
+    if rsi[-1] > 70:
+        signals.append(f"RSI超买 ({rsi[-1]:.1f})")
+    elif rsi[-1] < 30:
+        signals.append(f"RSI超卖 ({rsi[-1]:.1f})")
+
+    return signals
+
+
+def _returns(close: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = close[1:] / close[:-1] - 1
+    return returns[~np.isnan(returns)]
+
+
+# 波动率阈值按最近一年的收益率计算
+@signal('volatility_alert', lookback=YEAR_BARS + 1, columns=('Close',))
+def volatility_cluster(close):
+    """波动率聚类分析"""
+    returns = _returns(close)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        threshold = returns.std(ddof=1) * 1.5 if len(returns) > 1 else np.nan
+
+    clusters = np.abs(returns[-5:]) > threshold
+    if clusters.sum() >= 3:
+        return "波动率聚集预警：近期出现3次以上异常波动"
+    return "波动率正常"
+
+
+# OBV变化按最近一年OBV绝对值的均值归一化
+@signal('money_flow', lookback=YEAR_BARS + 1, columns=('High', 'Low', 'Close', 'Volume'), with_indicators=True)
+def money_flow(high, low, close, volume, indicator):
+    """
+    更敏感的资金流向分析，快速响应市场变化
+    """
+    try:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # 计算价格变化率、成交量变化率
+            current_price_change = (close[-1] / close[-2] - 1) * 100
+            current_volume_change = (volume[-1] / volume[-2] - 1) * 100
+
+            # 计算 MFI（使用更短的周期）
+            current_mfi = indicator('mfi', period=10)[-1]
+
+            # 计算 OBV 和短期变化（缩短为3天），从一年窗口的起点重新累计
+            obv = indicator('obv')
+            obv = obv - obv[0] + volume[0]
+            obv_change = obv[-1] - obv[-4] if len(obv) >= 4 else np.nan
+            current_obv_change = obv_change / np.nanmean(np.abs(obv)) * 100
+
+        # 更敏感的上涨特征判断
+        is_strong_uptrend = (
+            current_price_change > 2 and  # 降低到2%
+            current_volume_change > 30 and  # 降低到30%
+            current_obv_change > 3  # 降低到3%
+        )
+
+        # 更敏感的下跌特征判断
+        is_strong_downtrend = (
+            current_price_change < -2 and  # 提高到-2%
+            current_volume_change > 30 and  # 降低到30%
+            current_obv_change < -3  # 提高到-3%
+        )
+
+        # 综合分析（更敏感的判断标准）
+        if is_strong_uptrend:
+            if current_mfi > 70:  # 降低阈值
+                return "主力资金大量涌入：强势上涨"
+            else:
+                return "资金加速流入：看涨信号"
+        elif is_strong_downtrend:
+            if current_mfi < 30:  # 提高阈值
+                return "资金加速流出：看空信号"
+            else:
+                return "资金持续流出：注意风险"
+        else:
+            if current_mfi > 70 and current_obv_change < -3:
+                return "资金流出警告：获利回吐"
+            elif current_mfi < 30 and current_obv_change > 3:
+                return "资金流入信号：低位吸筹"
+            elif current_mfi > 55 and current_obv_change > 2:  # 降低阈值
+                return "资金持续流入：多头占优"
+            elif current_mfi < 45 and current_obv_change < -2:  # 提高阈值
+                return "资金逐步流出：空头占优"
+            elif current_price_change > 0.5 and current_volume_change > 10:  # 更敏感的短期判断
+                return "资金小幅流入：短线看多"
+            elif current_price_change < -0.5 and current_volume_change > 10:
+                return "资金小幅流出：短线谨慎"
+            else:
+                return "资金流向观望：等待信号"
+
+    except Exception as e:
+        logger.error(f"Error in money flow analysis: {str(e)}")
+        return "资金流向分析异常"
@@ -4,106 +4,252 @@ from datetime import datetime, timedelta
 import plotly.graph_objects as go
 from pathlib import Path
 import logging
+import os
 import pytz
-import requests
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
 import yfinance as yf
 import numpy as np
 from fastapi import HTTPException, status
 from typing import Dict, Any, List, Optional
+import operator
+import itertools
+
+from .price_store import price_store, PERIODS
+from .market_data import market_data, MarketDataError
+from .singleflight import single_flight
+from .info_cache import info_cache
+from . import indicators
+from .indicator_cache import indicator_cache
+from . import signals
+from . import resample
+from .resample import bar_resampler
+from . import timeline
+from . import backtest as backtest_engine
+from .portfolio import portfolio_backtester
+from .backtest_cache import backtest_cache
 
 logger = logging.getLogger(__name__)
 
 class StockAnalyzer:
+    # 批量下载时的最大并发数
+    max_workers = int(os.getenv('YAHOO_MAX_WORKERS', '8'))
+
+    # 指标周期 -> 重采样规则（日线不重采样），其他规则见resample模块
+    TIMEFRAMES = {'daily': None, 'weekly': 'W', 'monthly': 'M', 'quarterly': 'Q'}
+
+    # 筛选条件比较符
+    SCREEN_OPERATORS = {
+        '>': operator.gt,
+        '<': operator.lt,
+        '>=': operator.ge,
+        '<=': operator.le,
+        '=': np.isclose,
+        '!=': lambda a, b: ~np.isclose(a, b)
+    }
+
+    # 筛选字段 -> Ticker.info字段，这些条件只对通过行情条件的股票查询
+    SCREEN_INFO_FIELDS = {
+        'marketCap': 'marketCap',
+        'pe': 'trailingPE',
+        'epsGrowth': 'earningsGrowth',
+        'dividendYield': 'dividendYield',
+        'revenueGrowth': 'revenueGrowth'
+    }
+
+    # 由行情计算的筛选字段，与_screening_values的键一致
+    SCREEN_VALUE_FIELDS = (
+        'price', 'volume', 'change', '52WeekHigh', '52WeekLow',
+        'sma_20', 'sma_50', 'sma_200', 'ema_12', 'ema_26', 'macd', 'macd_signal', 'macd_hist',
+        'rsi', 'mfi', 'obv', 'atr', 'donchian_high', 'donchian_low'
+    )
+
     def __init__(self):
         # 创建图表保存目录
         self.charts_dir = Path(__file__).parent.parent / 'static' / 'charts'
         self.charts_dir.mkdir(parents=True, exist_ok=True)
         
-        # 设置请求头
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
-            "Accept": "application/json"
-        }
+        # 行情数据源（实时Yahoo或离线回放），由MARKET_DATA_PROVIDER选择
+        self.provider = market_data
+        # 分钟级数据不落盘，每次下载编一个版本号供指标缓存识别
+        self._downloads = itertools.count(1)
 
-    def get_stock_data(self, ticker, period='1y', start=None, end=None):
-        """使用Yahoo Finance API获取股票数据（支持时间范围或时间段）"""
-        try:
-            sleep(1)
-            # 优先使用明确的时间范围参数
-            use_date_range = start is not None or end is not None
-            
-            # 构建基础URL
-            url = f"https://query1.finance.yahoo.com/v8/finance/chart/{ticker}"
-            params = {
-                "interval": "1d",
-                "includePrePost": True,
-                "events": "div,splits,capitalGains"
-            }
+    def get_stock_data(self, ticker, period='1y', start=None, end=None, interval='1d', copy=True):
+        """使用Yahoo Finance API获取股票数据（支持时间范围或时间段）
 
-            if use_date_range:
-                # 处理日期范围模式
-                start_date = pd.to_datetime(start)
-                end_date = pd.to_datetime(end)
-                
-                # 转换为Unix时间戳（秒）
-                params.update({
-                    "period1": int(start_date.timestamp()),
-                    "period2": int(end_date.timestamp())
-                })
+        日线数据优先从本地价格库读取，只有缺失的时间区间才会请求网络。
+        copy=False 时返回的DataFrame直接引用内存映射文件，只能读不能改。
+        """
+        try:
+            # 分钟级数据变化太快，不落盘，直接按时间段下载；
+            # 并发的相同请求只下载一次，各自拿到副本
+            if interval != '1d':
+                df = single_flight.do(
+                    (ticker.upper(), interval, period),
+                    self._fetch_intraday, ticker, {
+                        "interval": interval,
+                        "range": period,
+                        "includePrePost": False
+                    }
+                )
+                if df is None:
+                    return None
+                df = df.copy()
+                version = df.attrs['version']
             else:
-                # 处理时间段模式
-                period_map = {
-                    '1d': '1d', '5d': '5d', '1mo': '1mo', '3mo': '3mo',
-                    '6mo': '6mo', '1y': '1y', '2y': '2y', '5y': '5y', 'max': 'max'
-                }
-                params["range"] = period_map.get(period, '1y')
+                series = self.get_price_series(ticker, period, start, end)
+                if series is None:
+                    return None
+                df = series.to_frame(copy=copy)
+                version = series.version
 
-            # 发送请求
-            response = requests.get(url, headers=self.headers, params=params)
-            
-            if response.status_code != 200:
-                logger.error(f"获取{ticker}数据失败，状态码: {response.status_code}")
-                return None
-
-            data = response.json()
-            
-            try:
-                chart_data = data['chart']['result'][0]
-                timestamps = chart_data['timestamp']
-                quote = chart_data['indicators']['quote'][0]
-                
-                # 创建DataFrame
-                df = pd.DataFrame({
-                    'Open': quote.get('open', []),
-                    'High': quote.get('high', []),
-                    'Low': quote.get('low', []),
-                    'Close': quote.get('close', []),
-                    'Volume': quote.get('volume', [])
-                }, index=pd.to_datetime(timestamps, unit='s'))
-                
-                # 处理调整后的收盘价
-                if 'adjclose' in chart_data['indicators']:
-                    df['Adj Close'] = chart_data['indicators']['adjclose'][0]['adjclose']
-                
-                # 清理数据：移除NaN和重复索引
-                df = df.dropna().loc[~df.index.duplicated(keep='first')]
-                
-                # 确保时间范围有效性（当使用start/end时）
-                if use_date_range:
-                    df = df.loc[start_date:end_date]
-                
-                return df
+            # 指标缓存按代码、周期和数据版本识别数据
+            df.attrs.update(symbol=ticker.upper(), interval=interval, version=version)
+            return df
 
-            except (KeyError, IndexError) as e:
-                logger.error(f"解析{ticker}数据失败: {str(e)}")
-                return None
-                
         except Exception as e:
             logger.error(f"获取{ticker}股票数据异常: {str(e)}")
             return None
-        
-        
+
+    def get_price_series(self, ticker, period='1y', start=None, end=None):
+        """获取日线价格序列（内存映射的只读视图，不复制数据）"""
+        # 优先使用明确的时间范围参数
+        use_date_range = start is not None or end is not None
+        # 回放数据源的"当前时间"是录制结束的时间，保证时间段请求可复现
+        now = self.provider.now(ticker)
+        bars = None
+
+        if use_date_range:
+            # 处理日期范围模式，转换为Unix时间戳（秒）
+            start_date = pd.to_datetime(start) if start is not None else None
+            end_date = pd.to_datetime(end) if end is not None else pd.Timestamp(now, unit='s')
+            start_ts = int(start_date.timestamp()) if start_date is not None else None
+            end_ts = min(int(end_date.timestamp()), now)
+        else:
+            # 处理时间段模式
+            days, bars = PERIODS.get(period, PERIODS['1y'])
+            start_ts = None if days is None else now - days * 86400
+            end_ts = now
+
+        # 并发的相同请求只同步一次本地价格库
+        request_key = (str(start), str(end)) if use_date_range else period
+        single_flight.do(
+            (ticker.upper(), '1d', request_key),
+            self._sync_price_store, ticker, start_ts, end_ts
+        )
+
+        series = price_store.series(ticker, start_ts=start_ts, end_ts=end_ts)
+        if series is None or len(series) == 0:
+            return None
+        if bars is not None:
+            series = series.tail(bars)
+        return series
+
+    def _sync_price_store(self, ticker, start_ts, end_ts):
+        """下载本地价格库缺失的区间并写入"""
+        with price_store.lock(ticker):
+            for fetch_start, fetch_end in price_store.missing_ranges(ticker, start_ts, end_ts):
+                fetched = self._fetch_daily(ticker, fetch_start, fetch_end)
+                if fetched is None:
+                    # 下载失败时继续使用本地已有数据
+                    continue
+                if fetch_start is not None and price_store.adjusted_since(ticker, fetched):
+                    # 拆股或分红调整了已存储的历史价格，重新下载全部历史并替换
+                    logger.info(f"{ticker}的历史价格已调整，重新下载全部历史")
+                    full = self._fetch_daily(ticker, None, end_ts)
+                    if full is not None:
+                        price_store.write(ticker, full, covered=(None, end_ts), replace=True)
+                        return
+                    continue
+                price_store.write(ticker, fetched, covered=(fetch_start, fetch_end))
+
+    def _fetch_daily(self, ticker, fetch_start, fetch_end):
+        """下载[fetch_start, fetch_end]的日线数据，fetch_start为None时下载全部历史"""
+        params = {
+            "interval": "1d",
+            "includePrePost": True,
+            "events": "div,splits,capitalGains"
+        }
+        if fetch_start is None:
+            params["range"] = "max"
+        else:
+            params.update({"period1": fetch_start, "period2": fetch_end})
+        return self._fetch_chart(ticker, params)
+
+    def get_stock_data_many(self, tickers, period='1y', start=None, end=None, copy=True):
+        """并发获取多只股票数据，单只失败不影响整批
+
+        返回 {"data": {代码: DataFrame}, "errors": {代码: 错误信息}}
+        """
+        tickers = list(dict.fromkeys(tickers))
+        result = {"data": {}, "errors": {}}
+        if not tickers:
+            return result
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(tickers))) as executor:
+            futures = {
+                ticker: executor.submit(self.get_stock_data, ticker, period, start, end, copy=copy)
+                for ticker in tickers
+            }
+            for ticker, future in futures.items():
+                try:
+                    df = future.result()
+                except Exception as e:
+                    result["errors"][ticker] = str(e)
+                    continue
+                if df is None:
+                    result["errors"][ticker] = "无法获取股票数据"
+                else:
+                    result["data"][ticker] = df
+
+        return result
+
+    def _fetch_intraday(self, ticker, params):
+        """下载分钟级数据，并标记本次下载的版本号"""
+        df = self._fetch_chart(ticker, params)
+        if df is not None:
+            df.attrs['version'] = next(self._downloads)
+        return df
+
+    def _fetch_chart(self, ticker, params):
+        """通过行情数据源请求chart数据并解析为DataFrame"""
+        try:
+            data = self.provider.get_chart(ticker, params)
+        except MarketDataError as e:
+            logger.error(f"获取{ticker}数据失败: {str(e)}")
+            return None
+
+        try:
+            chart_data = data['chart']['result'][0]
+            # 请求区间内没有交易日（如周末）时返回空表
+            timestamps = chart_data.get('timestamp', [])
+            quote = chart_data['indicators']['quote'][0] if timestamps else {}
+
+            # 创建DataFrame
+            df = pd.DataFrame({
+                'Open': quote.get('open', []),
+                'High': quote.get('high', []),
+                'Low': quote.get('low', []),
+                'Close': quote.get('close', []),
+                'Volume': quote.get('volume', [])
+            }, index=pd.to_datetime(timestamps, unit='s'))
+
+            # 处理调整后的收盘价
+            if timestamps and 'adjclose' in chart_data['indicators']:
+                df['Adj Close'] = chart_data['indicators']['adjclose'][0]['adjclose']
+
+            # 清理数据：移除NaN和重复索引
+            df = df.dropna()
+            df = df.loc[~df.index.duplicated(keep='first')]
+
+            # 拆股日期，本地价格库据此判断已存储的历史是否需要重写
+            splits = chart_data.get('events', {}).get('splits', {})
+            df.attrs['splits'] = sorted(int(split['date']) for split in splits.values())
+            return df
+
+        except (KeyError, IndexError, TypeError) as e:
+            logger.error(f"解析{ticker}数据失败: {str(e)}")
+            return None
+
     def generate_daily_report(self, ticker):
         """生成每日分析报告"""
         try:
@@ -128,10 +274,8 @@ class StockAnalyzer:
                 "change": daily_change,
                 "volume": latest['Volume']/1e6,
                 "atr": atr,
-                "volume_alert": self.detect_abnormal_volume(hist),
-                "technical_signals": self.generate_technical_signals(hist),
-                "volatility_alert": self.volatility_cluster_alert(hist),
-                "money_flow": self.money_flow_analysis(hist)
+                # 成交量、技术、波动率、资金流向信号，共用一次尾部数据提取
+                **signals.evaluate(hist)
             }
             
             return report
@@ -141,139 +285,170 @@ class StockAnalyzer:
 
     def detect_abnormal_volume(self, data):
         """成交量异动检测"""
-        avg_volume = data['Volume'].rolling(5).mean().iloc[-1]
-        latest_volume = data['Volume'].iloc[-1]
-        
-        if latest_volume > avg_volume * 2:
-            return "成交量突破：当前成交量是5日均值的2倍以上"
-        elif latest_volume < avg_volume * 0.5:
-            return "交易清淡：当前成交量不足5日均值一半"
-        else:
-            return "成交量处于正常波动区间"
+        return signals.SIGNALS['volume_alert'](data)
 
     def generate_technical_signals(self, data):
         """生成技术信号"""
-        signals = []
-        
-        # 计算MACD
-        exp1 = data['Close'].ewm(span=12, adjust=False).mean()
-        exp2 = data['Close'].ewm(span=26, adjust=False).mean()
-        macd = exp1 - exp2
-        signal = macd.ewm(span=9, adjust=False).mean()
-        
-        if macd.iloc[-1] > signal.iloc[-1] and macd.iloc[-2] <= signal.iloc[-2]:
-            signals.append("MACD金叉")
-        elif macd.iloc[-1] < signal.iloc[-1] and macd.iloc[-2] >= signal.iloc[-2]:
-            signals.append("MACD死叉")
-            
-        # 计算RSI
-        delta = data['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        rsi = 100 - (100 / (1 + rs))
-        
-        if rsi.iloc[-1] > 70:
-            signals.append(f"RSI超买 ({rsi.iloc[-1]:.1f})")
-        elif rsi.iloc[-1] < 30:
-            signals.append(f"RSI超卖 ({rsi.iloc[-1]:.1f})")
-            
-        return signals
+        return signals.SIGNALS['technical_signals'](data)
 
     def volatility_cluster_alert(self, data):
         """波动率聚类分析"""
-        returns = data['Close'].pct_change().dropna()
-        clusters = []
-        threshold = returns.std() * 1.5
-        
-        for r in returns[-5:]:
-            if abs(r) > threshold:
-                clusters.append(1)
-            else:
-                clusters.append(0)
-        
-        if sum(clusters) >= 3:
-            return "波动率聚集预警：近期出现3次以上异常波动"
-        return "波动率正常"
+        return signals.SIGNALS['volatility_alert'](data)
 
     def money_flow_analysis(self, data):
+        """资金流向分析"""
+        return signals.SIGNALS['money_flow'](data)
+
+    def calculate_indicators(self, ticker, timeframe='daily', period='1y'):
+        """计算单只股票在指定周期上的全部技术指标
+
+        timeframe 可以是 TIMEFRAMES 中的名称，也可以直接是重采样规则（如 '2W'、'10B'）。
         """
-        更敏感的资金流向分析，快速响应市场变化
+        rule = self.TIMEFRAMES.get(timeframe, timeframe)
+        if rule is not None:
+            resample.parse_rule(rule)
+
+        series = self.get_price_series(ticker, period)
+        if series is None or len(series) == 0:
+            raise ValueError(f"No price data for {ticker}")
+
+        if rule is not None:
+            series = self.resample_series(ticker, rule, start_ts=int(series.timestamps[0]))
+        hist = series.to_frame()
+
+        panel = {column: hist[column].to_numpy(dtype=np.float64) for column in indicators.OHLCV}
+        values = indicators.compute_indicators(panel)
+
+        return {
+            "symbol": ticker.upper(),
+            "timeframe": timeframe,
+            "period": period,
+            "dates": hist.index.strftime('%Y-%m-%d').tolist(),
+            "close": indicators.to_list(panel['Close'], 4),
+            "volume": indicators.to_list(panel['Volume']),
+            "indicators": {name: indicators.to_list(series, 4) for name, series in values.items()},
+            "latest": {name: indicators.to_list(series[-1:], 4)[0] for name, series in values.items()}
+        }
+
+    def resample_series(self, ticker, rule, start_ts=None):
+        """从本地日线聚合出更高周期的K线，结果缓存并随新K线增量更新
+
+        从全部已存日线聚合，再截取包含 start_ts 的那根K线及之后的部分，
+        因此首根周线、月线也是完整的。
         """
-        try:
-            # 计算价格变化率
-            price_change = data['Close'].pct_change() * 100
-            
-            # 计算成交量变化率
-            volume_change = data['Volume'].pct_change() * 100
-            
-            # 计算典型价格
-            typical_price = (data['High'] + data['Low'] + data['Close']) / 3
-            
-            # 计算 Money Flow
-            raw_money_flow = typical_price * data['Volume']
-            
-            # 使用更短期的资金流指标
-            positive_flow = raw_money_flow.where(typical_price > typical_price.shift(1), 0).rolling(window=10).sum()
-            negative_flow = raw_money_flow.where(typical_price < typical_price.shift(1), 0).rolling(window=10).sum()
-            
-            # 计算 MFI（使用更短的周期）
-            mfi = 100 - (100 / (1 + positive_flow / negative_flow))
-            
-            # 计算 OBV 和短期变化
-            obv = (data['Volume'] * (~data['Close'].diff().le(0) * 2 - 1)).cumsum()
-            obv_change = obv.diff(3) / obv.abs().mean() * 100  # 缩短为3天
-            
-            # 获取最新值
-            current_price_change = price_change.iloc[-1]
-            current_volume_change = volume_change.iloc[-1]
-            current_mfi = mfi.iloc[-1]
-            current_obv_change = obv_change.iloc[-1]
-            
-            # 更敏感的上涨特征判断
-            is_strong_uptrend = (
-                current_price_change > 2 and  # 降低到2%
-                current_volume_change > 30 and  # 降低到30%
-                current_obv_change > 3  # 降低到3%
-            )
-            
-            # 更敏感的下跌特征判断
-            is_strong_downtrend = (
-                current_price_change < -2 and  # 提高到-2%
-                current_volume_change > 30 and  # 降低到30%
-                current_obv_change < -3  # 提高到-3%
-            )
-            
-            # 综合分析（更敏感的判断标准）
-            if is_strong_uptrend:
-                if current_mfi > 70:  # 降低阈值
-                    return "主力资金大量涌入：强势上涨"
-                else:
-                    return "资金加速流入：看涨信号"
-            elif is_strong_downtrend:
-                if current_mfi < 30:  # 提高阈值
-                    return "资金加速流出：看空信号"
-                else:
-                    return "资金持续流出：注意风险"
+        series = price_store.series(ticker)
+        if series is None or len(series) == 0:
+            return None
+        bars = bar_resampler.resample(series, rule)
+        if start_ts is None:
+            return bars
+        first = series.locate(start_ts)
+        if first >= len(series):
+            return bars.window(len(bars), None)
+        return bars.slice(start_ts=resample.label_at(series.timestamps, first, rule))
+
+    def screen_stocks(self, universe, criteria):
+        """按条件筛选股票
+
+        行情和技术指标条件对整个股票池一次性向量化计算，
+        基本面条件只对通过行情条件的股票查询公司信息。
+        """
+        # 先校验条件，避免无效请求下载整个股票池
+        value_criteria, info_criteria = self._parse_criteria(criteria)
+
+        batch = self.get_stock_data_many(universe, '1y', copy=False)
+        symbols, _, panel = indicators.align_frames(batch['data'])
+        if not symbols:
+            return []
+
+        values = self._screening_values(panel)
+        mask = np.ones(len(symbols), dtype=bool)
+        for field, compare, value in value_criteria:
+            with np.errstate(invalid='ignore'):
+                mask &= ~np.isnan(values[field]) & compare(values[field], value)
+
+        candidates = [symbol for symbol, matched in zip(symbols, mask) if matched]
+        info_fields = ['longName', 'shortName', 'sector', 'marketCap', 'trailingPE']
+        info_fields += [key for key, _, _ in info_criteria if key not in info_fields]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            infos = dict(zip(candidates, executor.map(lambda symbol: self._screen_info(symbol, info_fields), candidates)))
+
+        results = []
+        for row, symbol in enumerate(symbols):
+            if not mask[row]:
+                continue
+            info = infos[symbol]
+            if info is None:
+                # 公司信息获取失败：有基本面条件时无法判断，跳过；否则只缺少名称等字段
+                if info_criteria:
+                    continue
+                info = {}
+            if not all(info.get(key) is not None and compare(info[key], value)
+                       for key, compare, value in info_criteria):
+                continue
+            results.append({
+                "symbol": symbol,
+                "name": info.get('longName') or info.get('shortName') or symbol,
+                "sector": info.get('sector', ''),
+                "price": round(float(values['price'][row]), 2),
+                "change": round(float(values['change'][row]), 2),
+                "volume": int(values['volume'][row]),
+                "marketCap": info.get('marketCap'),
+                "pe": info.get('trailingPE'),
+                "indicators": {
+                    name: indicators.to_list(values[name][row:row + 1], 4)[0]
+                    for name in ('rsi', 'macd', 'macd_signal', 'sma_20', 'sma_50', 'sma_200', 'mfi', 'atr')
+                }
+            })
+        return results
+
+    def _parse_criteria(self, criteria):
+        """把筛选条件拆成(行情条件, 公司信息条件)，每项为(字段, 比较函数, 数值)；条件无效时抛出ValueError"""
+        if not isinstance(criteria, list):
+            raise ValueError("criteria must be a list")
+        value_criteria, info_criteria = [], []
+        for criterion in criteria:
+            if not isinstance(criterion, dict):
+                raise ValueError(f"Invalid criterion: {criterion}")
+            missing = [key for key in ('field', 'operator', 'value') if key not in criterion]
+            if missing:
+                raise ValueError(f"Criterion {criterion} is missing {', '.join(missing)}")
+            field = criterion['field']
+            compare = self.SCREEN_OPERATORS.get(criterion['operator'])
+            if compare is None:
+                raise ValueError(f"Unsupported operator: {criterion['operator']}")
+            try:
+                value = float(criterion['value'])
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid value for {field}: {criterion['value']}")
+
+            if field in self.SCREEN_VALUE_FIELDS:
+                value_criteria.append((field, compare, value))
+            elif field in self.SCREEN_INFO_FIELDS:
+                info_criteria.append((self.SCREEN_INFO_FIELDS[field], compare, value))
             else:
-                if current_mfi > 70 and current_obv_change < -3:
-                    return "资金流出警告：获利回吐"
-                elif current_mfi < 30 and current_obv_change > 3:
-                    return "资金流入信号：低位吸筹"
-                elif current_mfi > 55 and current_obv_change > 2:  # 降低阈值
-                    return "资金持续流入：多头占优"
-                elif current_mfi < 45 and current_obv_change < -2:  # 提高阈值
-                    return "资金逐步流出：空头占优"
-                elif current_price_change > 0.5 and current_volume_change > 10:  # 更敏感的短期判断
-                    return "资金小幅流入：短线看多"
-                elif current_price_change < -0.5 and current_volume_change > 10:
-                    return "资金小幅流出：短线谨慎"
-                else:
-                    return "资金流向观望：等待信号"
-            
+                raise ValueError(f"Unknown screening field: {field}")
+        return value_criteria, info_criteria
+
+    def _screen_info(self, symbol, fields):
+        """单只股票的公司信息，失败时记录日志并返回None，不影响整批筛选"""
+        try:
+            return info_cache.get(symbol, fields)
         except Exception as e:
-            logger.error(f"Error in money flow analysis: {str(e)}")
-            return "资金流向分析异常"
+            logger.warning(f"筛选时获取{symbol}公司信息失败: {str(e)}")
+            return None
+
+    def _screening_values(self, panel):
+        """每只股票最新的行情与技术指标值，键为筛选字段名"""
+        computed = indicators.compute_indicators(panel)
+        values = {name: indicators.last_valid(series) for name, series in computed.items()}
+        values['price'] = indicators.last_valid(panel['Close'])
+        values['volume'] = indicators.last_valid(panel['Volume'])
+        values['change'] = indicators.last_valid(indicators.pct_change(panel['Close']))
+        # 52周约252个交易日
+        values['52WeekHigh'] = np.fmax.reduce(panel['High'][:, -252:], axis=1)
+        values['52WeekLow'] = np.fmin.reduce(panel['Low'][:, -252:], axis=1)
+        return values
 
     def backtest_analysis(self, ticker: str, start_date: str, end_date: str):
         """获取指定日期的分析报告并验证其准确性"""
@@ -285,90 +460,277 @@ class StockAnalyzer:
             start_date_pd = pd.to_datetime(start_date)
             end_date_pd = pd.to_datetime(end_date)
 
-            # 获取指定日期范围内的数据
-            hist = self.get_stock_data(
+            # 获取指定日期范围内的数据（内存映射视图，不复制）
+            series = self.get_price_series(
                 ticker, 
                 start=start_date_pd - pd.Timedelta(days=7),  # 多取7天用于技术指标计算
                 end=end_date_pd + pd.Timedelta(days=5)      # 确保包含 end_date
             )
             
-            if hist is None or hist.empty:
+            if series is None:
                 logger.error(f"No data available for {ticker}")
                 return {"error": "无法获取历史数据"}
 
-            # 确保索引是datetime类型
-            hist.index = pd.to_datetime(hist.index)
+            # 按天比较时间戳
+            days = series.timestamps // 86400
+            start_day = int(start_date_pd.normalize().timestamp()) // 86400
+            target_day = int(end_date_pd.normalize().timestamp()) // 86400
             
             # 检查数据范围是否覆盖目标日期
-            if hist.index[0].date() > start_date_pd.date() or hist.index[-1].date() < end_date_pd.date():
-                logger.error(f"数据范围不足: {hist.index[0]} 至 {hist.index[-1]}")
+            if days[0] > start_day or days[-1] < target_day:
+                logger.error(f"数据范围不足: {series.index[0]} 至 {series.index[-1]}")
                 return {"error": "数据未覆盖指定日期范围"}
 
             # 精确匹配目标日期
-            target_date = end_date_pd.date()
-            matching_dates = hist.index[hist.index.date == target_date]
-
+            target_idx = int(np.searchsorted(days, target_day, side='left'))
             
-            if len(matching_dates) == 0:
+            if target_idx >= len(series) or days[target_idx] != target_day:
                 logger.error(f"目标日期 {end_date} 不存在于数据中")
                 return {"error": f"{end_date} 无交易数据"}
-
-            target_idx = hist.index.get_loc(matching_dates[0])
             
             # 检查是否有下一个交易日数据
-            if target_idx >= len(hist) - 1:
+            if target_idx >= len(series) - 1:
                 logger.error(f"No next day data available for {ticker} at {end_date}")
                 return {"error": f"无法获取 {end_date} 的下一个交易日数据"}
 
             # 记录找到的具体日期
-            test_date = hist.index[target_idx]
-            next_date = hist.index[target_idx + 1]
+            test_date = pd.Timestamp(int(series.timestamps[target_idx]), unit='s')
+            next_date = pd.Timestamp(int(series.timestamps[target_idx + 1]), unit='s')
             logger.info(f"Using test date: {test_date}")
             logger.info(f"Next trading day: {next_date}")
 
-            # 使用目标日期的数据生成分析报告
-            test_data = hist.iloc[target_idx:target_idx+1]
-            next_day = hist.iloc[target_idx+1]
-            analysis_data = hist[:target_idx+1]
+            # 使用目标日期及之前的数据生成分析报告（视图，信号只读取所需的尾部）
+            analysis_data = series.window(0, target_idx + 1)
+            test_open = series['Open'][target_idx]
+            test_close = series['Close'][target_idx]
+            next_open = series['Open'][target_idx + 1]
+            next_close = series['Close'][target_idx + 1]
 
             # 生成分析报告
             report = {
-                "date": test_data.index[0].strftime('%Y-%m-%d'),
-                "price": test_data['Close'].iloc[0],                
-                "high": test_data['High'].iloc[0],
-                "low": test_data['Low'].iloc[0],
-                "open": test_data['Open'].iloc[0],
+                "date": test_date.strftime('%Y-%m-%d'),
+                "price": float(test_close),
+                "high": float(series['High'][target_idx]),
+                "low": float(series['Low'][target_idx]),
+                "open": float(test_open),
                 
-                "change": ((test_data['Close'].iloc[0] - test_data['Open'].iloc[0]) / 
-                        test_data['Open'].iloc[0] * 100),
-                "volume": test_data['Volume'].iloc[0] / 1e6,  # 转换为百万单位
-                "technical_signals": self.generate_technical_signals(analysis_data),
-                "volatility_alert": self.volatility_cluster_alert(analysis_data),
-                "money_flow": self.money_flow_analysis(analysis_data),
-                "volume_alert": self.detect_abnormal_volume(analysis_data),
+                "change": float((test_close - test_open) / test_open * 100),
+                "volume": float(series['Volume'][target_idx]) / 1e6,  # 转换为百万单位
+                **signals.evaluate(analysis_data),
+                # 添加次日数据
                 "next_day": {
-                    "date": next_day.name.strftime('%Y-%m-%d'),
-                    "price": next_day['Close'],
-                    "change": ((next_day['Close'] - next_day['Open']) / next_day['Open'] * 100)
+                    "date": next_date.strftime('%Y-%m-%d'),
+                    "price": float(next_close),
+                    "change": float((next_close - next_open) / next_open * 100)
                 }
             }
 
-            # 添加次日数据
-            report["next_day"] = {
-                "date": next_day.name.strftime('%Y-%m-%d'),
-                "price": next_day['Close'],
-                "change": ((next_day['Close'] - next_day['Open']) / next_day['Open'] * 100)
-            }
-
-
             return report
 
         except Exception as e:
             logger.error(f"Unexpected error in backtest analysis for {ticker}: {str(e)}")
             return {"error": str(e)}
 
+    def backtest(self, symbol, hist, spec=None, cost_bps=None):
+        """按策略配置对历史数据做向量化回测
+
+        spec 形如 {"type": "sma_cross", "fast": 20, "slow": 50}，默认即为该策略；
+        可用策略见 backtest.STRATEGIES。结果按策略、参数和所用K线缓存，K线不变时直接返回。
+        """
+        spec = backtest_engine.parse_spec(spec)
+        cost_bps = backtest_engine._cost(cost_bps) * 10000
+        return backtest_cache.get(
+            'backtest', {'symbol': symbol.upper(), 'spec': spec, 'cost_bps': cost_bps}, {symbol: hist},
+            lambda progress: self._run_backtest(symbol, hist, spec, cost_bps)
+        )
+
+    def _run_backtest(self, symbol, hist, spec, cost_bps):
+        result = backtest_engine.run(hist, hist.index.asi8 // 10**9, spec, cost_bps)
+        dates = hist.index.strftime('%Y-%m-%d').tolist()
+
+        return {
+            "symbol": symbol.upper(),
+            "start_date": dates[0],
+            "end_date": dates[-1],
+            "strategy": result['spec'],
+            "cost_bps": result['cost_bps'],
+            "performance": {
+                name: round(value, 4) if isinstance(value, float) else value
+                for name, value in result['metrics'].items()
+            },
+            "benchmark": {
+                name: round(value, 4) if isinstance(value, float) else value
+                for name, value in result['benchmark_metrics'].items()
+            },
+            "trades": result['trades'],
+            "historical_data": {
+                "dates": dates,
+                "prices": indicators.to_list(hist['Close'], 4),
+                "position": result['positions'].tolist(),
+                "equity": indicators.to_list((result['equity'] - 1) * 100, 4),
+                "drawdown": indicators.to_list(result['drawdown'] * 100, 4),
+                "benchmark": indicators.to_list((result['benchmark'] - 1) * 100, 4)
+            }
+        }
+
+    def backtest_sweep(self, symbol, hist, strategy='sma_cross', grid=None, cost_bps=None,
+                       metric='sharpe_ratio', top=50):
+        """对同一份历史数据回测整个参数网格，返回排序结果和热力图
+
+        grid 形如 {"fast": {"start": 5, "stop": 50, "step": 5}, "slow": [50, 100, 200]}，
+        未列出的参数取策略默认值。结果按网格、参数和所用K线缓存。
+        """
+        params = {
+            'symbol': symbol.upper(), 'strategy': strategy, 'grid': grid or {},
+            'cost_bps': backtest_engine._cost(cost_bps) * 10000, 'metric': metric, 'top': top
+        }
+        return backtest_cache.get(
+            'backtest_sweep', params, {symbol: hist}, lambda progress: self._run_sweep(hist, **params)
+        )
+
+    def _run_sweep(self, hist, symbol, strategy, grid, cost_bps, metric, top):
+        result = backtest_engine.sweep(
+            hist, hist.index.asi8 // 10**9, strategy, grid, cost_bps, metric, top
+        )
+        dates = hist.index.strftime('%Y-%m-%d')
+        return {
+            "symbol": symbol.upper(),
+            "start_date": dates[0],
+            "end_date": dates[-1],
+            **result
+        }
+
+    def backtest_portfolio(self, symbols, start_date, end_date, spec=None, weights='equal', cost_bps=None,
+                           progress=None):
+        """对一组股票运行同一策略并按权重合成组合（每日再平衡）
+
+        weights 为 'equal' 或 {代码: 权重}，当天没有K线的股票不参与当天的权重分配。
+        progress(已完成数, 总数) 在每批股票回测完后调用。所有股票数据齐全时结果会被缓存。
+        """
+        symbols = [symbol.upper() for symbol in dict.fromkeys(symbols)]
+        if not symbols:
+            raise ValueError("No symbols to backtest")
+
+        batch = self.get_stock_data_many(symbols, start=start_date, end=end_date, copy=False)
+        spec = backtest_engine.parse_spec(spec)
+        cost_bps = backtest_engine._cost(cost_bps) * 10000
+        if batch["errors"]:
+            # 部分股票下载失败的结果不缓存，下次重新获取
+            return dict(self._run_portfolio(batch, spec, weights, cost_bps, progress), cached=False)
+        return backtest_cache.get(
+            'backtest_portfolio',
+            {'symbols': symbols, 'spec': spec, 'weights': weights, 'cost_bps': cost_bps},
+            batch["data"],
+            lambda shared_progress: self._run_portfolio(batch, spec, weights, cost_bps, shared_progress),
+            progress
+        )
+
+    def _run_portfolio(self, batch, spec, weights, cost_bps, progress):
+        result = portfolio_backtester.run(batch["data"], spec, weights, cost_bps, progress)
+        dates = pd.to_datetime(result['timestamps'], unit='s').strftime('%Y-%m-%d').tolist()
+
+        def rounded(metrics):
+            return {
+                name: round(value, 4) if isinstance(value, float) else value
+                for name, value in metrics.items()
+            }
+
+        per_symbol = {}
+        for symbol, item in result['per_symbol'].items():
+            per_symbol[symbol] = {'weight': item['weight']}
+            if 'error' in item:
+                per_symbol[symbol]['error'] = item['error']
+            else:
+                per_symbol[symbol].update(performance=rounded(item['metrics']), benchmark=rounded(item['benchmark']))
+        for symbol, error in batch["errors"].items():
+            per_symbol[symbol] = {'error': error}
+
+        return {
+            "symbols": result['symbols'],
+            "start_date": dates[0],
+            "end_date": dates[-1],
+            "strategy": result['spec'],
+            "performance": rounded(result['metrics']),
+            "benchmark": rounded(result['benchmark_metrics']),
+            "per_symbol": per_symbol,
+            "historical_data": {
+                "dates": dates,
+                "equity": indicators.to_list((result['equity'] - 1) * 100, 4),
+                "drawdown": indicators.to_list(result['drawdown'] * 100, 4),
+                "benchmark": indicators.to_list((result['benchmark'] - 1) * 100, 4)
+            }
+        }
+
+    def signal_timeline(self, ticker: str, start_date: Optional[str] = None, end_date: Optional[str] = None):
+        """一次性计算区间内每个交易日的全部报告信号及次日表现
+
+        与逐日调用 backtest_analysis 的结果一致，但只读取一次数据、向量化计算。
+        默认区间为最近一年。
+        """
+        end_date_pd = pd.to_datetime(end_date) if end_date else pd.Timestamp.today().normalize()
+        start_date_pd = pd.to_datetime(start_date) if start_date else end_date_pd - pd.DateOffset(years=1)
+        if start_date_pd > end_date_pd:
+            raise ValueError("start_date must not be after end_date")
+
+        # 向前多取数据供信号预热（EMA约250根、波动率与OBV一年），向后多取用于次日表现
+        warmup_days = (max(signals.EMA_WARMUP, signals.YEAR_BARS + 1) * 7) // 5 + 14
+        series = self.get_price_series(
+            ticker,
+            start=start_date_pd - pd.Timedelta(days=warmup_days),
+            end=end_date_pd + pd.Timedelta(days=7)
+        )
+        if series is None:
+            raise ValueError(f"No price data for {ticker}")
+
+        days = series.timestamps // 86400
+        first = int(np.searchsorted(days, int(start_date_pd.timestamp()) // 86400, side='left'))
+        last = int(np.searchsorted(days, int(end_date_pd.timestamp()) // 86400, side='right'))
+        if first >= last:
+            raise ValueError(f"No trading days between {start_date_pd.date()} and {end_date_pd.date()}")
+
+        result = timeline.signal_timeline(series, series.timestamps)
+        dates = pd.to_datetime(result['timestamps'], unit='s').strftime('%Y-%m-%d')
+        rows = []
+        for i in range(first, last):
+            rows.append({
+                "date": dates[i],
+                "price": float(result['price'][i]),
+                "high": float(result['high'][i]),
+                "low": float(result['low'][i]),
+                "open": float(result['open'][i]),
+                "change": float(result['change'][i]),
+                "volume": float(result['volume'][i]),
+                "volume_alert": result['volume_alert'][i],
+                "technical_signals": result['technical_signals'][i],
+                "volatility_alert": result['volatility_alert'][i],
+                "money_flow": result['money_flow'][i],
+                "next_day": {
+                    "date": dates[i + 1],
+                    "price": float(result['next_price'][i]),
+                    "change": float(result['next_change'][i])
+                } if i + 1 < len(series) else None
+            })
+
+        return {
+            "symbol": ticker.upper(),
+            "start_date": rows[0]["date"],
+            "end_date": rows[-1]["date"],
+            "timeline": rows,
+            "summary": timeline.summarize(result, slice(first, last))
+        }
+
 class StockAnalyzerService:
     """Service for stock analysis operations"""
+
+    # Ticker.info fields used by the daily report
+    REPORT_INFO_FIELDS = [
+        'longName', 'marketCap', 'trailingPE', 'dividendYield',
+        'fiftyTwoWeekHigh', 'fiftyTwoWeekLow'
+    ]
+
+    def __init__(self):
+        # Price history is served from the local price store when possible
+        self.analyzer = StockAnalyzer()
     
     def generate_daily_report(self, symbol: str) -> Dict[str, Any]:
         """
@@ -376,37 +738,23 @@ class StockAnalyzerService:
         """
         try:
             # Get stock data
-            ticker = yf.Ticker(symbol)
-            hist = ticker.history(period="1y")
+            hist = self.analyzer.get_stock_data(symbol, period="1y")
             
-            if hist.empty:
+            if hist is None or hist.empty:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail=f"No data found for stock {symbol}"
                 )
             
             # Basic info
-            info = ticker.info
+            info = info_cache.get(symbol, self.REPORT_INFO_FIELDS)
             
             # Calculate some technical indicators
-            hist['SMA_20'] = hist['Close'].rolling(window=20).mean()
-            hist['SMA_50'] = hist['Close'].rolling(window=50).mean()
-            hist['SMA_200'] = hist['Close'].rolling(window=200).mean()
-            
-            # RSI calculation
-            delta = hist['Close'].diff()
-            gain = delta.where(delta > 0, 0)
-            loss = -delta.where(delta < 0, 0)
-            avg_gain = gain.rolling(window=14).mean()
-            avg_loss = loss.rolling(window=14).mean()
-            rs = avg_gain / avg_loss
-            hist['RSI'] = 100 - (100 / (1 + rs))
-            
-            # MACD
-            hist['EMA_12'] = hist['Close'].ewm(span=12, adjust=False).mean()
-            hist['EMA_26'] = hist['Close'].ewm(span=26, adjust=False).mean()
-            hist['MACD'] = hist['EMA_12'] - hist['EMA_26']
-            hist['Signal_Line'] = hist['MACD'].ewm(span=9, adjust=False).mean()
+            hist['SMA_20'] = indicator_cache.compute(hist, 'sma', window=20)
+            hist['SMA_50'] = indicator_cache.compute(hist, 'sma', window=50)
+            hist['SMA_200'] = indicator_cache.compute(hist, 'sma', window=200)
+            hist['RSI'] = indicator_cache.compute(hist, 'rsi', period=14)
+            hist['MACD'], hist['Signal_Line'], _ = indicator_cache.compute(hist, 'macd')
             
             # Get the most recent values
             latest = hist.iloc[-1]
@@ -441,11 +789,11 @@ class StockAnalyzerService:
                 "dates": hist.index[-30:].strftime('%Y-%m-%d').tolist(),
                 "prices": hist['Close'][-30:].round(2).tolist(),
                 "volumes": hist['Volume'][-30:].astype(int).tolist(),
-                "sma_20": hist['SMA_20'][-30:].round(2).fillna(None).tolist(),
-                "sma_50": hist['SMA_50'][-30:].round(2).fillna(None).tolist(),
-                "rsi": hist['RSI'][-30:].round(2).fillna(None).tolist(),
-                "macd": hist['MACD'][-30:].round(2).fillna(None).tolist(),
-                "signal_line": hist['Signal_Line'][-30:].round(2).fillna(None).tolist(),
+                "sma_20": indicators.to_list(hist['SMA_20'][-30:], 2),
+                "sma_50": indicators.to_list(hist['SMA_50'][-30:], 2),
+                "rsi": indicators.to_list(hist['RSI'][-30:], 2),
+                "macd": indicators.to_list(hist['MACD'][-30:], 2),
+                "signal_line": indicators.to_list(hist['Signal_Line'][-30:], 2),
             }
             
             return report
@@ -510,62 +858,51 @@ class StockAnalyzerService:
         
         return recommendation
     
-    def backtest_strategy(self, symbol: str, start_date: str, end_date: str) -> Dict[str, Any]:
+    def backtest_strategy(self, symbol: str, start_date: str, end_date: str,
+                          fast: int = 20, slow: int = 50) -> Dict[str, Any]:
         """
-        Backtest a simple trading strategy
+        Backtest an SMA crossover strategy (long while the fast SMA is above the slow one)
         """
         try:
             # Get historical data
-            ticker = yf.Ticker(symbol)
-            hist = ticker.history(start=start_date, end=end_date)
+            hist = self.analyzer.get_stock_data(symbol, start=start_date, end=end_date, copy=False)
             
-            if hist.empty:
+            if hist is None or hist.empty:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail=f"No data found for stock {symbol} in specified date range"
                 )
             
-            # Calculate indicators
-            hist['SMA_20'] = hist['Close'].rolling(window=20).mean()
-            hist['SMA_50'] = hist['Close'].rolling(window=50).mean()
-            
-            # Generate signals (buy when SMA_20 crosses above SMA_50, sell when crosses below)
-            hist['Signal'] = 0
-            hist.loc[hist['SMA_20'] > hist['SMA_50'], 'Signal'] = 1
-            hist['Position'] = hist['Signal'].diff()
-            
-            # Calculate returns
-            hist['Market_Return'] = hist['Close'].pct_change()
-            hist['Strategy_Return'] = hist['Market_Return'] * hist['Signal'].shift(1)
-            
-            # Calculate cumulative returns
-            hist['Cum_Market_Return'] = (1 + hist['Market_Return']).cumprod() - 1
-            hist['Cum_Strategy_Return'] = (1 + hist['Strategy_Return']).cumprod() - 1
+            # Run the crossover through the backtest engine, without transaction costs
+            spec = {"type": "sma_cross", "fast": fast, "slow": slow}
+            result = backtest_engine.run(hist, hist.index.asi8 // 10**9, spec, cost_bps=0)
             
-            # Count signals
-            buy_signals = hist[hist['Position'] == 1].shape[0]
-            sell_signals = hist[hist['Position'] == -1].shape[0]
+            # Buy/sell where the target position flips
+            changes = np.diff(np.r_[0.0, result['targets']])
+            dates = hist.index.strftime('%Y-%m-%d')
+            close = hist['Close'].to_numpy(dtype=np.float64)
             
             # Format the results
             backtest_results = {
                 "symbol": symbol,
                 "start_date": start_date,
                 "end_date": end_date,
-                "market_return": round(hist['Cum_Market_Return'].iloc[-1] * 100, 2),
-                "strategy_return": round(hist['Cum_Strategy_Return'].iloc[-1] * 100, 2),
+                "strategy": result['spec'],
+                "market_return": round((result['benchmark'][-1] - 1) * 100, 2),
+                "strategy_return": round((result['equity'][-1] - 1) * 100, 2),
                 "signals": {
-                    "buy": buy_signals,
-                    "sell": sell_signals
+                    "buy": int((changes > 0).sum()),
+                    "sell": int((changes < 0).sum())
                 },
                 "historical_data": {
-                    "dates": hist.index.strftime('%Y-%m-%d').tolist(),
-                    "prices": hist['Close'].round(2).tolist(),
-                    "sma_20": hist['SMA_20'].round(2).fillna(None).tolist(),
-                    "sma_50": hist['SMA_50'].round(2).fillna(None).tolist(),
-                    "market_return": (hist['Cum_Market_Return'] * 100).round(2).tolist(),
-                    "strategy_return": (hist['Cum_Strategy_Return'] * 100).round(2).tolist(),
-                    "buy_signals": hist.index[hist['Position'] == 1].strftime('%Y-%m-%d').tolist(),
-                    "sell_signals": hist.index[hist['Position'] == -1].strftime('%Y-%m-%d').tolist(),
+                    "dates": dates.tolist(),
+                    "prices": indicators.to_list(close, 2),
+                    f"sma_{fast}": indicators.to_list(indicator_cache.compute(hist, 'sma', window=fast), 2),
+                    f"sma_{slow}": indicators.to_list(indicator_cache.compute(hist, 'sma', window=slow), 2),
+                    "market_return": indicators.to_list((result['benchmark'] - 1) * 100, 2),
+                    "strategy_return": indicators.to_list((result['equity'] - 1) * 100, 2),
+                    "buy_signals": dates[changes > 0].tolist(),
+                    "sell_signals": dates[changes < 0].tolist(),
                 }
             }
             
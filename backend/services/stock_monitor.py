@@ -1,10 +1,15 @@
-from typing import List, Dict
-import yfinance as yf
+from typing import List, Dict, Optional
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 import logging
 from cachetools import TTLCache
 
+from .stock_analyzer import StockAnalyzer
+from .streaming import indicator_state_store
+from .price_store import price_store, CompactBars, compact_volume
+from . import resample
+
 logger = logging.getLogger(__name__)
 
 class StockMonitor:
@@ -12,11 +17,15 @@ class StockMonitor:
         self.alert_thresholds = {
             'daily_change': 5.0,  # 5%
             'rapid_rise': 3.0,    # 3%
-            'volume_surge': 300   # 300%
+            'volume_surge': 300,  # 300%
+            'rsi_overbought': 70,
+            'rsi_oversold': 30
         }
         self.alerts_history = {}  # 用于存储已触发的预警，避免重复通知
         # 添加缓存，数据在60秒内有效
         self.data_cache = TTLCache(maxsize=100, ttl=60)
+        # 日线数据优先读取本地价格库
+        self.analyzer = StockAnalyzer()
         
     def get_stock_data(self, symbol: str) -> Dict:
         """获取股票数据，使用缓存"""
@@ -25,15 +34,56 @@ class StockMonitor:
         if cache_key in self.data_cache:
             return self.data_cache[cache_key]
             
-        stock = yf.Ticker(symbol)
+        hist = self.analyzer.get_stock_data(symbol, '1d', interval='15m')
+        hist = hist if hist is not None else pd.DataFrame()
         data = {
-            'hist': stock.history(period='1d', interval='15m'),
-            'daily_data': stock.history(period='1y'),
+            'hist': hist,
+            'daily_data': self.get_daily_data(symbol, hist),
             'timestamp': datetime.now()
         }
         self.data_cache[cache_key] = data
         return data
         
+    def get_daily_data(self, symbol: str, hist: pd.DataFrame) -> Optional[CompactBars]:
+        """近一年日线，当日K线由15分钟K线聚合
+
+        本地价格库只需覆盖到上一交易日，盘中不再为了当日K线重复下载日线。
+        日线只保留紧凑表示（float32价格、int32日期），大量股票也能常驻内存。
+        """
+        now = self.analyzer.provider.now(symbol)
+        start_ts = now - 365 * 86400
+        today = None
+        if not hist.empty:
+            timestamps = hist.index.asi8 // 10**9
+            labels, bars, _ = resample.aggregate(
+                timestamps, {column: hist[column].to_numpy() for column in hist.columns}, '1d'
+            )
+            today = (int(labels[-1]), {column: values[-1] for column, values in bars.items()})
+
+        end_ts = today[0] - 1 if today is not None else now
+        if today is None or price_store.missing_ranges(symbol, start_ts, end_ts):
+            self.analyzer.get_price_series(symbol, '1y')
+        series = price_store.series(symbol, start_ts=start_ts, end_ts=end_ts)
+        daily = series.compact() if series is not None and len(series) else None
+        if today is None:
+            return daily
+        return self._append_bar(symbol, daily, *today)
+
+    @staticmethod
+    def _append_bar(symbol: str, daily: Optional[CompactBars], day_ts: int, bar: Dict) -> CompactBars:
+        """在紧凑日线末尾追加一根K线"""
+        columns = daily.columns if daily is not None else {column: np.empty(0) for column in bar}
+        merged = {}
+        for column, values in columns.items():
+            # 分钟线没有复权价，当日以收盘价代替
+            value = bar.get(column, bar['Close'])
+            if column == 'Volume':
+                merged[column] = compact_volume(np.append(values.astype(np.float64), value))
+            else:
+                merged[column] = np.append(values, value).astype(np.float32)
+        days = np.append(daily.days if daily is not None else [], day_ts // 86400).astype(np.int32)
+        return CompactBars(symbol.upper(), daily.version if daily is not None else 0, days, merged)
+        
     def check_alerts(self, symbol: str) -> Dict:
         """检查所有预警条件"""
         try:
@@ -44,7 +94,7 @@ class StockMonitor:
             hist = data['hist']
             daily_data = data['daily_data']
             
-            if hist.empty or daily_data.empty:
+            if hist.empty or daily_data is None or len(daily_data) == 0:
                 return {
                     'symbol': symbol,
                     'alerts': [],
@@ -74,10 +124,13 @@ class StockMonitor:
                         'threshold': self.alert_thresholds['rapid_rise']
                     })
             
-            # 3. 检查52周新高
-            fifty_two_week_high = daily_data['High'].max()
+            # 日线指标状态增量更新，每次只处理新增或变动的K线
+            values = self.sync_indicators(symbol, daily_data)
+            
+            # 3. 检查52周新高（直接读取持久化的滚动最高价，O(1)）
+            fifty_two_week_high = values['high_52w']
             current_price = hist['Close'][-1]
-            if current_price >= fifty_two_week_high:
+            if fifty_two_week_high is not None and current_price >= fifty_two_week_high:
                 alerts.append({
                     'type': 'new_high',
                     'message': f'突破52周新高: {current_price:.2f}',
@@ -85,6 +138,9 @@ class StockMonitor:
                     'threshold': fifty_two_week_high
                 })
             
+            # 4. 日线技术指标
+            alerts.extend(self.check_indicator_alerts(values))
+            
             # 更新预警历史
             alert_key = f"{symbol}_{current_time.strftime('%Y%m%d_%H%M')}"
             if alerts and alert_key not in self.alerts_history:
@@ -102,4 +158,61 @@ class StockMonitor:
                 'alerts': [],
                 'timestamp': current_time.isoformat(),
                 'error': str(e)
-            } 
\ No newline at end of file
+            } 
+
+    def sync_indicators(self, symbol: str, daily_data) -> Dict:
+        """同步日线指标状态并返回当前指标值"""
+        state = indicator_state_store.sync(
+            symbol,
+            daily_data.days.astype('int64') * 86400,
+            daily_data['High'], daily_data['Low'], daily_data['Close'], daily_data['Volume']
+        )
+        return state.values()
+    
+    def check_indicator_alerts(self, values: Dict) -> List[Dict]:
+        """RSI超买超卖、MACD交叉与20日通道突破预警"""
+        alerts = []
+        
+        rsi = values['rsi']
+        if rsi is not None and rsi > self.alert_thresholds['rsi_overbought']:
+            alerts.append({
+                'type': 'rsi_overbought',
+                'message': f'RSI超买 ({rsi:.1f})',
+                'value': rsi,
+                'threshold': self.alert_thresholds['rsi_overbought']
+            })
+        elif rsi is not None and rsi < self.alert_thresholds['rsi_oversold']:
+            alerts.append({
+                'type': 'rsi_oversold',
+                'message': f'RSI超卖 ({rsi:.1f})',
+                'value': rsi,
+                'threshold': self.alert_thresholds['rsi_oversold']
+            })
+        
+        macd, signal = values['macd'], values['macd_signal']
+        macd_previous, signal_previous = values['macd_previous'], values['macd_signal_previous']
+        if None not in (macd, signal, macd_previous, signal_previous):
+            if macd > signal and macd_previous <= signal_previous:
+                alerts.append({
+                    'type': 'macd_golden_cross',
+                    'message': 'MACD金叉',
+                    'value': macd,
+                    'threshold': signal
+                })
+            elif macd < signal and macd_previous >= signal_previous:
+                alerts.append({
+                    'type': 'macd_death_cross',
+                    'message': 'MACD死叉',
+                    'value': macd,
+                    'threshold': signal
+                })
+        
+        if values['breakout_20']:
+            alerts.append({
+                'type': 'channel_breakout',
+                'message': f"突破20日高点: {values['donchian_high_prior']:.2f}",
+                'value': values['close'],
+                'threshold': values['donchian_high_prior']
+            })
+        
+        return alerts
@@ -1,45 +1,77 @@
-from typing import List, Dict
-import yfinance as yf
+from typing import Callable, List, Dict, Optional
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import requests
+import logging
 from bs4 import BeautifulSoup
 
+from .stock_analyzer import StockAnalyzer
+from .info_cache import info_cache
+from .indicator_cache import indicator_cache
+
+logger = logging.getLogger(__name__)
+
 class StockScanner:
+    # 扫描用到的公司信息字段，均为日级别更新
+    INFO_FIELDS = ['marketCap', 'forwardPE', 'institutionalOwnership']
+
     def __init__(self):
         self.market_cap_threshold = 5_000_000_000  # 50亿美元
         self.volume_surge_threshold = 300  # 300%
         self.institutional_ownership_threshold = 5.0  # 5%
+        # 价格数据优先读取本地价格库
+        self.analyzer = StockAnalyzer()
         
-    def scan_market(self) -> List[Dict]:
-        """扫描整个市场寻找符合条件的股票"""
+    def scan_market(self, progress: Optional[Callable[[int, int], None]] = None) -> List[Dict]:
+        """扫描整个市场寻找符合条件的股票
+
+        progress(已完成数, 总数) 在每只股票分析完后调用，抛出异常即中止扫描。
+        """
         # 获取纳斯达克所有股票列表（示例使用部分股票）
         symbols = ["AAPL", "MSFT", "NVDA", "AMD", "TSLA", "MARA", "RIOT", "COIN"]
-        results = []
-        
-        for symbol in symbols:
-            try:
-                stock_data = self.analyze_stock(symbol)
-                if stock_data and self.check_conditions(stock_data):
-                    results.append(self.generate_report(stock_data))
-            except Exception as e:
-                print(f"Error analyzing {symbol}: {str(e)}")
-                continue
-                
-        return results
+
+        # 并发批量下载价格数据，单只失败不影响整批
+        batch = self.analyzer.get_stock_data_many(symbols, '3mo', copy=False)
+        for symbol, error in batch['errors'].items():
+            logger.warning(f"Error fetching {symbol}: {error}")
+
+        scanned = [symbol for symbol in symbols if symbol in batch['data']]
+        executor = ThreadPoolExecutor(max_workers=self.analyzer.max_workers)
+        try:
+            reports = executor.map(lambda symbol: self._scan_symbol(symbol, batch['data'][symbol]), scanned)
+            results = []
+            for done, report in enumerate(reports, 1):
+                if report is not None:
+                    results.append(report)
+                if progress is not None:
+                    progress(done, len(scanned))
+            return results
+        finally:
+            # 中止时丢弃尚未开始的股票
+            executor.shutdown(cancel_futures=True)
+
+    def _scan_symbol(self, symbol: str, hist: pd.DataFrame):
+        """分析单只股票，满足条件时返回报告"""
+        try:
+            stock_data = self.analyze_stock(symbol, hist)
+            if stock_data and self.check_conditions(stock_data):
+                return self.generate_report(stock_data)
+        except Exception as e:
+            logger.error(f"Error analyzing {symbol}: {str(e)}")
+        return None
     
-    def analyze_stock(self, symbol: str) -> Dict:
+    def analyze_stock(self, symbol: str, hist: pd.DataFrame = None) -> Dict:
         """分析单个股票的所有相关数据"""
-        stock = yf.Ticker(symbol)
-        
-        # 获取历史数据
-        hist = stock.history(period='60d')  # 获取60天数据用于计算均值
-        if hist.empty:
+        # 获取历史数据（可由批量下载预先提供）
+        if hist is None:
+            hist = self.analyzer.get_stock_data(symbol, '3mo', copy=False)  # 获取近三个月数据用于计算均值
+        if hist is None or hist.empty:
             return None
             
-        # 获取公司信息
-        info = stock.info
+        # 获取公司信息（本地缓存，每天最多刷新一次）
+        info = info_cache.get(symbol, self.INFO_FIELDS)
         
         return {
             'symbol': symbol,
@@ -89,9 +121,8 @@ class StockScanner:
     def get_institutional_ownership(self, symbol: str) -> float:
         """获取机构持股比例"""
         try:
-            stock = yf.Ticker(symbol)
             # 实际应该从更可靠的数据源获取
-            return stock.info.get('institutionalOwnership', 0) * 100
+            return info_cache.get(symbol, self.INFO_FIELDS).get('institutionalOwnership', 0) * 100
         except:
             return 0
     
@@ -102,25 +133,28 @@ class StockScanner:
     def check_technical_breakout(self, stock_data: Dict) -> bool:
         """检查技术面是否突破"""
         hist = stock_data['history']
+        close = hist['Close'].to_numpy(dtype=np.float64)
+        volume = hist['Volume'].to_numpy(dtype=np.float64)
         
-        # 计算技术指标
+        # 计算技术指标（同一份数据上的重复调用直接命中指标缓存）
         # 1. 突破20日均线
-        ma20 = hist['Close'].rolling(window=20).mean()
-        price_above_ma = hist['Close'][-1] > ma20[-1]
+        ma20 = indicator_cache.compute(hist, 'sma', window=20)
+        price_above_ma = close[-1] > ma20[-1]
         
         # 2. RSI指标
-        delta = hist['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        rsi = 100 - (100 / (1 + rs))
+        rsi = indicator_cache.compute(hist, 'rsi', period=14)
         rsi_bullish = rsi[-1] > 50 and rsi[-1] < 70
         
         # 3. 成交量确认
-        volume_confirmation = hist['Volume'][-1] > hist['Volume'][-20:].mean()
+        volume_confirmation = volume[-1] > volume[-20:].mean()
         
         return price_above_ma and rsi_bullish and volume_confirmation
     
+    def check_channel_breakout(self, stock_data: Dict, window: int = 20) -> bool:
+        """检查收盘价是否突破此前N日最高价（唐奇安通道上轨）"""
+        breakout = indicator_cache.compute(stock_data['history'], 'breakout', window=window)
+        return bool(breakout[-1])
+    
     def generate_report(self, stock_data: Dict) -> Dict:
         """生成异动分析报告"""
         return {
@@ -143,6 +177,7 @@ class StockScanner:
         hist = stock_data['history']
         return {
             'ma_analysis': '突破20日均线' if self.check_technical_breakout(stock_data) else '未突破',
+            'channel_analysis': '突破20日高点' if self.check_channel_breakout(stock_data) else '通道内运行',
             'volume_analysis': f"成交量较30日均值增加{((stock_data['current_volume']/stock_data['avg_volume_30d'])-1)*100:.2f}%",
             'price_momentum': '上升趋势' if stock_data['price_change'] > 0 else '下降趋势'
         }
@@ -0,0 +1,591 @@
+import itertools
+import json
+import logging
+import math
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalIndicator(ABC):
+    """An indicator that is updated one bar at a time.
+
+    ``update`` appends a bar and ``revise`` replaces the last one (a bar
+    that was still forming when it was first seen); both are O(1). The
+    state round-trips through ``to_dict``/``indicator_from_dict`` so it can
+    be persisted between runs. Values follow the vectorized functions in
+    ``indicators``; ``value`` is None until enough bars were seen.
+    ``inputs`` names the bar fields passed to ``update``/``revise``.
+    """
+
+    inputs = ('close',)
+
+    @abstractmethod
+    def update(self, *bar) -> Optional[float]:
+        """Append a bar and return the new value"""
+
+    @abstractmethod
+    def revise(self, *bar) -> Optional[float]:
+        """Replace the last bar and return the new value"""
+
+    @property
+    @abstractmethod
+    def value(self) -> Optional[float]:
+        """Value after the last bar"""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'type': type(self).__name__, **self._state()}
+
+    @abstractmethod
+    def _state(self) -> Dict[str, Any]:
+        """Constructor arguments and running state as JSON values"""
+
+    @classmethod
+    @abstractmethod
+    def _from_state(cls, state: Dict[str, Any]) -> 'IncrementalIndicator':
+        """Rebuild an indicator from ``_state``"""
+
+
+class EMA(IncrementalIndicator):
+    """Exponential moving average with ``adjust=False`` weighting"""
+
+    def __init__(self, span: Optional[int] = None, alpha: Optional[float] = None):
+        self.alpha = alpha if alpha is not None else 2.0 / (span + 1)
+        self.current: Optional[float] = None
+        # 最后一根K线之前的值，用于修正最后一根K线
+        self.previous: Optional[float] = None
+
+    def _step(self, base: Optional[float], x: float) -> float:
+        return x if base is None else self.alpha * x + (1 - self.alpha) * base
+
+    def update(self, x):
+        self.previous = self.current
+        self.current = self._step(self.previous, x)
+        return self.current
+
+    def revise(self, x):
+        self.current = self._step(self.previous, x)
+        return self.current
+
+    @property
+    def value(self):
+        return self.current
+
+    def _state(self):
+        return {'alpha': self.alpha, 'current': self.current, 'previous': self.previous}
+
+    @classmethod
+    def _from_state(cls, state):
+        indicator = cls(alpha=state['alpha'])
+        indicator.current = state['current']
+        indicator.previous = state['previous']
+        return indicator
+
+
+class RollingSum(IncrementalIndicator):
+    """Sum of the last ``window`` values"""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.total = 0.0
+        self._updates = 0
+
+    def update(self, x):
+        if len(self.values) == self.window:
+            self.total -= self.values[0]
+        self.values.append(x)
+        self.total += x
+        self._updates += 1
+        # 定期重新求和，避免浮点误差累积
+        if self._updates % self.window == 0:
+            self.total = math.fsum(self.values)
+        return self.value
+
+    def revise(self, x):
+        if not self.values:
+            return self.update(x)
+        self.total += x - self.values[-1]
+        self.values[-1] = x
+        return self.value
+
+    @property
+    def value(self):
+        return self.total if len(self.values) == self.window else None
+
+    def _state(self):
+        return {'window': self.window, 'values': list(self.values)}
+
+    @classmethod
+    def _from_state(cls, state):
+        indicator = cls(state['window'])
+        indicator.values.extend(state['values'])
+        indicator.total = math.fsum(indicator.values)
+        return indicator
+
+
+class RollingMean(RollingSum):
+    """Mean of the last ``window`` values"""
+
+    @property
+    def value(self):
+        total = super().value
+        return total / self.window if total is not None else None
+
+
+class MACD(IncrementalIndicator):
+    """MACD line, signal line and histogram"""
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+
+    def update(self, close):
+        self.signal.update(self.fast.update(close) - self.slow.update(close))
+        return self.value
+
+    def revise(self, close):
+        self.signal.revise(self.fast.revise(close) - self.slow.revise(close))
+        return self.value
+
+    @property
+    def previous_line(self) -> Optional[float]:
+        if self.fast.previous is None:
+            return None
+        return self.fast.previous - self.slow.previous
+
+    @property
+    def value(self):
+        if self.fast.current is None:
+            return None
+        return self.fast.current - self.slow.current
+
+    def _state(self):
+        return {'fast': self.fast.to_dict(), 'slow': self.slow.to_dict(), 'signal': self.signal.to_dict()}
+
+    @classmethod
+    def _from_state(cls, state):
+        indicator = cls()
+        indicator.fast = indicator_from_dict(state['fast'])
+        indicator.slow = indicator_from_dict(state['slow'])
+        indicator.signal = indicator_from_dict(state['signal'])
+        return indicator
+
+
+class RSI(IncrementalIndicator):
+    """Relative strength index, simple ('sma') or Wilder ('wilder') averaging"""
+
+    def __init__(self, period: int = 14, method: str = 'sma'):
+        self.period = period
+        self.method = method
+        if method == 'wilder':
+            self.gains, self.losses = EMA(alpha=1.0 / period), EMA(alpha=1.0 / period)
+        else:
+            self.gains, self.losses = RollingMean(period), RollingMean(period)
+        self.last_close: Optional[float] = None
+        self.previous_close: Optional[float] = None
+
+    @staticmethod
+    def _split(delta: float):
+        return max(delta, 0.0), max(-delta, 0.0)
+
+    def update(self, close):
+        # 首根K线的涨跌记为0，与向量化实现一致
+        gain, loss = self._split(close - self.last_close if self.last_close is not None else 0.0)
+        self.previous_close, self.last_close = self.last_close, close
+        self.gains.update(gain)
+        self.losses.update(loss)
+        return self.value
+
+    def revise(self, close):
+        gain, loss = self._split(close - self.previous_close if self.previous_close is not None else 0.0)
+        self.last_close = close
+        self.gains.revise(gain)
+        self.losses.revise(loss)
+        return self.value
+
+    @property
+    def value(self):
+        gain, loss = self.gains.value, self.losses.value
+        if gain is None or loss is None:
+            return None
+        if loss == 0:
+            return 100.0 if gain > 0 else None
+        return 100 - 100 / (1 + gain / loss)
+
+    def _state(self):
+        return {
+            'period': self.period, 'method': self.method,
+            'gains': self.gains.to_dict(), 'losses': self.losses.to_dict(),
+            'last_close': self.last_close, 'previous_close': self.previous_close
+        }
+
+    @classmethod
+    def _from_state(cls, state):
+        indicator = cls(state['period'], state['method'])
+        indicator.gains = indicator_from_dict(state['gains'])
+        indicator.losses = indicator_from_dict(state['losses'])
+        indicator.last_close = state['last_close']
+        indicator.previous_close = state['previous_close']
+        return indicator
+
+
+class OBV(IncrementalIndicator):
+    """On-balance volume; a bar that does not close lower counts as up"""
+
+    inputs = ('close', 'volume')
+
+    def __init__(self):
+        self.current: Optional[float] = None
+        self.previous: Optional[float] = None
+        self.last_close: Optional[float] = None
+        self.previous_close: Optional[float] = None
+
+    @staticmethod
+    def _step(base, base_close, close, volume):
+        direction = -1.0 if base_close is not None and close - base_close <= 0 else 1.0
+        return (base or 0.0) + direction * volume
+
+    def update(self, close, volume):
+        self.previous, self.previous_close = self.current, self.last_close
+        self.current = self._step(self.previous, self.previous_close, close, volume)
+        self.last_close = close
+        return self.current
+
+    def revise(self, close, volume):
+        self.current = self._step(self.previous, self.previous_close, close, volume)
+        self.last_close = close
+        return self.current
+
+    @property
+    def value(self):
+        return self.current
+
+    def _state(self):
+        return {
+            'current': self.current, 'previous': self.previous,
+            'last_close': self.last_close, 'previous_close': self.previous_close
+        }
+
+    @classmethod
+    def _from_state(cls, state):
+        indicator = cls()
+        indicator.current = state['current']
+        indicator.previous = state['previous']
+        indicator.last_close = state['last_close']
+        indicator.previous_close = state['previous_close']
+        return indicator
+
+
+class MFI(IncrementalIndicator):
+    """Money flow index over ``period`` bars"""
+
+    inputs = ('high', 'low', 'close', 'volume')
+
+    def __init__(self, period: int = 14):
+        self.period = period
+        self.positive = RollingSum(period)
+        self.negative = RollingSum(period)
+        self.last_typical: Optional[float] = None
+        self.previous_typical: Optional[float] = None
+
+    @staticmethod
+    def _flows(base, high, low, close, volume):
+        typical = (high + low + close) / 3
+        flow = typical * volume
+        if base is None:
+            return typical, 0.0, 0.0
+        return typical, flow if typical > base else 0.0, flow if typical < base else 0.0
+
+    def update(self, high, low, close, volume):
+        self.previous_typical = self.last_typical
+        self.last_typical, positive, negative = self._flows(self.previous_typical, high, low, close, volume)
+        self.positive.update(positive)
+        self.negative.update(negative)
+        return self.value
+
+    def revise(self, high, low, close, volume):
+        self.last_typical, positive, negative = self._flows(self.previous_typical, high, low, close, volume)
+        self.positive.revise(positive)
+        self.negative.revise(negative)
+        return self.value
+
+    @property
+    def value(self):
+        positive, negative = self.positive.value, self.negative.value
+        if positive is None or negative is None:
+            return None
+        if negative == 0:
+            return 100.0 if positive > 0 else None
+        return 100 - 100 / (1 + positive / negative)
+
+    def _state(self):
+        return {
+            'period': self.period,
+            'positive': self.positive.to_dict(), 'negative': self.negative.to_dict(),
+            'last_typical': self.last_typical, 'previous_typical': self.previous_typical
+        }
+
+    @classmethod
+    def _from_state(cls, state):
+        indicator = cls(state['period'])
+        indicator.positive = indicator_from_dict(state['positive'])
+        indicator.negative = indicator_from_dict(state['negative'])
+        indicator.last_typical = state['last_typical']
+        indicator.previous_typical = state['previous_typical']
+        return indicator
+
+
+class RunningExtreme(IncrementalIndicator):
+    """Highest (``mode='max'``) or lowest (``'min'``) ``source`` value of the last ``window`` bars.
+
+    Settled bars sit in a monotonic deque of (bar number, value): each bar
+    enters and leaves it once, so updates are amortized O(1), and the last
+    bar is kept apart so revising it is O(1) too. ``prior`` is the extreme
+    of the ``window`` bars before the last one, the level a breakout has to
+    clear. With ``min_periods`` below ``window`` the extreme of a shorter
+    history is reported instead of None.
+    """
+
+    def __init__(self, window: int, mode: str = 'max', source: str = 'high', min_periods: Optional[int] = None):
+        self.window = window
+        self.mode = mode
+        self.source = source
+        self.inputs = (source,)
+        self.min_periods = min_periods or window
+        self.settled = deque()
+        self.last: Optional[float] = None
+        self.count = 0
+
+    def _dominates(self, a: float, b: float) -> bool:
+        return a >= b if self.mode == 'max' else a <= b
+
+    def update(self, x):
+        if self.last is not None:
+            while self.settled and self._dominates(self.last, self.settled[-1][1]):
+                self.settled.pop()
+            self.settled.append((self.count - 1, self.last))
+        # 只保留最后一根K线之前的window根
+        while self.settled and self.settled[0][0] < self.count - self.window:
+            self.settled.popleft()
+        self.last = x
+        self.count += 1
+        return self.value
+
+    def revise(self, x):
+        if self.last is None:
+            return self.update(x)
+        self.last = x
+        return self.value
+
+    def _extreme(self, first: int) -> Optional[float]:
+        # 单调队列的队首即最值；队首已滑出窗口时，下一个元素就是剩余部分的最值
+        for number, value in itertools.islice(self.settled, 2):
+            if number >= first:
+                return value
+        return None
+
+    @property
+    def value(self):
+        if self.count < self.min_periods:
+            return None
+        best = self._extreme(self.count - self.window)
+        if best is None or self._dominates(self.last, best):
+            return self.last
+        return best
+
+    @property
+    def prior(self) -> Optional[float]:
+        if self.count - 1 < self.min_periods or not self.settled:
+            return None
+        return self.settled[0][1]
+
+    def _state(self):
+        return {
+            'window': self.window, 'mode': self.mode, 'source': self.source, 'min_periods': self.min_periods,
+            'settled': [list(item) for item in self.settled], 'last': self.last, 'count': self.count
+        }
+
+    @classmethod
+    def _from_state(cls, state):
+        indicator = cls(state['window'], state['mode'], state['source'], state['min_periods'])
+        indicator.settled.extend(tuple(item) for item in state['settled'])
+        indicator.last = state['last']
+        indicator.count = state['count']
+        return indicator
+
+
+INDICATOR_TYPES = {
+    cls.__name__: cls for cls in (EMA, RollingSum, RollingMean, MACD, RSI, OBV, MFI, RunningExtreme)
+}
+
+
+def indicator_from_dict(data: Dict[str, Any]) -> IncrementalIndicator:
+    return INDICATOR_TYPES[data['type']]._from_state(data)
+
+
+class IndicatorSet:
+    """The streaming indicators of one symbol, fed with OHLCV bars.
+
+    A bar with the timestamp of the last bar revises it, a newer bar is
+    appended and an older one is ignored.
+    """
+
+    def __init__(self):
+        self.indicators: Dict[str, IncrementalIndicator] = {
+            'sma_20': RollingMean(20),
+            'sma_50': RollingMean(50),
+            'ema_12': EMA(12),
+            'ema_26': EMA(26),
+            'macd': MACD(),
+            'rsi': RSI(14),
+            'obv': OBV(),
+            'mfi': MFI(14),
+            # 52周高低点；上市不足一年时取已有K线的极值
+            'high_52w': RunningExtreme(252, 'max', 'high', min_periods=1),
+            'low_52w': RunningExtreme(252, 'min', 'low', min_periods=1),
+            # 20日唐奇安通道
+            'donchian_high': RunningExtreme(20, 'max', 'high'),
+            'donchian_low': RunningExtreme(20, 'min', 'low')
+        }
+        self.last_ts: Optional[int] = None
+        self.last_bar: Optional[list] = None
+        self.bars = 0
+
+    def push(self, ts: int, high: float, low: float, close: float, volume: float) -> bool:
+        """Feed one bar; returns False if it was older than or identical to the last one"""
+        ts = int(ts)
+        if self.last_ts is not None and ts < self.last_ts:
+            return False
+        bar = [float(high), float(low), float(close), float(volume)]
+        if ts == self.last_ts and bar == self.last_bar:
+            return False
+        method = 'revise' if ts == self.last_ts else 'update'
+        fields = dict(zip(('high', 'low', 'close', 'volume'), bar))
+        for indicator in self.indicators.values():
+            getattr(indicator, method)(*(fields[name] for name in indicator.inputs))
+        if method == 'update':
+            self.bars += 1
+        self.last_ts = ts
+        self.last_bar = bar
+        return True
+
+    def push_many(self, timestamps: Sequence[int], high, low, close, volume) -> int:
+        """Feed the bars at or after the last seen timestamp; returns how many changed the state"""
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        start = 0 if self.last_ts is None else int(np.searchsorted(timestamps, self.last_ts, side='left'))
+        return sum(
+            self.push(timestamps[i], high[i], low[i], close[i], volume[i])
+            for i in range(start, len(timestamps))
+        )
+
+    def values(self) -> Dict[str, Optional[float]]:
+        values = {name: indicator.value for name, indicator in self.indicators.items()}
+        macd = self.indicators['macd']
+        values['macd_signal'] = macd.signal.current
+        values['macd_previous'] = macd.previous_line
+        values['macd_signal_previous'] = macd.signal.previous
+        # 突破判断与此前N根K线的极值比较，不含最后一根
+        for name in ('high_52w', 'low_52w', 'donchian_high', 'donchian_low'):
+            values[f'{name}_prior'] = self.indicators[name].prior
+        close = values['close'] = self.last_bar[2] if self.last_bar else None
+        values['breakout_20'] = (
+            close > values['donchian_high_prior'] if None not in (close, values['donchian_high_prior']) else None
+        )
+        return values
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'last_ts': self.last_ts,
+            'last_bar': self.last_bar,
+            'bars': self.bars,
+            'indicators': {name: indicator.to_dict() for name, indicator in self.indicators.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'IndicatorSet':
+        indicator_set = cls()
+        if set(data['indicators']) != set(indicator_set.indicators):
+            # 指标集合已变化，旧状态无法沿用
+            raise ValueError("indicator set changed")
+        indicator_set.last_ts = data['last_ts']
+        indicator_set.last_bar = data.get('last_bar')
+        indicator_set.bars = data['bars']
+        for name, state in data['indicators'].items():
+            indicator_set.indicators[name] = indicator_from_dict(state)
+        return indicator_set
+
+
+class IndicatorStateStore:
+    """Per-symbol IndicatorSets kept in memory and persisted as JSON.
+
+    ``sync`` feeds only the bars newer than the saved state, so keeping
+    indicators current costs O(new bars) per symbol instead of a full
+    recomputation.
+    """
+
+    def __init__(self, root: Optional[Path] = None):
+        default_root = Path(__file__).parent.parent / 'data' / 'indicator_state'
+        self.root = Path(root or os.getenv('INDICATOR_STATE_DIR', default_root))
+        self._states: Dict[tuple, IndicatorSet] = {}
+        self._locks: Dict[tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def lock(self, symbol: str, interval: str = '1d') -> threading.Lock:
+        """Return the lock guarding one symbol's state"""
+        key = (symbol.upper(), interval)
+        with self._lock:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+
+    def _path(self, symbol: str, interval: str) -> Path:
+        return self.root / interval / f"{symbol.upper().replace(os.sep, '_')}.json"
+
+    def get(self, symbol: str, interval: str = '1d') -> IndicatorSet:
+        key = (symbol.upper(), interval)
+        with self._lock:
+            if key not in self._states:
+                self._states[key] = self._load(symbol, interval)
+            return self._states[key]
+
+    def _load(self, symbol: str, interval: str) -> IndicatorSet:
+        try:
+            return IndicatorSet.from_dict(json.loads(self._path(symbol, interval).read_text(encoding='utf-8')))
+        except FileNotFoundError:
+            return IndicatorSet()
+        except Exception as e:
+            logger.warning(f"Discarding unreadable indicator state for {symbol}: {str(e)}")
+            return IndicatorSet()
+
+    def save(self, symbol: str, state: IndicatorSet, interval: str = '1d'):
+        path = self._path(symbol, interval)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(state.to_dict()), encoding='utf-8')
+        os.replace(tmp_path, path)
+
+    def sync(self, symbol: str, timestamps, high, low, close, volume, interval: str = '1d') -> IndicatorSet:
+        """Bring a symbol's state up to date with its bars and persist it if it changed"""
+        with self.lock(symbol, interval):
+            state = self.get(symbol, interval)
+            if len(timestamps) and state.last_ts is not None and state.last_ts < int(timestamps[0]):
+                # 保存的状态早于现有数据的起点，无法衔接，重新计算
+                state = IndicatorSet()
+                with self._lock:
+                    self._states[(symbol.upper(), interval)] = state
+            if state.push_many(timestamps, high, low, close, volume):
+                self.save(symbol, state, interval)
+            return state
+
+
+# Create a singleton instance
+indicator_state_store = IndicatorStateStore()
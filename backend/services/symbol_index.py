@@ -0,0 +1,228 @@
+import csv
+import json
+import logging
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from .market_data import market_data
+
+logger = logging.getLogger(__name__)
+
+# Quote types accepted from the remote search fallback
+REMOTE_QUOTE_TYPES = ('EQUITY', 'ETF', 'CRYPTOCURRENCY')
+
+
+class _TrieNode:
+    __slots__ = ('children', 'symbols')
+
+    def __init__(self):
+        self.children: Dict[str, '_TrieNode'] = {}
+        self.symbols: List[str] = []
+
+
+class SymbolIndex:
+    """In-process symbol search over a local listing.
+
+    Symbols and the words of company names go into prefix tries, and names
+    are also indexed by character trigrams for fuzzy matching. Results are
+    ranked: exact symbol, symbol prefix, name word prefix, then fuzzy name
+    similarity.
+    """
+
+    # 模糊匹配：查询的trigram至少有一半出现在公司名称中
+    MIN_SIMILARITY = 0.5
+    MIN_FUZZY_LENGTH = 3
+
+    def __init__(self):
+        self._listing: Dict[str, Dict[str, Any]] = {}
+        self._symbol_trie = _TrieNode()
+        self._word_trie = _TrieNode()
+        self._grams: Dict[str, set] = defaultdict(set)
+        self._gram_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._listing)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol.upper() in self._listing
+
+    def get(self, symbol: str) -> Optional[Dict[str, Any]]:
+        entry = self._listing.get(symbol.upper())
+        return self._result(symbol.upper(), entry) if entry is not None else None
+
+    def add(self, symbol: str, name: str = '', exchange: str = ''):
+        symbol = symbol.strip().upper()
+        if not symbol:
+            return
+        with self._lock:
+            # 先加载的列表优先
+            if symbol in self._listing:
+                return
+            self._listing[symbol] = {'name': name or '', 'exchange': exchange or ''}
+
+            self._insert(self._symbol_trie, symbol.lower(), symbol)
+            for word in set(self._words(name)):
+                self._insert(self._word_trie, word, symbol)
+
+            grams = self._trigrams(name)
+            self._gram_counts[symbol] = len(grams)
+            for gram in grams:
+                self._grams[gram].add(symbol)
+
+    def add_listing(self, listing: Dict[str, Dict[str, Any]]):
+        """Add entries shaped like ``us_stocks.json``: {symbol: {name, exchange}}"""
+        for symbol, entry in listing.items():
+            self.add(symbol, entry.get('name', ''), entry.get('exchange', ''))
+
+    def load_file(self, path: Path):
+        """Load a JSON listing or a CSV/pipe-delimited exchange listing file.
+
+        Delimited files need a header with a symbol column (``Symbol``,
+        ``ACT Symbol`` ...) and a name column (``Name``, ``Security Name`` ...).
+        """
+        path = Path(path)
+        if path.suffix.lower() == '.json':
+            data = json.loads(path.read_text(encoding='utf-8'))
+            if isinstance(data, list):
+                data = {item['symbol']: item for item in data if item.get('symbol')}
+            self.add_listing(data)
+            return
+
+        text = path.read_text(encoding='utf-8')
+        delimiter = '|' if '|' in text.splitlines()[0] else ','
+        for row in csv.DictReader(text.splitlines(), delimiter=delimiter):
+            fields = {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+            symbol = next((value for key, value in fields.items() if 'symbol' in key), '')
+            name = next((value for key, value in fields.items() if 'name' in key), '')
+            exchange = fields.get('exchange', '')
+            # nasdaqlisted.txt以文件信息行结尾
+            if symbol and not symbol.lower().startswith('file creation'):
+                self.add(symbol, name, exchange)
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Ranked local search by symbol prefix and fuzzy company name"""
+        query = query.strip()
+        if not query:
+            return []
+
+        scores: Dict[str, float] = {}
+
+        def score(symbol: str, value: float):
+            if value > scores.get(symbol, 0):
+                scores[symbol] = value
+
+        lowered = query.lower()
+        upper = query.upper()
+        if upper in self._listing:
+            score(upper, 1000)
+
+        for symbol in self._prefix(self._symbol_trie, lowered, limit * 5):
+            score(symbol, 800 - 10 * (len(symbol) - len(query)))
+
+        words = self._words(query)
+        if words:
+            # 公司名称中任一单词以查询的最后一个词为前缀，其余词需完整出现
+            candidates = self._prefix(self._word_trie, words[-1], limit * 20)
+            for symbol in candidates:
+                name_words = self._words(self._listing[symbol]['name'])
+                if all(word in name_words for word in words[:-1]):
+                    score(symbol, 600 - len(name_words))
+
+        query_grams = self._trigrams(query)
+        if len(lowered) >= self.MIN_FUZZY_LENGTH and query_grams:
+            common = Counter()
+            for gram in query_grams:
+                common.update(self._grams.get(gram, ()))
+            for symbol, shared in common.items():
+                coverage = shared / len(query_grams)
+                if coverage >= self.MIN_SIMILARITY:
+                    # 名称越长，同样的覆盖率得分越低
+                    jaccard = shared / (len(query_grams) + self._gram_counts[symbol] - shared)
+                    score(symbol, 300 * coverage + 100 * jaccard)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [self._result(symbol, self._listing[symbol]) for symbol, _ in ranked]
+
+    @staticmethod
+    def _result(symbol: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        return {'symbol': symbol, 'name': entry['name'], 'exchange': entry['exchange']}
+
+    @staticmethod
+    def _words(text: str) -> List[str]:
+        return re.findall(r'[a-z0-9]+', (text or '').lower())
+
+    @staticmethod
+    def _trigrams(text: str) -> set:
+        normalized = ' '.join(re.findall(r'[a-z0-9]+', (text or '').lower()))
+        if not normalized:
+            return set()
+        padded = f'  {normalized} '
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    @staticmethod
+    def _insert(root: _TrieNode, key: str, symbol: str):
+        node = root
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+        node.symbols.append(symbol)
+
+    @staticmethod
+    def _prefix(root: _TrieNode, prefix: str, limit: int) -> List[str]:
+        """Symbols stored under a prefix, shortest keys first"""
+        node = root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+
+        found: List[str] = []
+        level = [node]
+        while level and len(found) < limit:
+            next_level = []
+            for current in level:
+                found.extend(current.symbols)
+                next_level.extend(current.children[char] for char in sorted(current.children))
+            level = next_level
+        return list(dict.fromkeys(found))[:limit]
+
+
+def build_symbol_index(paths: Iterable[Path]) -> SymbolIndex:
+    index = SymbolIndex()
+    for path in paths:
+        try:
+            index.load_file(path)
+        except Exception as e:
+            logger.error(f"Error loading symbol listing {path}: {str(e)}")
+    logger.info(f"Symbol index built with {len(index)} symbols")
+    return index
+
+
+def search_symbols(query: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """Search the local index, falling back to the remote search API when nothing matches"""
+    results = symbol_index.search(query, limit)
+    if results:
+        return results
+
+    data = market_data.search(query)
+    results = []
+    for item in data.get('quotes', [])[:limit]:
+        if item.get('quoteType') in REMOTE_QUOTE_TYPES:
+            results.append({
+                'symbol': item.get('symbol'),
+                'name': item.get('longname') or item.get('shortname'),
+                'exchange': item.get('exchange')
+            })
+    return results
+
+
+# 启动时从本地股票列表构建，SYMBOL_LISTING_FILE 可指定完整的交易所列表
+_listing_files = [Path(__file__).parent.parent / 'data' / 'us_stocks.json']
+if os.getenv('SYMBOL_LISTING_FILE'):
+    _listing_files.append(Path(os.getenv('SYMBOL_LISTING_FILE')))
+
+symbol_index = build_symbol_index(_listing_files)
@@ -0,0 +1,195 @@
+"""Report signals for every bar of a price history in one pass.
+
+``signal_timeline`` produces, for each bar, what ``signals.evaluate``
+would report if it were run on the history up to and including that bar,
+plus the next trading day's outcome. Each signal is computed with
+whole-array operations instead of once per date; results match the
+per-date evaluation up to floating-point rounding (the MACD there is
+warmed up on ``EMA_WARMUP`` bars rather than the full history).
+"""
+import logging
+import warnings
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from . import indicators
+from .signals import YEAR_BARS
+
+logger = logging.getLogger(__name__)
+
+
+def _columns(data) -> Dict[str, np.ndarray]:
+    return {
+        column: np.asarray(data[column], dtype=np.float64)
+        for column in ('Open', 'High', 'Low', 'Close', 'Volume')
+    }
+
+
+def _labels(conditions: List[np.ndarray], choices: List[str], default: str) -> np.ndarray:
+    # 条件按优先级排列，与逐日实现中的if/elif顺序一致
+    return np.select(conditions, choices, default=default).astype(object)
+
+
+def _returns(close: np.ndarray) -> np.ndarray:
+    """Return of each bar against the previous close, NaN for the first"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.r_[np.nan, close[1:] / close[:-1] - 1]
+
+
+def _trailing(x: np.ndarray, window: int) -> np.ndarray:
+    """(bars, window) view of the ``window`` values ending at each bar, NaN-padded on the left"""
+    padded = np.r_[np.full(window - 1, np.nan), x]
+    return sliding_window_view(padded, window)
+
+
+def volume_alerts(volume: np.ndarray) -> np.ndarray:
+    """成交量异动检测"""
+    avg_volume = indicators.sma(volume, 5)
+    with np.errstate(invalid='ignore'):
+        return _labels(
+            [volume > avg_volume * 2, volume < avg_volume * 0.5],
+            ["成交量突破：当前成交量是5日均值的2倍以上", "交易清淡：当前成交量不足5日均值一半"],
+            "成交量处于正常波动区间"
+        )
+
+
+def technical_signals(close: np.ndarray) -> List[List[str]]:
+    """MACD交叉与RSI超买超卖"""
+    macd, macd_signal, _ = indicators.macd(close)
+    above = macd > macd_signal
+    below = macd < macd_signal
+    # 前一根K线MACD不高于（金叉）或不低于（死叉）信号线
+    golden = np.r_[False, above[1:] & ~above[:-1] & ~np.isnan(macd[:-1])]
+    death = np.r_[False, below[1:] & ~below[:-1] & ~np.isnan(macd[:-1])]
+    rsi = indicators.rsi(close, 14)
+
+    timeline = []
+    for i in range(len(close)):
+        signals = []
+        if golden[i]:
+            signals.append("MACD金叉")
+        elif death[i]:
+            signals.append("MACD死叉")
+        if rsi[i] > 70:
+            signals.append(f"RSI超买 ({rsi[i]:.1f})")
+        elif rsi[i] < 30:
+            signals.append(f"RSI超卖 ({rsi[i]:.1f})")
+        timeline.append(signals)
+    return timeline
+
+
+def volatility_alerts(close: np.ndarray) -> np.ndarray:
+    """波动率聚类分析：阈值取最近一年收益率标准差的1.5倍"""
+    returns = _returns(close)
+    window = _trailing(returns, YEAR_BARS)
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        # 收益率不足两个的窗口标准差为NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        counts = np.sum(~np.isnan(window), axis=1)
+        threshold = np.where(counts > 1, np.nanstd(window, axis=1, ddof=1), np.nan) * 1.5
+        clusters = np.sum(np.abs(_trailing(returns, 5)) > threshold[:, np.newaxis], axis=1)
+    return _labels(
+        [clusters >= 3],
+        ["波动率聚集预警：近期出现3次以上异常波动"],
+        "波动率正常"
+    )
+
+
+def money_flows(high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray) -> np.ndarray:
+    """资金流向分析"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        price_change = _returns(close) * 100
+        volume_change = _returns(volume) * 100
+        mfi = indicators.mfi(high, low, close, volume, 10)
+
+        # OBV按最近一年的窗口重新起算，归一化用窗口内OBV绝对值的均值
+        obv = indicators.obv(close, volume)
+        obv_change = np.r_[np.full(3, np.nan), obv[3:] - obv[:-3]]
+        window = YEAR_BARS + 1
+        start = np.maximum(np.arange(len(close)) - window + 1, 0)
+        offset = volume[start] - obv[start]
+        scale = np.nanmean(np.abs(_trailing(obv, window) + offset[:, np.newaxis]), axis=1)
+        obv_change = obv_change / scale * 100
+
+        up = (price_change > 2) & (volume_change > 30) & (obv_change > 3)
+        down = (price_change < -2) & (volume_change > 30) & (obv_change < -3)
+        labels = _labels(
+            [
+                up & (mfi > 70), up, down & (mfi < 30), down,
+                (mfi > 70) & (obv_change < -3), (mfi < 30) & (obv_change > 3),
+                (mfi > 55) & (obv_change > 2), (mfi < 45) & (obv_change < -2),
+                (price_change > 0.5) & (volume_change > 10), (price_change < -0.5) & (volume_change > 10)
+            ],
+            [
+                "主力资金大量涌入：强势上涨", "资金加速流入：看涨信号",
+                "资金加速流出：看空信号", "资金持续流出：注意风险",
+                "资金流出警告：获利回吐", "资金流入信号：低位吸筹",
+                "资金持续流入：多头占优", "资金逐步流出：空头占优",
+                "资金小幅流入：短线看多", "资金小幅流出：短线谨慎"
+            ],
+            "资金流向观望：等待信号"
+        )
+    # 只有一根K线时无法计算涨跌
+    labels[:1] = "资金流向分析异常"
+    return labels
+
+
+def signal_timeline(data, timestamps: np.ndarray) -> Dict[str, Any]:
+    """Every report signal for every bar, with the next bar's outcome.
+
+    Returns columns aligned with ``timestamps``: the bar's prices and
+    change, ``volume_alert``, ``technical_signals``, ``volatility_alert``,
+    ``money_flow`` and ``next_price``/``next_change`` (NaN for the last bar).
+    """
+    columns = _columns(data)
+    open_, high, low, close, volume = (columns[name] for name in ('Open', 'High', 'Low', 'Close', 'Volume'))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = (close - open_) / open_ * 100
+    next_price = np.r_[close[1:], np.nan]
+    next_change = np.r_[change[1:], np.nan]
+
+    return {
+        'timestamps': np.asarray(timestamps, dtype=np.int64),
+        'open': open_, 'high': high, 'low': low, 'price': close,
+        'change': change, 'volume': volume / 1e6,
+        'volume_alert': volume_alerts(volume),
+        'technical_signals': technical_signals(close),
+        'volatility_alert': volatility_alerts(close),
+        'money_flow': money_flows(high, low, close, volume),
+        'next_price': next_price,
+        'next_change': next_change
+    }
+
+
+def summarize(timeline: Dict[str, Any], rows: Optional[slice] = None) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Next-day outcome grouped by signal label: count, share of up days and mean change"""
+    rows = rows or slice(None)
+    next_change = timeline['next_change'][rows]
+    known = ~np.isnan(next_change)
+    summary = {}
+
+    for name in ('volume_alert', 'volatility_alert', 'money_flow', 'technical_signals'):
+        values = timeline[name][rows]
+        if name == 'technical_signals':
+            # RSI信号只按超买/超卖归类，不区分具体数值
+            groups: Dict[str, List[int]] = {}
+            for i, signals in enumerate(values):
+                for signal in signals:
+                    groups.setdefault(signal.split(' (')[0], []).append(i)
+            groups = {label: np.asarray(positions, dtype=np.int64) for label, positions in groups.items()}
+        else:
+            groups = {label: np.flatnonzero(values == label) for label in dict.fromkeys(values)}
+
+        summary[name] = {}
+        for label, positions in groups.items():
+            positions = positions[known[positions]]
+            outcomes = next_change[positions]
+            summary[name][label] = {
+                'count': int(len(positions)),
+                'up_ratio': round(float(np.mean(outcomes > 0)), 4) if len(outcomes) else None,
+                'avg_next_change': round(float(np.mean(outcomes)), 4) if len(outcomes) else None
+            }
+    return summary
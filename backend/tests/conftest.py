@@ -0,0 +1,33 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 与Flask应用一致，从backend目录导入services
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_ohlcv(bars: int = 600, seed: int = 0, start: str = '2020-01-01') -> pd.DataFrame:
+    """Random-walk daily OHLCV bars on business days"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.cumprod(1 + rng.normal(0.0005, 0.02, bars))
+    open_ = close * (1 + rng.normal(0, 0.005, bars))
+    spread = np.abs(rng.normal(0, 0.01, bars))
+    return pd.DataFrame({
+        'Open': open_,
+        'High': np.maximum(open_, close) * (1 + spread),
+        'Low': np.minimum(open_, close) * (1 - spread),
+        'Close': close,
+        'Volume': rng.integers(100_000, 10_000_000, bars).astype(np.float64)
+    }, index=pd.date_range(start, periods=bars, freq='B'))
+
+
+@pytest.fixture
+def ohlcv() -> pd.DataFrame:
+    return make_ohlcv()
+
+
+def timestamps_of(frame: pd.DataFrame) -> np.ndarray:
+    return frame.index.asi8 // 10**9
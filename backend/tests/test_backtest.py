@@ -0,0 +1,82 @@
+import math
+
+import numpy as np
+import pytest
+
+from services import backtest
+
+# sma_cross(fast=1, slow=2)：收盘价高于前一根时做多
+CLOSE = np.array([10.0, 11.0, 12.0, 11.0, 10.0, 12.0, 13.0])
+UP_BARS = {'type': 'sma_cross', 'fast': 1, 'slow': 2}
+
+
+def run_close(close, spec, cost_bps=0.0):
+    timestamps = np.arange(len(close)) * 86400 + 1_700_000_000
+    return backtest.run({'Close': close}, timestamps, spec, cost_bps)
+
+
+def test_position_is_held_from_the_next_bar():
+    result = run_close(CLOSE, UP_BARS)
+    np.testing.assert_array_equal(result['targets'], [0, 1, 1, 0, 0, 1, 1])
+    np.testing.assert_array_equal(result['positions'], [0, 0, 1, 1, 0, 0, 1])
+
+
+def test_returns_and_equity_without_costs():
+    result = run_close(CLOSE, UP_BARS)
+    expected = [0, 0, 12 / 11 - 1, 11 / 12 - 1, 0, 0, 13 / 12 - 1]
+    np.testing.assert_allclose(result['returns'], expected)
+    np.testing.assert_allclose(result['equity'], np.cumprod(1 + np.array(expected)))
+    assert result['metrics']['total_return'] == pytest.approx((13 / 12 - 1) * 100)
+    np.testing.assert_allclose(result['benchmark'], CLOSE / CLOSE[0])
+    assert result['benchmark_metrics']['total_return'] == pytest.approx(30.0)
+
+
+def test_costs_are_charged_on_position_changes():
+    free = run_close(CLOSE, UP_BARS)
+    costly = run_close(CLOSE, UP_BARS, cost_bps=10)
+    # 第1、3、5根K线调仓，每次扣除0.1%
+    np.testing.assert_allclose(costly['returns'] - free['returns'], [0, -0.001, 0, -0.001, 0, -0.001, 0])
+    assert costly['cost_bps'] == pytest.approx(10)
+
+
+def test_trades():
+    trades = run_close(CLOSE, UP_BARS)['trades']
+    assert len(trades) == 2
+
+    first, last = trades
+    assert (first['direction'], first['entry_price'], first['exit_price'], first['bars']) == ('long', 11.0, 11.0, 2)
+    assert first['return'] == pytest.approx(0.0)
+    assert not first['open']
+
+    assert (last['entry_price'], last['exit_price'], last['exit_date']) == (12.0, 13.0, None)
+    assert last['return'] == pytest.approx((13 / 12 - 1) * 100)
+    assert last['open']
+
+
+def test_metrics():
+    result = run_close(CLOSE, UP_BARS)
+    returns = result['returns']
+    metrics = result['metrics']
+    assert metrics['trades'] == 2
+    # 唯一已平仓的交易收益为0，不算盈利
+    assert metrics['win_rate'] == 0
+    assert metrics['exposure'] == pytest.approx(3 / 7 * 100)
+    assert metrics['max_drawdown'] == pytest.approx((11 / 12 - 1) * 100)
+    assert metrics['sharpe_ratio'] == pytest.approx(returns.mean() / returns.std(ddof=1) * math.sqrt(252))
+
+
+def test_buy_hold_matches_benchmark():
+    result = run_close(CLOSE, {'type': 'buy_hold'})
+    # 首根K线收盘买入，之后每根K线持有
+    np.testing.assert_allclose(result['equity'], result['benchmark'])
+    assert result['trades'][0]['open']
+
+
+def test_spec_validation():
+    with pytest.raises(ValueError):
+        backtest.parse_spec({'type': 'no_such_strategy'})
+    with pytest.raises(ValueError):
+        backtest.parse_spec({'type': 'sma_cross', 'window': 3})
+    assert backtest.parse_spec({'type': 'sma_cross', 'fast': '5'}) == {'type': 'sma_cross', 'fast': 5, 'slow': 50}
+    with pytest.raises(ValueError):
+        run_close(CLOSE[:1], UP_BARS)
@@ -0,0 +1,170 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from conftest import make_ohlcv
+from services.backtest_cache import BacktestCache
+from services.jobs import JobCancelled
+
+PARAMS = {'spec': {'type': 'sma_cross', 'fast': 20, 'slow': 50}, 'cost_bps': 5.0}
+
+
+class Counter:
+    """compute callback that counts its calls"""
+
+    def __init__(self, result=None):
+        self.calls = 0
+        self.result = result or {'total_return': 12.5}
+
+    def __call__(self, progress):
+        self.calls += 1
+        progress(1, 1)
+        return dict(self.result)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return BacktestCache(root=tmp_path)
+
+
+@pytest.fixture
+def frames():
+    return {'TEST': make_ohlcv(300)}
+
+
+def test_hit_after_miss(cache, frames):
+    compute = Counter()
+    first = cache.get('backtest', PARAMS, frames, compute)
+    second = cache.get('backtest', PARAMS, frames, compute)
+    assert compute.calls == 1
+    assert (first['cached'], second['cached']) == (False, True)
+    assert first['total_return'] == second['total_return'] == 12.5
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_survives_restart(tmp_path, frames):
+    BacktestCache(root=tmp_path).get('backtest', PARAMS, frames, Counter())
+    compute = Counter()
+    result = BacktestCache(root=tmp_path).get('backtest', PARAMS, frames, compute)
+    assert compute.calls == 0
+    assert result['cached']
+
+
+def test_changed_bars_miss(cache, frames):
+    compute = Counter()
+    cache.get('backtest', PARAMS, frames, compute)
+
+    revised = frames['TEST'].copy()
+    revised.iloc[-1, revised.columns.get_loc('Close')] += 0.01
+    cache.get('backtest', PARAMS, {'TEST': revised}, compute)
+    extended = make_ohlcv(301)
+    cache.get('backtest', PARAMS, {'TEST': extended}, compute)
+    assert compute.calls == 3
+
+
+def test_changed_params_miss(cache, frames):
+    compute = Counter()
+    cache.get('backtest', PARAMS, frames, compute)
+    cache.get('backtest', dict(PARAMS, cost_bps=10.0), frames, compute)
+    cache.get('sweep', PARAMS, frames, compute)
+    assert compute.calls == 3
+
+
+def test_symbol_case_does_not_matter(cache, frames):
+    compute = Counter()
+    cache.get('backtest', PARAMS, frames, compute)
+    cache.get('backtest', PARAMS, {'test': frames['TEST']}, compute)
+    assert compute.calls == 1
+
+
+def test_results_are_json_values(cache, frames):
+    result = cache.get('backtest', PARAMS, frames, Counter({'equity': np.array([1.0, 1.5]), 'trades': np.int64(3)}))
+    assert result['equity'] == [1.0, 1.5]
+    assert type(result['trades']) is int
+
+
+def test_unreadable_file_is_recomputed(tmp_path, frames):
+    BacktestCache(root=tmp_path).get('backtest', PARAMS, frames, Counter())
+    for path in tmp_path.glob('*/*.json'):
+        path.write_text('{not json')
+    compute = Counter()
+    BacktestCache(root=tmp_path).get('backtest', PARAMS, frames, compute)
+    assert compute.calls == 1
+
+
+def test_prunes_oldest_files(tmp_path):
+    cache = BacktestCache(root=tmp_path, max_files=10)
+    for i in range(100):
+        cache.get('backtest', dict(PARAMS, cost_bps=float(i)), {'TEST': make_ohlcv(50)}, Counter())
+    assert len(list(tmp_path.glob('*/*.json'))) == 10
+
+
+def test_concurrent_callers_share_one_computation(cache, frames):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute(progress):
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        progress(1, 2)
+        return {'value': 1}
+
+    seen = []
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.get('backtest', PARAMS, frames, compute)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(
+        cache.get('backtest', PARAMS, frames, compute, progress=lambda done, total: seen.append(done))
+    ))
+    follower.start()
+    # 等待跟随方登记进度回调
+    while not cache._listeners:
+        time.sleep(0.01)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(calls) == 1
+    assert [result['value'] for result in results] == [1, 1]
+    assert seen == [1]
+
+
+def test_cancelled_leader_does_not_fail_waiting_callers(cache, frames):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute(progress):
+        calls.append(1)
+        if len(calls) == 1:
+            started.set()
+            release.wait(5)
+        progress(1, 1)
+        return {'value': len(calls)}
+
+    def cancelled(done, total):
+        raise JobCancelled()
+
+    outcomes = {}
+
+    def run(name, progress):
+        try:
+            outcomes[name] = cache.get('backtest', PARAMS, frames, compute, progress=progress)['value']
+        except JobCancelled:
+            outcomes[name] = 'cancelled'
+
+    leader = threading.Thread(target=run, args=('leader', cancelled))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=run, args=('follower', lambda done, total: None))
+    follower.start()
+    while sum(len(listeners) for listeners in cache._listeners.values()) < 2:
+        time.sleep(0.01)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert outcomes == {'leader': 'cancelled', 'follower': 2}
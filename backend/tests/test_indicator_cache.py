@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from conftest import make_ohlcv
+from services import indicators
+from services.indicator_cache import IndicatorCache, frame_key
+
+
+@pytest.fixture
+def frame():
+    frame = make_ohlcv(300)
+    frame.attrs.update(symbol='TEST', interval='1d', version=1)
+    return frame
+
+
+def test_repeated_requests_hit(frame):
+    cache = IndicatorCache(max_bytes=1 << 20)
+    first = cache.compute(frame, 'sma', window=20)
+    second = cache.compute(frame, 'sma', window=20)
+    assert second is first
+    assert not first.flags.writeable
+    np.testing.assert_array_equal(first, indicators.sma(frame['Close'].to_numpy(), 20))
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_new_store_version_misses(frame):
+    cache = IndicatorCache(max_bytes=1 << 20)
+    cache.compute(frame, 'rsi', period=14)
+    # 中间的K线被改写（如复权），只有版本号能区分
+    revised = frame.copy()
+    revised.iloc[100, revised.columns.get_loc('Close')] *= 2
+    revised.attrs['version'] = 2
+    result = cache.compute(revised, 'rsi', period=14)
+    np.testing.assert_array_equal(result, indicators.rsi(revised['Close'].to_numpy(), 14))
+    assert cache.misses == 2
+
+
+def test_key_covers_the_bar_range(frame):
+    assert frame_key(frame) == ('TEST', '1d', 1, int(frame.index.asi8[0]), int(frame.index.asi8[-1]))
+    assert frame_key(frame.iloc[:-1]) != frame_key(frame)
+    assert frame_key(frame.iloc[1:]) != frame_key(frame)
+
+
+def test_untagged_frames_are_not_cached(frame):
+    untagged = frame.copy()
+    del untagged.attrs['version']
+    assert frame_key(untagged) is None
+    cache = IndicatorCache(max_bytes=1 << 20)
+    cache.compute(untagged, 'sma', window=20)
+    cache.compute(untagged, 'sma', window=20)
+    assert (cache.hits, cache.misses) == (0, 0)
@@ -0,0 +1,89 @@
+"""The NumPy indicators against the pandas formulas they replaced"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from services import indicators
+
+
+def assert_same(actual, expected):
+    np.testing.assert_allclose(actual, np.asarray(expected, dtype=np.float64), rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+@pytest.mark.parametrize('window', [1, 5, 20, 200])
+def test_sma(ohlcv, window):
+    assert_same(indicators.sma(ohlcv['Close'], window), ohlcv['Close'].rolling(window).mean())
+
+
+@pytest.mark.parametrize('span', [12, 26])
+def test_ema(ohlcv, span):
+    assert_same(indicators.ema(ohlcv['Close'], span), ohlcv['Close'].ewm(span=span, adjust=False).mean())
+
+
+def test_macd(ohlcv):
+    close = ohlcv['Close']
+    line = close.ewm(span=12, adjust=False).mean() - close.ewm(span=26, adjust=False).mean()
+    signal = line.ewm(span=9, adjust=False).mean()
+
+    macd, macd_signal, histogram = indicators.macd(close)
+    assert_same(macd, line)
+    assert_same(macd_signal, signal)
+    assert_same(histogram, line - signal)
+
+
+def test_rsi(ohlcv):
+    delta = ohlcv['Close'].diff()
+    gain = delta.where(delta > 0, 0).rolling(window=14).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
+    assert_same(indicators.rsi(ohlcv['Close'], 14), 100 - 100 / (1 + gain / loss))
+
+
+def test_mfi(ohlcv):
+    typical = (ohlcv['High'] + ohlcv['Low'] + ohlcv['Close']) / 3
+    raw = typical * ohlcv['Volume']
+    positive = raw.where(typical > typical.shift(1), 0).rolling(window=10).sum()
+    negative = raw.where(typical < typical.shift(1), 0).rolling(window=10).sum()
+    expected = 100 - 100 / (1 + positive / negative)
+
+    actual = indicators.mfi(ohlcv['High'], ohlcv['Low'], ohlcv['Close'], ohlcv['Volume'], 10)
+    assert_same(actual, expected)
+
+
+def test_obv(ohlcv):
+    # 收盘价不高于前一根记为流出
+    close = ohlcv['Close'].copy()
+    close.iloc[10] = close.iloc[9]
+    expected = (ohlcv['Volume'] * (~close.diff().le(0) * 2 - 1)).cumsum()
+    assert_same(indicators.obv(close, ohlcv['Volume']), expected)
+
+
+@pytest.mark.parametrize('window', [1, 3, 20, 252])
+def test_rolling_extremes(ohlcv, window):
+    high = ohlcv['High'].copy()
+    high.iloc[100] = np.nan
+    assert_same(indicators.rolling_max(high, window), high.rolling(window).max())
+    assert_same(indicators.rolling_min(ohlcv['Low'], window), ohlcv['Low'].rolling(window).min())
+
+
+def test_breakout(ohlcv):
+    prior_high = ohlcv['High'].rolling(20).max().shift(1)
+    expected = (ohlcv['Close'] > prior_high).to_numpy()
+    np.testing.assert_array_equal(indicators.breakout(ohlcv['Close'], ohlcv['High'], 20), expected)
+
+
+def test_rows_are_independent(ohlcv):
+    panel = np.vstack([ohlcv['Close'].to_numpy(), ohlcv['Close'].to_numpy()[::-1]])
+    rows = indicators.sma(panel, 20)
+    assert_same(rows[0], indicators.sma(panel[0], 20))
+    assert_same(rows[1], indicators.sma(panel[1], 20))
+
+
+def test_nan_gap_matches_pandas(ohlcv):
+    close = ohlcv['Close'].copy()
+    close.iloc[50:53] = np.nan
+    assert_same(indicators.sma(close, 5), close.rolling(5).mean())
+    assert_same(indicators.ema(close, 12), close.ewm(span=12, adjust=False, ignore_na=True).mean())
+
+
+def test_pct_change(ohlcv):
+    assert_same(indicators.pct_change(ohlcv['Close']), ohlcv['Close'].pct_change() * 100)
@@ -0,0 +1,81 @@
+import pytest
+
+from services import info_cache as info_cache_module
+from services.info_cache import InfoCache
+
+
+class FakeInfo:
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+
+    def get_info(self, symbol):
+        if self.fail:
+            raise RuntimeError('upstream down')
+        self.calls += 1
+        return {'symbol': symbol, 'longName': 'Test Inc', 'marketCap': 1e9, 'currentPrice': 100.0 + self.calls}
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    fake = FakeInfo()
+    monkeypatch.setattr(info_cache_module, 'market_data', fake)
+    return fake
+
+
+@pytest.fixture
+def cache(tmp_path, upstream):
+    return InfoCache(root=tmp_path, ttl=3600, price_ttl=60)
+
+
+def age(cache, symbol, seconds):
+    cache._entries[symbol]['fetched_at'] -= seconds
+
+
+def test_fresh_entry_is_served_from_memory(cache, upstream):
+    assert cache.get('test')['longName'] == 'Test Inc'
+    cache.get('TEST', ['longName'])
+    assert upstream.calls == 1
+
+
+def test_ttl_depends_on_requested_fields(cache, upstream):
+    cache.get('TEST')
+    age(cache, 'TEST', 120)
+    # 名称仍然有效，价格已过期
+    assert cache.get('TEST', ['longName', 'marketCap'])['currentPrice'] == 101.0
+    assert upstream.calls == 1
+    assert cache.get('TEST', ['longName', 'currentPrice'])['currentPrice'] == 102.0
+    assert upstream.calls == 2
+
+    age(cache, 'TEST', 7200)
+    cache.get('TEST', ['longName'])
+    assert upstream.calls == 3
+
+
+def test_without_fields_every_cached_field_is_checked(cache, upstream):
+    cache.get('TEST')
+    age(cache, 'TEST', 120)
+    cache.get('TEST')
+    assert upstream.calls == 2
+
+
+def test_entries_survive_restart(tmp_path, cache, upstream):
+    cache.get('TEST')
+    restarted = InfoCache(root=tmp_path, ttl=3600, price_ttl=60)
+    assert restarted.get('TEST', ['longName'])['longName'] == 'Test Inc'
+    assert upstream.calls == 1
+
+
+def test_stale_entry_when_refresh_fails(cache, upstream):
+    cache.get('TEST')
+    age(cache, 'TEST', 7200)
+    upstream.fail = True
+    assert cache.get('TEST')['currentPrice'] == 101.0
+    with pytest.raises(RuntimeError):
+        cache.get('OTHER')
+
+
+def test_unreadable_file_is_refetched(tmp_path, upstream):
+    (tmp_path / 'TEST.json').write_text('{not json')
+    assert InfoCache(root=tmp_path).get('TEST')['symbol'] == 'TEST'
+    assert upstream.calls == 1
@@ -0,0 +1,195 @@
+import json
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from services import jobs
+from services.jobs import CANCELLED, FAILED, FINISHED, SUCCEEDED, JobQueue
+
+needs_fcntl = pytest.mark.skipif(jobs.fcntl is None, reason="owner locks need fcntl")
+
+
+def wait_for(queue_, job_id, statuses=FINISHED, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue_.get(job_id)
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+
+class Blocker:
+    """Job function that reports progress until released or cancelled"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, context):
+        self.started.set()
+        while not self.release.wait(0.01):
+            context.progress(0.5, message='waiting')
+        return 'released'
+
+
+@pytest.fixture
+def job_queue(tmp_path):
+    queue_ = JobQueue(root=tmp_path, workers=1)
+    queue_.register('echo', lambda context, value=None: {'value': value, 'array': np.arange(3)})
+    return queue_
+
+
+def write_job(root, owner, **fields):
+    job = {
+        'id': 'abc123', 'type': 'echo', 'params': {}, 'priority': 5, 'owner': owner, 'status': 'running',
+        'progress': 0.5, 'message': None, 'error': None, 'submitted_at': time.time(),
+        'started_at': time.time(), 'finished_at': None
+    }
+    job.update(fields)
+    (root / f"{job['id']}.json").write_text(json.dumps(job))
+    return job
+
+
+def hold_owner_lock(root, owner):
+    """Hold an owner lock as another live process would"""
+    owners = root / 'owners'
+    owners.mkdir(exist_ok=True)
+    lock_file = open(owners / f'{owner}.lock', 'w')
+    jobs.fcntl.flock(lock_file, jobs.fcntl.LOCK_EX | jobs.fcntl.LOCK_NB)
+    return lock_file
+
+
+def test_submit_runs_and_persists(job_queue, tmp_path):
+    job = job_queue.submit('echo', {'value': 7})
+    assert wait_for(job_queue, job['id'])['status'] == SUCCEEDED
+    assert job_queue.result(job['id'])['result'] == {'value': 7, 'array': [0, 1, 2]}
+    # 重启后从磁盘读取结果
+    restarted = JobQueue(root=tmp_path, workers=1)
+    record = restarted.result(job['id'])
+    assert (record['status'], record['progress'], record['result']['value']) == (SUCCEEDED, 1.0, 7)
+
+
+def test_invalid_submissions(job_queue):
+    with pytest.raises(ValueError):
+        job_queue.submit('no_such_type')
+    with pytest.raises(ValueError):
+        job_queue.submit('echo', priority='urgent')
+    with pytest.raises(ValueError):
+        job_queue.submit('echo', params=[1, 2])
+
+
+def test_failed_job_records_error(job_queue):
+    job_queue.register('boom', lambda context: 1 / 0)
+    job = wait_for(job_queue, job_queue.submit('boom')['id'])
+    assert job['status'] == FAILED
+    assert 'division by zero' in job['error']
+
+
+def test_progress_and_cancel_running_job(job_queue):
+    blocker = Blocker()
+    job_queue.register('block', blocker)
+    job = job_queue.submit('block')
+    blocker.started.wait(5)
+    running = wait_for(job_queue, job['id'], statuses=('running',))
+    while job_queue.get(job['id'])['progress'] != 0.5:
+        time.sleep(0.01)
+    assert running['status'] == 'running'
+    assert job_queue.get(job['id'])['message'] == 'waiting'
+
+    job_queue.cancel(job['id'])
+    assert wait_for(job_queue, job['id'])['status'] == CANCELLED
+
+
+def test_queued_jobs_run_by_priority_and_can_be_cancelled(job_queue):
+    blocker = Blocker()
+    order = []
+    job_queue.register('block', blocker)
+    job_queue.register('record', lambda context, name: order.append(name))
+    first = job_queue.submit('block')
+    blocker.started.wait(5)
+    job_queue.submit('record', {'name': 'low'}, priority='low')
+    dropped = job_queue.submit('record', {'name': 'dropped'})
+    last = job_queue.submit('record', {'name': 'high'}, priority='high')
+
+    assert job_queue.cancel(dropped['id'])['status'] == CANCELLED
+    blocker.release.set()
+    wait_for(job_queue, first['id'])
+    wait_for(job_queue, last['id'])
+    while len(order) < 2:
+        time.sleep(0.01)
+    assert order == ['high', 'low']
+
+
+@needs_fcntl
+def test_jobs_of_exited_processes_fail_on_restart(tmp_path):
+    write_job(tmp_path, owner='1-deadbeef')
+    job = JobQueue(root=tmp_path).get('abc123')
+    assert job['status'] == FAILED
+    assert job['error'] == "Interrupted by a server restart"
+
+
+@needs_fcntl
+def test_jobs_of_live_processes_are_left_running(tmp_path):
+    lock_file = hold_owner_lock(tmp_path, '1-cafe')
+    try:
+        write_job(tmp_path, owner='1-cafe')
+        assert JobQueue(root=tmp_path).get('abc123')['status'] == 'running'
+    finally:
+        lock_file.close()
+    # 所有者退出后锁被释放
+    assert JobQueue(root=tmp_path).get('abc123')['status'] == FAILED
+
+
+@needs_fcntl
+def test_cancel_job_owned_by_another_process(tmp_path):
+    owner = JobQueue(root=tmp_path, workers=1)
+    blocker = Blocker()
+    owner.register('block', blocker)
+    job = owner.submit('block')
+    blocker.started.wait(5)
+
+    # 另一个进程的队列只能通过标记文件取消
+    other = JobQueue(root=tmp_path)
+    other.register('block', blocker)
+    assert other.cancel(job['id'])['status'] != CANCELLED
+    assert (tmp_path / f"{job['id']}.cancel").exists()
+
+    assert wait_for(other, job['id'])['status'] == CANCELLED
+    # 任务结束后所有者删除标记文件
+    marker = tmp_path / f"{job['id']}.cancel"
+    deadline = time.time() + 5
+    while marker.exists() and time.time() < deadline:
+        time.sleep(0.01)
+    assert not marker.exists()
+
+
+def test_expired_jobs_are_pruned(tmp_path):
+    old = time.time() - 3 * 86400
+    write_job(tmp_path, owner=None, status=SUCCEEDED, finished_at=old)
+    assert JobQueue(root=tmp_path, retention_days=1).list() == []
+    assert not (tmp_path / 'abc123.json').exists()
+
+
+def test_concurrent_callers_wait_for_recovery(tmp_path, monkeypatch):
+    write_job(tmp_path, owner=None, status=SUCCEEDED, finished_at=time.time() - 3 * 86400)
+    job_queue = JobQueue(root=tmp_path, retention_days=1)
+    reap = job_queue._reap
+    reaping = threading.Event()
+
+    def slow_reap(job):
+        reaping.set()
+        time.sleep(0.2)
+        return reap(job)
+
+    monkeypatch.setattr(job_queue, '_reap', slow_reap)
+    results = []
+    first = threading.Thread(target=lambda: results.append(job_queue.list()))
+    first.start()
+    reaping.wait(5)
+    # 恢复进行中时的调用方不能看到已过期的任务
+    results.append(job_queue.list())
+    first.join(5)
+    assert results == [[], []]
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from conftest import make_ohlcv, timestamps_of
+from services.market_data import MarketDataError, RecordingProvider, ReplayProvider, parse_quotes
+
+DAY = 86400
+
+
+def chart_json(frame):
+    return {'chart': {'result': [{
+        'meta': {'symbol': 'TEST'},
+        'timestamp': timestamps_of(frame).tolist(),
+        'indicators': {
+            'quote': [{column.lower(): frame[column].tolist() for column in ('Open', 'High', 'Low', 'Close', 'Volume')}],
+            'adjclose': [{'adjclose': frame['Close'].tolist()}]
+        }
+    }], 'error': None}}
+
+
+def record(root, *parts, data):
+    path = root.joinpath(*parts)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data))
+
+
+@pytest.fixture
+def history():
+    return make_ohlcv(300)
+
+
+@pytest.fixture
+def replay(tmp_path, history):
+    record(tmp_path, 'chart', '1d', 'TEST.json', data=chart_json(history))
+    record(tmp_path, 'search', 'tes.json', data={'quotes': [{'symbol': 'TEST'}]})
+    record(tmp_path, 'info', 'TEST.json', data={'longName': 'Test Inc'})
+    return ReplayProvider(tmp_path)
+
+
+def timestamps_in(chart):
+    return chart['chart']['result'][0].get('timestamp', [])
+
+
+def test_clock_stops_after_the_last_recorded_bar(replay, history):
+    assert replay.now('test') == int(timestamps_of(history)[-1]) + 1
+
+
+def test_period_requests_are_clipped(replay, history):
+    stamps = timestamps_of(history).tolist()
+    chart = replay.get_chart('TEST', {'interval': '1d', 'period1': stamps[10], 'period2': stamps[19]})
+    assert timestamps_in(chart) == stamps[10:20]
+    assert chart['chart']['result'][0]['indicators']['quote'][0]['close'] == history['Close'].tolist()[10:20]
+
+
+def test_range_requests_count_back_from_the_recording(replay, history):
+    stamps = timestamps_of(history).tolist()
+    chart = replay.get_chart('TEST', {'interval': '1d', 'range': '1mo'})
+    assert timestamps_in(chart) == [ts for ts in stamps if ts >= stamps[-1] - 31 * DAY]
+    assert timestamps_in(replay.get_chart('TEST', {'interval': '1d', 'range': 'max'})) == stamps
+
+
+def test_missing_recordings_raise(replay):
+    with pytest.raises(MarketDataError):
+        replay.get_chart('NOPE', {'interval': '1d'})
+    with pytest.raises(MarketDataError):
+        replay.get_chart('TEST', {'interval': '1h'})
+    with pytest.raises(MarketDataError):
+        replay.get_info('NOPE')
+
+
+def test_search_and_info(replay):
+    assert replay.search('TES')['quotes'][0]['symbol'] == 'TEST'
+    assert replay.get_info('test')['longName'] == 'Test Inc'
+
+
+def test_quotes_are_rebuilt_from_charts(replay, history):
+    quotes = parse_quotes(replay.get_quotes(['TEST', 'NOPE']))
+    assert list(quotes) == ['TEST']
+    quote = quotes['TEST']
+    assert quote['price'] == pytest.approx(history['Close'].iloc[-1])
+    assert quote['previous_close'] == pytest.approx(history['Close'].iloc[-2])
+    assert quote['volume'] == history['Volume'].iloc[-1]
+
+
+def test_recordings_are_merged(tmp_path, history):
+    recorder = RecordingProvider(tmp_path)
+    recorder._record_chart('TEST', '1d', chart_json(history.iloc[:200]))
+    revised = history.iloc[150:].copy()
+    revised.iloc[49, revised.columns.get_loc('Close')] = 1.0
+    recorder._record_chart('TEST', '1d', chart_json(revised))
+
+    chart = ReplayProvider(tmp_path).get_chart('TEST', {'interval': '1d'})
+    assert timestamps_in(chart) == timestamps_of(history).tolist()
+    closes = chart['chart']['result'][0]['indicators']['quote'][0]['close']
+    assert closes[199] == 1.0 and closes[198] == history['Close'].iloc[198]
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from conftest import make_ohlcv, timestamps_of
+from services import backtest
+from services.portfolio import PortfolioBacktester
+
+SPEC = {'type': 'sma_cross', 'fast': 5, 'slow': 20}
+
+
+@pytest.fixture
+def frames():
+    return {symbol: make_ohlcv(200, seed=seed) for seed, symbol in enumerate(('AAA', 'BBB', 'CCC', 'DDD'))}
+
+
+@pytest.fixture
+def backtester():
+    return PortfolioBacktester(workers=1)
+
+
+def symbol_returns(frame):
+    data = {column: frame[column].to_numpy() for column in frame.columns}
+    return backtest.run(data, timestamps_of(frame), SPEC)['returns']
+
+
+def test_single_symbol_matches_backtest(backtester, frames):
+    result = backtester.run({'AAA': frames['AAA']}, SPEC)
+    np.testing.assert_allclose(result['returns'], symbol_returns(frames['AAA']))
+    assert result['per_symbol']['AAA']['metrics']['trades'] == result['metrics']['trades']
+
+
+def test_equal_and_custom_weights(backtester, frames):
+    pair = {'AAA': frames['AAA'], 'BBB': frames['BBB']}
+    aaa, bbb = symbol_returns(frames['AAA']), symbol_returns(frames['BBB'])
+
+    equal = backtester.run(pair, SPEC)
+    np.testing.assert_allclose(equal['returns'], (aaa + bbb) / 2)
+    np.testing.assert_allclose(equal['equity'], np.cumprod(1 + (aaa + bbb) / 2))
+
+    weighted = backtester.run(pair, SPEC, weights={'aaa': 3, 'bbb': 1})
+    np.testing.assert_allclose(weighted['returns'], 0.75 * aaa + 0.25 * bbb)
+    assert weighted['per_symbol']['AAA']['weight'] == 3.0
+
+
+def test_weights_renormalize_while_a_symbol_is_missing(backtester, frames):
+    late = frames['BBB'].iloc[100:]
+    result = backtester.run({'AAA': frames['AAA'], 'BBB': late}, SPEC)
+    aaa = symbol_returns(frames['AAA'])
+    bbb = symbol_returns(late)
+    np.testing.assert_allclose(result['returns'][:100], aaa[:100])
+    np.testing.assert_allclose(result['returns'][100:], (aaa[100:] + bbb) / 2)
+
+
+def test_failing_symbols_are_reported_and_excluded(backtester, frames):
+    result = backtester.run({'AAA': frames['AAA'], 'ONE': frames['BBB'].iloc[-1:]}, SPEC)
+    assert result['per_symbol']['ONE']['error'] == "Not enough price data"
+    np.testing.assert_allclose(result['returns'], symbol_returns(frames['AAA']))
+
+
+def test_invalid_input(backtester, frames):
+    with pytest.raises(ValueError):
+        backtester.run({}, SPEC)
+    with pytest.raises(ValueError):
+        backtester.run(frames, SPEC, weights={'AAA': -1})
+    with pytest.raises(ValueError):
+        backtester.run(frames, SPEC, weights='market_cap')
+
+
+def test_progress_can_abort(backtester, frames):
+    seen = []
+
+    def progress(done, total):
+        seen.append((done, total))
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        PortfolioBacktester(workers=1, min_parallel=2).run(frames, SPEC, progress=progress)
+    assert seen == [(2, 4)]
+
+
+def test_process_pool_matches_in_process(frames):
+    serial = PortfolioBacktester(workers=1).run(frames, SPEC)
+    parallel = PortfolioBacktester(workers=2, min_parallel=2).run(frames, SPEC)
+    np.testing.assert_allclose(parallel['returns'], serial['returns'])
+    assert parallel['per_symbol'] == serial['per_symbol']
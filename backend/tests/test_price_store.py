@@ -0,0 +1,256 @@
+import numpy as np
+import pytest
+
+from conftest import make_ohlcv, timestamps_of
+from services import stock_analyzer as analyzer_module
+from services.market_data import MarketDataProvider
+from services.price_store import PriceStore
+from services.stock_analyzer import StockAnalyzer
+
+DAY = 86400
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PriceStore(root=tmp_path)
+
+
+def test_write_then_read(store, ohlcv):
+    store.write('TEST', ohlcv)
+    series = store.series('test')
+    assert (series.symbol, series.version, len(series)) == ('TEST', 1, len(ohlcv))
+    np.testing.assert_array_equal(series.timestamps, timestamps_of(ohlcv))
+    for column in ohlcv.columns:
+        np.testing.assert_array_equal(series[column], ohlcv[column].to_numpy())
+    # 内存映射的视图只读
+    with pytest.raises(ValueError):
+        series['Close'][0] = 1.0
+
+
+def test_series_slices_by_time(store, ohlcv):
+    store.write('TEST', ohlcv)
+    stamps = timestamps_of(ohlcv)
+    series = store.series('TEST', start_ts=int(stamps[10]), end_ts=int(stamps[19]))
+    np.testing.assert_array_equal(series.timestamps, stamps[10:20])
+    assert store.series('OTHER') is None
+
+
+def test_merge_overwrites_overlapping_bars(store, ohlcv):
+    store.write('TEST', ohlcv.iloc[:400])
+    revised = ohlcv.iloc[399:].copy()
+    revised.iloc[0, revised.columns.get_loc('Close')] = 1.0
+    store.write('TEST', revised)
+
+    stored = store.load('TEST')
+    assert len(stored) == len(ohlcv)
+    assert stored['Close'].iloc[399] == 1.0
+    np.testing.assert_array_equal(stored['Close'].iloc[400:], ohlcv['Close'].iloc[400:])
+
+
+def test_versions(store, ohlcv):
+    store.write('TEST', ohlcv.iloc[:400])
+    held = store.series('TEST')
+    # 数据没有变化时不生成新版本
+    store.write('TEST', ohlcv.iloc[300:400])
+    assert store.read_meta('TEST')['version'] == 1
+    store.write('TEST', ohlcv.iloc[400:])
+    assert store.read_meta('TEST')['version'] == 2
+    # 已映射的旧版本在宽限期内仍可读
+    assert len(held) == 400 and len(store.series('TEST')) == len(ohlcv)
+
+
+def test_superseded_versions_are_pruned(tmp_path, ohlcv, monkeypatch):
+    monkeypatch.setenv('PRICE_STORE_PRUNE_GRACE', '0')
+    store = PriceStore(root=tmp_path)
+    for end in (200, 300, 400):
+        store.write('TEST', ohlcv.iloc[:end])
+    versions = [child.name for child in (tmp_path / '1d' / 'TEST').iterdir() if child.is_dir()]
+    assert versions == ['3']
+
+
+def test_compact_storage(tmp_path, ohlcv, monkeypatch):
+    monkeypatch.setenv('PRICE_STORE_COMPACT', '1')
+    store = PriceStore(root=tmp_path)
+    store.write('TEST', ohlcv)
+    series = store.series('TEST')
+    assert series['Close'].dtype == np.float32
+    assert series['Volume'].dtype == np.uint32
+    np.testing.assert_allclose(series['Close'], ohlcv['Close'], rtol=1e-6)
+
+
+def test_missing_ranges(store, ohlcv):
+    stamps = timestamps_of(ohlcv)
+    start, end = int(stamps[100]), int(stamps[400])
+    assert store.missing_ranges('TEST', start, end) == [(start, end)]
+    store.write('TEST', ohlcv.iloc[100:401], covered=(start, end))
+
+    # 覆盖范围内且未过期：无需下载
+    assert store.missing_ranges('TEST', int(stamps[200]), end + store.max_age) == []
+    # 更早的数据从覆盖起点向前补齐；尾部从最后一根K线开始补齐
+    now = int(stamps[-1])
+    assert store.missing_ranges('TEST', int(stamps[0]), now) == [(int(stamps[0]), start), (end, now)]
+    assert store.missing_ranges('TEST', None, end) == [(None, start)]
+
+
+def test_gaps_are_refetched_then_verified(store, ohlcv):
+    stamps = timestamps_of(ohlcv)
+    start, end = int(stamps[0]), int(stamps[-1])
+    holed = ohlcv.drop(ohlcv.index[200:210])
+    store.write('TEST', holed, covered=(start, end))
+    gap = [int(stamps[199]), int(stamps[210])]
+    assert store.read_meta('TEST')['gaps'] == [gap]
+    assert store.missing_ranges('TEST', start, end) == [tuple(gap)]
+
+    # 重新下载后缺口仍在：视为休市，不再请求
+    store.write('TEST', holed.iloc[199:201], covered=tuple(gap))
+    meta = store.read_meta('TEST')
+    assert (meta['gaps'], meta['verified_gaps']) == ([], [gap])
+    assert store.missing_ranges('TEST', start, end) == []
+
+
+def test_repaired_gap(store, ohlcv):
+    stamps = timestamps_of(ohlcv)
+    store.write('TEST', ohlcv.drop(ohlcv.index[200:210]), covered=(int(stamps[0]), int(stamps[-1])))
+    store.write('TEST', ohlcv.iloc[199:211], covered=(int(stamps[199]), int(stamps[210])))
+    assert store.read_meta('TEST')['gaps'] == []
+    assert len(store.load('TEST')) == len(ohlcv)
+
+
+def with_adjusted(frame, dividend_factor=1.0, upto=None):
+    """Add an Adj Close column, scaled by ``dividend_factor`` on bars before ``upto``"""
+    frame = frame.copy()
+    frame['Adj Close'] = frame['Close']
+    if upto is not None:
+        frame.iloc[:upto, frame.columns.get_loc('Adj Close')] *= dividend_factor
+    return frame
+
+
+def split(frame, at, ratio):
+    """Upstream view after a ``ratio``:1 split on bar ``at``: earlier prices divided by ``ratio``"""
+    frame = frame.copy()
+    for column in ('Open', 'High', 'Low', 'Close', 'Adj Close'):
+        if column in frame:
+            frame.iloc[:at, frame.columns.get_loc(column)] /= ratio
+    frame.attrs['splits'] = [int(timestamps_of(frame)[at])]
+    return frame
+
+
+def test_unchanged_top_up_is_not_adjusted(store):
+    history = with_adjusted(make_ohlcv(300))
+    store.write('TEST', history.iloc[:250])
+    # 最后一根已存储的K线当时还在形成，收盘价被修正
+    top_up = history.iloc[249:].copy()
+    top_up.iloc[0, top_up.columns.get_loc('Close')] *= 1.01
+    top_up.iloc[0, top_up.columns.get_loc('Adj Close')] *= 1.01
+    assert not store.adjusted_since('TEST', top_up)
+
+
+def test_split_after_stored_bars_is_adjusted(store):
+    history = with_adjusted(make_ohlcv(300))
+    store.write('TEST', history.iloc[:250])
+    assert store.adjusted_since('TEST', split(history, 260, 4).iloc[249:])
+    # 已存储范围之前的拆股已反映在存储的价格里
+    assert not store.adjusted_since('TEST', split(history, 100, 4).iloc[249:])
+
+
+def test_dividend_changes_adjusted_ratio(store):
+    history = with_adjusted(make_ohlcv(300))
+    store.write('TEST', history.iloc[:250])
+    assert store.adjusted_since('TEST', with_adjusted(history, 0.99, upto=255).iloc[249:])
+
+
+def test_rescaled_overlap_is_adjusted(store):
+    history = with_adjusted(make_ohlcv(300))
+    store.write('TEST', history.iloc[100:])
+    # 向前补齐时重叠的K线价格不同（拆股没有出现在下载的事件里）
+    head = split(history, 260, 2).iloc[:101]
+    head.attrs['splits'] = []
+    assert store.adjusted_since('TEST', head)
+    assert not store.adjusted_since('TEST', history.iloc[:101])
+
+
+def test_replace_discards_stored_bars(store):
+    history = make_ohlcv(300)
+    store.write('TEST', history.iloc[:250], covered=(None, int(timestamps_of(history)[249])))
+    version = store.read_meta('TEST')['version']
+
+    replacement = split(history, 260, 2).iloc[10:]
+    end = int(timestamps_of(history)[-1])
+    store.write('TEST', replacement, covered=(None, end), replace=True)
+
+    meta = store.read_meta('TEST')
+    assert meta['version'] == version + 1
+    assert meta['covered'] == [None, end]
+    stored = store.load('TEST')
+    np.testing.assert_array_equal(stored.index, replacement.index)
+    np.testing.assert_allclose(stored['Close'], replacement['Close'])
+
+
+class FakeChartProvider(MarketDataProvider):
+    """Serves chart requests from an in-memory upstream history"""
+
+    def __init__(self, history):
+        self.history = history
+        self.requests = []
+
+    def now(self, symbol):
+        return int(timestamps_of(self.history)[-1]) + DAY
+
+    def get_chart(self, symbol, params):
+        self.requests.append(params)
+        stamps = timestamps_of(self.history)
+        if params.get('range') == 'max':
+            selected = np.ones(len(stamps), dtype=bool)
+        else:
+            selected = (stamps >= params['period1']) & (stamps <= params['period2'])
+        bars = self.history[selected]
+        splits = {str(ts): {'date': ts, 'numerator': 2, 'denominator': 1}
+                  for ts in self.history.attrs.get('splits', [])}
+        return {'chart': {'result': [{
+            'timestamp': timestamps_of(bars).tolist(),
+            'indicators': {
+                'quote': [{column.lower(): bars[column].tolist()
+                           for column in ('Open', 'High', 'Low', 'Close', 'Volume')}],
+                'adjclose': [{'adjclose': bars['Adj Close'].tolist()}]
+            },
+            'events': {'splits': splits}
+        }]}}
+
+    def search(self, query):
+        return {}
+
+    def get_info(self, symbol):
+        return {}
+
+    def get_quotes(self, symbols):
+        return {}
+
+
+@pytest.fixture
+def analyzer(store, monkeypatch):
+    monkeypatch.setattr(analyzer_module, 'price_store', store)
+    analyzer = StockAnalyzer()
+    analyzer.provider = FakeChartProvider(with_adjusted(make_ohlcv(300)).iloc[:250])
+    return analyzer
+
+
+def test_sync_tops_up_the_tail(analyzer, store):
+    history = with_adjusted(make_ohlcv(300))
+    analyzer.get_price_series('TEST', 'max')
+    analyzer.provider.history = history
+    series = analyzer.get_price_series('TEST', 'max')
+
+    assert len(series) == len(history)
+    assert 'period1' in analyzer.provider.requests[-1]
+    np.testing.assert_allclose(series['Close'], history['Close'])
+
+
+def test_sync_rewrites_history_after_split(analyzer, store):
+    analyzer.get_price_series('TEST', 'max')
+    upstream = split(with_adjusted(make_ohlcv(300)), 260, 2)
+    analyzer.provider.history = upstream
+    series = analyzer.get_price_series('TEST', 'max')
+
+    assert analyzer.provider.requests[-1].get('range') == 'max'
+    assert series.version == 2
+    np.testing.assert_allclose(series['Close'], upstream['Close'])
@@ -0,0 +1,162 @@
+import time
+
+import pytest
+
+from conftest import make_ohlcv, timestamps_of
+from services import quotes as quotes_module
+from services.market_data import MarketDataError
+from services.price_store import PriceStore
+from services.quotes import QuoteService, normalize_symbols
+from services.symbol_index import SymbolIndex
+
+
+class FakeSpark:
+    """Upstream spark endpoint knowing a fixed set of symbols"""
+
+    def __init__(self, prices):
+        self.prices = prices
+        self.batches = []
+        self.fail = False
+
+    def get_quotes(self, symbols):
+        if self.fail:
+            raise MarketDataError('upstream down')
+        self.batches.append(list(symbols))
+        now = int(time.time())
+        return {'spark': {'result': [
+            {'symbol': symbol, 'response': [{
+                'meta': {'regularMarketPrice': self.prices[symbol], 'longName': f'{symbol} Corp', 'exchangeName': 'NMS'},
+                'timestamp': [now - 86400, now],
+                'indicators': {'quote': [{'close': [self.prices[symbol] - 1, self.prices[symbol]]}]}
+            }]}
+            for symbol in symbols if symbol in self.prices
+        ], 'error': None}}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = PriceStore(root=tmp_path)
+    monkeypatch.setattr(quotes_module, 'price_store', store)
+    return store
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    fake = FakeSpark({'NEW': 12.0, 'LISTED': 30.0})
+    monkeypatch.setattr(quotes_module, 'market_data', fake)
+    return fake
+
+
+@pytest.fixture
+def service(store, upstream, monkeypatch):
+    index = SymbolIndex()
+    index.add('LISTED', 'Listed Inc', 'NYSE')
+    index.add('HELD', 'Held Inc', 'NASDAQ')
+    monkeypatch.setattr(quotes_module, 'symbol_index', index)
+    return QuoteService(ttl=60, batch_size=20)
+
+
+def store_bars(store, symbol, covered_until):
+    frame = make_ohlcv(10)
+    store.write(symbol, frame, covered=(None, covered_until))
+    return frame
+
+
+def test_normalize_symbols():
+    assert normalize_symbols('aapl, msft\nAAPL  goog') == ['AAPL', 'MSFT', 'GOOG']
+    assert normalize_symbols([' tsla', '', 'TSLA']) == ['TSLA']
+    assert normalize_symbols(None) == []
+
+
+def test_validate_resolves_locally_first(service, store, upstream):
+    frame = store_bars(store, 'HELD', int(time.time()))
+    result = service.validate(['listed', 'held'])
+    assert [(row['symbol'], row['source']) for row in result['results']] == [('LISTED', 'local'), ('HELD', 'local')]
+    assert result['results'][0]['price'] is None
+    assert result['results'][1]['price'] == pytest.approx(frame['Close'].iloc[-1])
+    assert upstream.batches == []
+
+
+def test_validate_stored_symbol_without_listing(service, store, upstream):
+    store_bars(store, 'OLD', int(time.time()))
+    assert service.validate(['OLD'])['results'][0]['source'] == 'store'
+    assert upstream.batches == []
+
+
+def test_validate_unknown_symbols_upstream(service, upstream):
+    result = service.validate(['NEW', 'BOGUS'])
+    assert upstream.batches == [['NEW', 'BOGUS']]
+    new, bogus = result['results']
+    assert (new['valid'], new['source'], new['price'], new['name']) == (True, 'upstream', 12.0, 'NEW Corp')
+    assert not bogus['valid']
+    assert result['invalid'] == ['BOGUS']
+
+    # 上游"不存在"的结果也被缓存
+    service.validate(['BOGUS'])
+    assert len(upstream.batches) == 1
+
+
+def test_validate_quote_missing(service, upstream):
+    result = service.validate(['LISTED'], quote_missing=True)
+    assert upstream.batches == [['LISTED']]
+    assert result['results'][0]['price'] == 30.0
+    assert result['results'][0]['name'] == 'Listed Inc'
+
+
+def test_validate_batches_upstream_requests(service, upstream):
+    symbols = [f'X{i}' for i in range(45)]
+    result = service.validate(symbols)
+    assert [len(batch) for batch in upstream.batches] == [20, 20, 5]
+    assert result['invalid'] == symbols
+
+
+def test_upstream_failure_keeps_listed_symbols_valid(service, upstream):
+    upstream.fail = True
+    result = service.validate(['LISTED', 'NEW'], quote_missing=True)
+    listed, new = result['results']
+    assert (listed['valid'], listed['source'], listed['price']) == (True, 'local', None)
+    assert (new['valid'], new['error']) == (False, 'upstream down')
+
+
+def test_bulk_quotes_use_fresh_stored_bars(service, store, upstream):
+    frame = store_bars(store, 'HELD', int(time.time()))
+    columns = service.bulk_quotes(['HELD'])
+    assert upstream.batches == []
+    assert columns['symbols'] == ['HELD'] and columns['source'] == ['store']
+    assert columns['price'][0] == pytest.approx(frame['Close'].iloc[-1])
+    assert columns['change'][0] == pytest.approx(frame['Close'].iloc[-1] - frame['Close'].iloc[-2])
+    assert columns['timestamp'][0] == int(timestamps_of(frame)[-1])
+
+
+def test_bulk_quotes_are_aligned_columns(service, store, upstream):
+    store_bars(store, 'HELD', int(time.time()))
+    columns = service.bulk_quotes(['new', 'BOGUS', 'HELD'])
+    assert upstream.batches == [['NEW', 'BOGUS']]
+    assert columns['symbols'] == ['NEW', 'BOGUS', 'HELD']
+    assert columns['source'] == ['upstream', None, 'store']
+    assert columns['price'][:2] == [12.0, None]
+    assert columns['change'][0] == pytest.approx(1.0)
+    assert list(columns['errors']) == ['BOGUS']
+
+
+def test_stale_stored_bars_go_upstream(service, store, upstream):
+    store_bars(store, 'NEW', int(time.time()) - 10 * 86400)
+    assert service.bulk_quotes(['NEW'])['source'] == ['upstream']
+    assert upstream.batches == [['NEW']]
+
+
+def test_stale_stored_bars_are_used_when_upstream_fails(service, store, upstream):
+    frame = store_bars(store, 'NEW', int(time.time()) - 10 * 86400)
+    upstream.fail = True
+    columns = service.bulk_quotes(['NEW', 'BOGUS'])
+    assert columns['source'] == ['store', None]
+    assert columns['price'][0] == pytest.approx(frame['Close'].iloc[-1])
+    assert list(columns['errors']) == ['BOGUS']
+
+
+def test_stored_bars_stay_fresh_while_the_market_is_closed(service):
+    # 2024-03-09是周六，上一个收盘是周五16:00（纽约时间，UTC 21:00）
+    saturday = 1709982000
+    friday_close = 1709931600
+    assert service.is_fresh(friday_close + 600, now=saturday)
+    assert not service.is_fresh(friday_close - 600, now=saturday)
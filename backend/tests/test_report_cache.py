@@ -0,0 +1,111 @@
+from datetime import datetime
+
+import pytest
+
+from services.report_cache import MARKET_TZ, ReportCache, last_session_close, market_is_open
+
+
+def market_time(*args):
+    return MARKET_TZ.localize(datetime(*args))
+
+
+def test_market_hours():
+    # 2024-03-06是周三，2024-03-09是周六
+    assert market_is_open(market_time(2024, 3, 6, 10, 0))
+    assert not market_is_open(market_time(2024, 3, 6, 9, 29))
+    assert not market_is_open(market_time(2024, 3, 6, 16, 0))
+    assert not market_is_open(market_time(2024, 3, 9, 12, 0))
+
+
+def test_last_session_close():
+    assert last_session_close(market_time(2024, 3, 6, 17, 0)) == market_time(2024, 3, 6, 16, 0)
+    assert last_session_close(market_time(2024, 3, 6, 12, 0)) == market_time(2024, 3, 5, 16, 0)
+    # 周一开盘前回到上周五收盘
+    assert last_session_close(market_time(2024, 3, 11, 8, 0)) == market_time(2024, 3, 8, 16, 0)
+
+
+def test_staleness_follows_sessions():
+    cache = ReportCache(ttl=300)
+    during = market_time(2024, 3, 6, 11, 0).timestamp()
+    assert not cache.is_stale(during - 299, during)
+    assert cache.is_stale(during - 301, during)
+
+    weekend = market_time(2024, 3, 9, 12, 0).timestamp()
+    assert not cache.is_stale(market_time(2024, 3, 8, 16, 30).timestamp(), weekend)
+    assert cache.is_stale(market_time(2024, 3, 8, 15, 30).timestamp(), weekend)
+
+
+class Compute:
+    def __init__(self, fail=False):
+        self.calls = 0
+        self.fail = fail
+
+    def __call__(self):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError('upstream down')
+        return {'price': self.calls}
+
+
+def age(cache, key, seconds):
+    report, computed_at = cache._entries[key]
+    cache._entries[key] = (report, computed_at - seconds)
+
+
+def finish_refreshes(cache):
+    cache._executor.shutdown(wait=True)
+
+
+def test_second_request_is_served_from_cache():
+    cache = ReportCache(ttl=300)
+    compute = Compute()
+    first = cache.get('TEST', compute)
+    second = cache.get('TEST', compute)
+    assert compute.calls == 1
+    assert (first['price'], first['stale']) == (1, False)
+    assert second['price'] == 1 and second['cache_age'] >= 0
+
+
+def test_stale_report_is_returned_and_refreshed_in_background():
+    cache = ReportCache(ttl=300)
+    compute = Compute()
+    cache.get('TEST', compute)
+    age(cache, 'TEST', 10 * 86400)
+
+    stale = cache.get('TEST', compute)
+    assert (stale['price'], stale['stale']) == (1, True)
+    finish_refreshes(cache)
+    assert compute.calls == 2
+    assert cache.get('TEST', compute)['price'] == 2
+
+
+def test_failed_refresh_keeps_the_old_report():
+    cache = ReportCache(ttl=300)
+    cache.get('TEST', Compute())
+    age(cache, 'TEST', 10 * 86400)
+    cache.get('TEST', Compute(fail=True))
+    finish_refreshes(cache)
+    report, _ = cache._entries['TEST']
+    assert report['price'] == 1
+    assert not cache._refreshing
+
+
+def test_error_reports_are_not_cached():
+    cache = ReportCache(ttl=300)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {'error': 'no data'}
+
+    assert cache.get('TEST', compute) == {'error': 'no data', 'cache_age': pytest.approx(0, abs=1), 'stale': False}
+    cache.get('TEST', compute)
+    assert len(calls) == 2
+
+
+def test_invalidate():
+    cache = ReportCache(ttl=300)
+    compute = Compute()
+    cache.get('TEST', compute)
+    cache.invalidate('TEST')
+    assert cache.get('TEST', compute)['price'] == 2
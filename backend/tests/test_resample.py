@@ -0,0 +1,89 @@
+"""Resampled bars against pandas ``resample`` on the same base bars"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_ohlcv, timestamps_of
+from services.price_store import PriceSeries
+from services.resample import AGGREGATIONS, BarResampler, aggregate
+
+COLUMNS = ('Open', 'High', 'Low', 'Close', 'Volume')
+AGGREGATIONS_PRESENT = {column: AGGREGATIONS[column] for column in COLUMNS}
+
+
+def columns_of(frame):
+    return {column: frame[column].to_numpy() for column in COLUMNS}
+
+
+def series_of(frame, version=1):
+    return PriceSeries('TEST', version, timestamps_of(frame), columns_of(frame))
+
+
+def assert_matches(labels, columns, expected):
+    np.testing.assert_array_equal(labels, timestamps_of(expected))
+    for column in COLUMNS:
+        np.testing.assert_allclose(columns[column], expected[column].to_numpy(), err_msg=column)
+
+
+@pytest.mark.parametrize('rule, pandas_rule', [('W', 'W-FRI'), ('M', 'M'), ('Q', 'Q'), ('Y', 'A')])
+def test_calendar_rules(ohlcv, rule, pandas_rule):
+    expected = ohlcv.resample(pandas_rule).agg(AGGREGATIONS_PRESENT).dropna()
+    labels, columns, _ = aggregate(timestamps_of(ohlcv), columns_of(ohlcv), rule)
+    assert_matches(labels, columns, expected)
+
+
+def test_weekend_bars_join_the_next_week():
+    frame = make_ohlcv(30, start='2024-01-01')
+    frame.index = pd.date_range('2024-01-01', periods=30, freq='D')
+    expected = frame.resample('W-FRI').agg(AGGREGATIONS_PRESENT)
+    labels, columns, _ = aggregate(timestamps_of(frame), columns_of(frame), 'W')
+    assert_matches(labels, columns, expected)
+
+
+@pytest.mark.parametrize('rule, pandas_rule', [('1h', '1h'), ('4h', '4h'), ('1d', '1D')])
+def test_fixed_rules(rule, pandas_rule):
+    frame = make_ohlcv(500)
+    frame.index = pd.date_range('2024-03-01 09:30', periods=500, freq='15min')
+    expected = frame.resample(pandas_rule).agg(AGGREGATIONS_PRESENT).dropna()
+    labels, columns, _ = aggregate(timestamps_of(frame), columns_of(frame), rule)
+    assert_matches(labels, columns, expected)
+
+
+def test_bar_count_rule(ohlcv):
+    groups = np.arange(len(ohlcv)) // 3
+    expected = ohlcv.groupby(groups).agg(AGGREGATIONS_PRESENT)
+    expected.index = ohlcv.index[::3]
+    labels, columns, _ = aggregate(timestamps_of(ohlcv), columns_of(ohlcv), '3B')
+    assert_matches(labels, columns, expected)
+
+
+def test_unknown_rule(ohlcv):
+    with pytest.raises(ValueError):
+        aggregate(timestamps_of(ohlcv), columns_of(ohlcv), '5x')
+
+
+@pytest.mark.parametrize('rule', ['W', 'M', '5B'])
+def test_incremental_resample_matches_rebuild(rule):
+    frame = make_ohlcv(400)
+    resampler = BarResampler()
+    resampler.resample(series_of(frame.iloc[:300]), rule)
+
+    # 最后一根K线被修正，并新增了K线
+    revised = frame.copy()
+    revised.iloc[299, revised.columns.get_loc('Close')] *= 1.05
+    extended = resampler.resample(series_of(revised, version=2), rule)
+    assert resampler.extensions == 1
+
+    labels, columns, _ = aggregate(timestamps_of(revised), columns_of(revised), rule)
+    np.testing.assert_array_equal(extended.timestamps, labels)
+    for column in COLUMNS:
+        np.testing.assert_allclose(extended[column], columns[column], err_msg=column)
+
+
+def test_rewritten_history_is_rebuilt(ohlcv):
+    resampler = BarResampler()
+    resampler.resample(series_of(ohlcv.iloc[10:]), 'W')
+    result = resampler.resample(series_of(ohlcv, version=2), 'W')
+    assert resampler.rebuilds == 2
+    assert len(result) == len(ohlcv.resample('W-FRI').last())
+
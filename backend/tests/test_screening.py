@@ -0,0 +1,46 @@
+"""Screening criteria validation and the vectorized screen"""
+import pytest
+
+from conftest import make_ohlcv
+from services.stock_analyzer import StockAnalyzer
+
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    analyzer = StockAnalyzer()
+    frames = {'UP': make_ohlcv(300, seed=1), 'DOWN': make_ohlcv(300, seed=2)}
+    frames['DOWN']['Close'] = frames['DOWN']['Close'].iloc[::-1].to_numpy()
+    analyzer.fetched = []
+
+    def fetch(symbols, period, copy=True):
+        analyzer.fetched.append(list(symbols))
+        return {'data': {symbol: frames[symbol] for symbol in symbols}, 'errors': {}}
+
+    monkeypatch.setattr(analyzer, 'get_stock_data_many', fetch)
+    return analyzer
+
+
+@pytest.mark.parametrize('criteria', [
+    'rsi > 50',
+    [{'field': 'rsi', 'operator': '>'}],
+    [{'field': 'rsi', 'operator': '~', 'value': 50}],
+    [{'field': 'rsi', 'operator': '>', 'value': 'high'}],
+    [{'field': 'no_such_field', 'operator': '>', 'value': 1}],
+])
+def test_invalid_criteria_are_rejected_before_fetching(analyzer, criteria):
+    with pytest.raises(ValueError):
+        analyzer.screen_stocks(['UP', 'DOWN'], criteria)
+    assert analyzer.fetched == []
+
+
+def test_value_fields_match_screening_values(analyzer):
+    frame = make_ohlcv(300)
+    panel = {column: frame[column].to_numpy()[None, :] for column in frame.columns}
+    assert set(analyzer._screening_values(panel)) == set(StockAnalyzer.SCREEN_VALUE_FIELDS)
+
+
+def test_screen_filters_on_values(analyzer):
+    up = make_ohlcv(300, seed=1)['Close'].iloc[-1]
+    results = analyzer.screen_stocks(['UP', 'DOWN'], [{'field': 'price', 'operator': '=', 'value': up}])
+    assert [result['symbol'] for result in results] == ['UP']
+    assert analyzer.fetched == [['UP', 'DOWN']]
@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+from services.singleflight import SingleFlight
+
+
+def run_concurrently(flight, key, fn, callers):
+    """Start ``callers`` threads on ``key`` while ``fn`` blocks, returning their results or errors"""
+    outcomes = []
+
+    def call():
+        try:
+            outcomes.append(flight.do(key, fn))
+        except Exception as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def wait_for_followers(flight, key, count):
+    # 跟随方都已在等待首个调用完成
+    while len(flight._calls[key].done._cond._waiters) < count:
+        time.sleep(0.001)
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {'bars': 3}
+
+    threads, outcomes = run_concurrently(flight, 'AAPL', fetch, 1)
+    started.wait(5)
+    followers, follower_outcomes = run_concurrently(flight, 'AAPL', fetch, 4)
+    wait_for_followers(flight, 'AAPL', 4)
+    release.set()
+    for thread in threads + followers:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert outcomes + follower_outcomes == [{'bars': 3}] * 5
+    assert all(result is outcomes[0] for result in follower_outcomes)
+
+
+def test_errors_reach_every_waiting_caller():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise RuntimeError('upstream down')
+
+    threads, outcomes = run_concurrently(flight, 'AAPL', fail, 1)
+    started.wait(5)
+    followers, follower_outcomes = run_concurrently(flight, 'AAPL', fail, 2)
+    wait_for_followers(flight, 'AAPL', 2)
+    release.set()
+    for thread in threads + followers:
+        thread.join(5)
+    assert [str(error) for error in outcomes + follower_outcomes] == ['upstream down'] * 3
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do('AAPL', lambda: 1) == 1
+    assert flight.do('MSFT', lambda: 2) == 2
+
+
+def test_nothing_is_cached_after_completion():
+    flight = SingleFlight()
+    calls = []
+    for _ in range(3):
+        flight.do('AAPL', lambda: calls.append(1))
+    assert len(calls) == 3
+    with pytest.raises(ZeroDivisionError):
+        flight.do('AAPL', lambda: 1 / 0)
+    assert flight._calls == {}
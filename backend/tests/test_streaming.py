@@ -0,0 +1,158 @@
+"""Streaming indicators against the vectorized ones on the same bars"""
+import json
+
+import numpy as np
+import pytest
+
+from conftest import make_ohlcv, timestamps_of
+from services import indicators
+from services.streaming import (
+    EMA, MACD, MFI, OBV, RSI, IndicatorSet, RollingMean, RunningExtreme, indicator_from_dict
+)
+
+
+@pytest.fixture
+def bars():
+    frame = make_ohlcv(400, seed=5)
+    return {column.lower(): frame[column].to_numpy() for column in frame.columns}
+
+
+def stream(indicator, *inputs):
+    return np.array([
+        np.nan if value is None else value
+        for value in (indicator.update(*bar) for bar in zip(*inputs))
+    ], dtype=np.float64)
+
+
+def assert_same(actual, expected):
+    np.testing.assert_allclose(actual, expected, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+def test_ema(bars):
+    assert_same(stream(EMA(12), bars['close']), indicators.ema(bars['close'], 12))
+
+
+def test_rolling_mean(bars):
+    assert_same(stream(RollingMean(20), bars['close']), indicators.sma(bars['close'], 20))
+
+
+def test_macd(bars):
+    macd = MACD()
+    line = stream(macd, bars['close'])
+    expected, signal, _ = indicators.macd(bars['close'])
+    assert_same(line, expected)
+    assert macd.signal.current == pytest.approx(signal[-1])
+
+
+@pytest.mark.parametrize('method', ['sma', 'wilder'])
+def test_rsi(bars, method):
+    assert_same(stream(RSI(14, method), bars['close']), indicators.rsi(bars['close'], 14, method))
+
+
+def test_obv(bars):
+    assert_same(stream(OBV(), bars['close'], bars['volume']), indicators.obv(bars['close'], bars['volume']))
+
+
+def test_mfi(bars):
+    actual = stream(MFI(14), bars['high'], bars['low'], bars['close'], bars['volume'])
+    assert_same(actual, indicators.mfi(bars['high'], bars['low'], bars['close'], bars['volume'], 14))
+
+
+def test_obv_state_round_trip(bars):
+    obv = OBV()
+    stream(obv, bars['close'][:200], bars['volume'][:200])
+    restored = indicator_from_dict(json.loads(json.dumps(obv.to_dict())))
+    assert vars(restored) == vars(obv)
+    bar = (bars['close'][200], bars['volume'][200])
+    assert restored.update(*bar) == obv.update(*bar)
+
+
+@pytest.mark.parametrize('mode, window', [('max', 20), ('min', 20), ('max', 1), ('min', 252)])
+def test_running_extreme(bars, mode, window):
+    source = 'high' if mode == 'max' else 'low'
+    expected = (indicators.rolling_max if mode == 'max' else indicators.rolling_min)(bars[source], window)
+    assert_same(stream(RunningExtreme(window, mode, source), bars[source]), expected)
+
+
+def test_revise_matches_recomputing(bars):
+    # 每根K线先以错误的收盘价写入，再修正
+    ema, rsi = EMA(12), RSI(14)
+    for close in bars['close']:
+        ema.update(close * 1.1)
+        rsi.update(close * 0.9)
+        ema.revise(close)
+        rsi.revise(close)
+    assert ema.value == pytest.approx(indicators.ema(bars['close'], 12)[-1])
+    assert rsi.value == pytest.approx(indicators.rsi(bars['close'], 14)[-1])
+
+
+def batch_values(frame):
+    high, low, close, volume = (frame[column].to_numpy() for column in ('High', 'Low', 'Close', 'Volume'))
+    macd, signal, _ = indicators.macd(close)
+    return {
+        'sma_20': indicators.sma(close, 20)[-1],
+        'sma_50': indicators.sma(close, 50)[-1],
+        'ema_12': indicators.ema(close, 12)[-1],
+        'macd': macd[-1],
+        'macd_signal': signal[-1],
+        'rsi': indicators.rsi(close, 14)[-1],
+        'obv': indicators.obv(close, volume)[-1],
+        'mfi': indicators.mfi(high, low, close, volume, 14)[-1],
+        'high_52w': high[-252:].max(),
+        'low_52w': low[-252:].min(),
+        'donchian_high': indicators.rolling_max(high, 20)[-1],
+        'donchian_low': indicators.rolling_min(low, 20)[-1],
+        'breakout_20': bool(indicators.breakout(close, high, 20)[-1])
+    }
+
+
+def push(indicator_set, frame):
+    return indicator_set.push_many(
+        timestamps_of(frame), *(frame[column].to_numpy() for column in ('High', 'Low', 'Close', 'Volume'))
+    )
+
+
+def assert_values(indicator_set, frame):
+    values = indicator_set.values()
+    for name, expected in batch_values(frame).items():
+        assert values[name] == pytest.approx(expected, rel=1e-9), name
+
+
+def test_indicator_set_matches_batch():
+    frame = make_ohlcv(600, seed=6)
+    indicator_set = IndicatorSet()
+    assert push(indicator_set, frame) == len(frame)
+    assert_values(indicator_set, frame)
+
+
+def test_indicator_set_resumes_from_saved_state():
+    frame = make_ohlcv(600, seed=7)
+    indicator_set = IndicatorSet()
+    push(indicator_set, frame.iloc[:450])
+
+    restored = IndicatorSet.from_dict(json.loads(json.dumps(indicator_set.to_dict())))
+    # 重叠部分只有最后一根K线会重新处理（相同则跳过）
+    assert push(restored, frame) == len(frame) - 450
+    assert_values(restored, frame)
+
+
+def test_indicator_set_revises_forming_bar():
+    frame = make_ohlcv(300, seed=8)
+    indicator_set = IndicatorSet()
+    forming = frame.copy()
+    forming.iloc[-1, forming.columns.get_loc('Close')] *= 0.97
+    forming.iloc[-1, forming.columns.get_loc('Volume')] /= 2
+    push(indicator_set, forming)
+
+    push(indicator_set, frame)
+    assert indicator_set.bars == len(frame)
+    assert_values(indicator_set, frame)
+
+
+def test_indicator_set_ignores_older_bars():
+    frame = make_ohlcv(100, seed=9)
+    indicator_set = IndicatorSet()
+    push(indicator_set, frame)
+    ts = int(timestamps_of(frame)[-2])
+    assert not indicator_set.push(ts, 1.0, 1.0, 1.0, 1.0)
+    assert_values(indicator_set, frame)
@@ -0,0 +1,71 @@
+import pytest
+
+from conftest import timestamps_of
+from services import backtest
+
+SWEEPS = [
+    ('sma_cross', {'fast': [5, 10, 20], 'slow': {'start': 30, 'stop': 60, 'step': 15}}),
+    ('ema_cross', {'fast': [5, 12], 'slow': [26, 40]}),
+    ('macd', {'fast': [8, 12], 'slow': [26], 'signal': [5, 9]}),
+    ('rsi', {'period': [7, 14], 'lower': [25.0, 30.0], 'upper': [70.0]}),
+    ('breakout', {'window': [10, 20], 'exit': [5, 10]})
+]
+
+
+@pytest.mark.parametrize('name, grid', SWEEPS)
+def test_sweep_matches_individual_runs(ohlcv, name, grid):
+    timestamps = timestamps_of(ohlcv)
+    result = backtest.sweep(ohlcv, timestamps, name, grid, cost_bps=5, top=1000)
+    assert len(result['results']) == result['combinations']
+
+    params = list(backtest.STRATEGIES[name].defaults)
+    for row in result['results']:
+        spec = {'type': name, **{key: row[key] for key in params}}
+        metrics = backtest.run(ohlcv, timestamps, spec, cost_bps=5)['metrics']
+        for key in ('total_return', 'sharpe_ratio', 'max_drawdown', 'exposure', 'win_rate'):
+            if metrics[key] is None:
+                assert row[key] is None, (spec, key)
+            else:
+                assert row[key] == pytest.approx(metrics[key], abs=1e-4), (spec, key)
+        assert row['trades'] == metrics['trades'], spec
+
+
+def test_sweep_chunks_do_not_change_results(ohlcv, monkeypatch):
+    grid = {'fast': [5, 10, 20], 'slow': [30, 40, 50]}
+    whole = backtest.sweep(ohlcv, timestamps_of(ohlcv), 'sma_cross', grid)
+    # 每块只容纳两组参数
+    monkeypatch.setenv('BACKTEST_SWEEP_CELLS', str(2 * len(ohlcv)))
+    assert backtest.sweep(ohlcv, timestamps_of(ohlcv), 'sma_cross', grid) == whole
+
+
+def test_sweep_ranks_by_metric(ohlcv):
+    result = backtest.sweep(ohlcv, timestamps_of(ohlcv), 'sma_cross', {'fast': [5, 10], 'slow': [30, 50]},
+                            metric='total_return')
+    values = [row['total_return'] for row in result['results']]
+    assert values == sorted(values, reverse=True)
+    assert result['heatmap']['x']['param'] == 'fast'
+    assert result['heatmap']['y']['param'] == 'slow'
+
+
+def test_sweep_rejects_oversized_grid(ohlcv, monkeypatch):
+    monkeypatch.setenv('BACKTEST_SWEEP_MAX', '100')
+    with pytest.raises(ValueError):
+        backtest.sweep(ohlcv, timestamps_of(ohlcv), 'sma_cross', {'fast': {'start': 1, 'stop': 1e9}})
+    with pytest.raises(ValueError):
+        backtest.sweep(ohlcv, timestamps_of(ohlcv), 'sma_cross',
+                       {'fast': {'start': 1, 'stop': 20}, 'slow': {'start': 30, 'stop': 40}})
+
+
+@pytest.mark.parametrize('top', [0, -5])
+def test_sweep_rejects_invalid_top(ohlcv, top):
+    with pytest.raises(ValueError):
+        backtest.sweep(ohlcv, timestamps_of(ohlcv), 'sma_cross', {'fast': [5, 10]}, top=top)
+
+
+def test_expand_range():
+    assert backtest.expand_range({'start': 5, 'stop': 20, 'step': 5}, int) == [5, 10, 15, 20]
+    assert backtest.expand_range({'start': 0.1, 'stop': 0.3, 'step': 0.1}, float) == pytest.approx([0.1, 0.2, 0.3])
+    assert backtest.expand_range(7, int) == [7]
+    assert backtest.expand_range([3, 1, 3], int) == [1, 3]
+    with pytest.raises(ValueError):
+        backtest.expand_range({'start': 1, 'stop': 10, 'step': 0}, int)
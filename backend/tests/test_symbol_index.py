@@ -0,0 +1,87 @@
+import pytest
+
+from services import symbol_index as symbol_index_module
+from services.symbol_index import SymbolIndex, search_symbols
+
+LISTING = {
+    'A': {'name': 'Agilent Technologies Inc.', 'exchange': 'NYSE'},
+    'AA': {'name': 'Alcoa Corporation', 'exchange': 'NYSE'},
+    'AAPL': {'name': 'Apple Inc.', 'exchange': 'NASDAQ'},
+    'APLE': {'name': 'Apple Hospitality REIT Inc.', 'exchange': 'NYSE'},
+    'MSFT': {'name': 'Microsoft Corporation', 'exchange': 'NASDAQ'},
+    'GOOGL': {'name': 'Alphabet Inc. Class A', 'exchange': 'NASDAQ'},
+}
+
+
+@pytest.fixture
+def index():
+    index = SymbolIndex()
+    index.add_listing(LISTING)
+    return index
+
+
+def symbols(results):
+    return [result['symbol'] for result in results]
+
+
+def test_exact_symbol_ranks_first(index):
+    assert symbols(index.search('a'))[:3] == ['A', 'AA', 'AAPL']
+    assert symbols(index.search('aapl'))[0] == 'AAPL'
+
+
+def test_symbol_prefix_before_name_matches(index):
+    # APLE是代码前缀匹配，AAPL只是名称模糊匹配
+    assert symbols(index.search('APL')) == ['APLE', 'AAPL']
+    # 名称单词前缀匹配时，单词少的名称排在前面
+    assert symbols(index.search('appl')) == ['AAPL', 'APLE']
+
+
+def test_name_words(index):
+    assert symbols(index.search('micro')) == ['MSFT']
+    assert symbols(index.search('apple hosp'))[0] == 'APLE'
+    assert symbols(index.search('alphabet class')) == ['GOOGL']
+
+
+def test_fuzzy_name_match(index):
+    assert symbols(index.search('microsft'))[0] == 'MSFT'
+    assert symbols(index.search('alcao corp'))[0] == 'AA'
+    assert index.search('zzzz') == []
+
+
+def test_limit_and_results(index):
+    assert len(index.search('a', limit=2)) == 2
+    assert index.search('msft')[0] == {'symbol': 'MSFT', 'name': 'Microsoft Corporation', 'exchange': 'NASDAQ'}
+    assert index.search('  ') == []
+
+
+def test_first_listing_wins(index):
+    index.add('msft', 'Renamed', 'OTC')
+    assert index.get('MSFT')['name'] == 'Microsoft Corporation'
+    assert 'msft' in index and len(index) == len(LISTING)
+
+
+def test_load_delimited_listing(tmp_path):
+    listing = tmp_path / 'nasdaqlisted.txt'
+    listing.write_text(
+        'Symbol|Security Name|Market Category\n'
+        'NVDA|NVIDIA Corporation - Common Stock|Q\n'
+        'File Creation Time: 0101202400:00|||\n'
+    )
+    index = SymbolIndex()
+    index.load_file(listing)
+    assert len(index) == 1
+    assert symbols(index.search('nvidia')) == ['NVDA']
+
+
+def test_remote_fallback_only_when_nothing_matches(index, monkeypatch):
+    class FakeSearch:
+        def search(self, query):
+            return {'quotes': [
+                {'symbol': 'BTC-USD', 'shortname': 'Bitcoin USD', 'exchange': 'CCC', 'quoteType': 'CRYPTOCURRENCY'},
+                {'symbol': '^DJI', 'shortname': 'Dow Jones', 'exchange': 'DJI', 'quoteType': 'INDEX'}
+            ]}
+
+    monkeypatch.setattr(symbol_index_module, 'symbol_index', index)
+    monkeypatch.setattr(symbol_index_module, 'market_data', FakeSearch())
+    assert symbols(search_symbols('bitcoin')) == ['BTC-USD']
+    assert symbols(search_symbols('msft')) == ['MSFT']
@@ -0,0 +1,59 @@
+"""The one-pass signal timeline against evaluating the report signals date by date"""
+import numpy as np
+import pytest
+
+from conftest import make_ohlcv, timestamps_of
+from services import signals, timeline
+
+NAMES = ('volume_alert', 'technical_signals', 'volatility_alert', 'money_flow')
+
+
+@pytest.fixture(scope='module')
+def history():
+    # 较大的波动使各类信号都会出现
+    frame = make_ohlcv(700, seed=3)
+    frame['Volume'] *= np.random.default_rng(4).choice([0.3, 1.0, 1.0, 3.0], len(frame))
+    frame.attrs.update(symbol='TEST', interval='1d', version=1)
+    return frame
+
+
+@pytest.fixture(scope='module')
+def rows(history):
+    return timeline.signal_timeline(history, timestamps_of(history))
+
+
+def test_matches_per_date_evaluation(history, rows):
+    for end in range(2, len(history)):
+        expected = signals.evaluate(history.iloc[:end + 1])
+        for name in NAMES:
+            assert rows[name][end] == expected[name], (end, name)
+
+
+def test_matches_tail_evaluation_without_cache(history, rows):
+    # 没有symbol属性的数据只计算所需尾部
+    for end in range(300, len(history), 7):
+        data = {column: history[column].to_numpy()[:end + 1] for column in history.columns}
+        expected = signals.evaluate(data)
+        for name in NAMES:
+            assert rows[name][end] == expected[name], (end, name)
+
+
+def test_signals_are_varied(rows):
+    for name in ('volume_alert', 'volatility_alert', 'money_flow'):
+        assert len(set(rows[name][300:])) > 1, name
+    assert any(rows['technical_signals'][300:])
+
+
+def test_next_day_outcome(history, rows):
+    close = history['Close'].to_numpy()
+    np.testing.assert_array_equal(rows['next_price'][:-1], close[1:])
+    assert np.isnan(rows['next_price'][-1])
+    change = (close - history['Open'].to_numpy()) / history['Open'].to_numpy() * 100
+    np.testing.assert_allclose(rows['next_change'][:-1], change[1:])
+
+
+def test_summary_counts(rows):
+    summary = timeline.summarize(rows)
+    known = ~np.isnan(rows['next_change'])
+    for name in ('volume_alert', 'volatility_alert', 'money_flow'):
+        assert sum(group['count'] for group in summary[name].values()) == known.sum()